@@ -0,0 +1 @@
+"""Performance benchmarks for CLI AI Chat."""
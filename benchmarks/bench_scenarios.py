@@ -0,0 +1,314 @@
+"""Benchmark services and the chat interface end to end against a mock provider.
+
+Usage:
+    python -m benchmarks.bench_scenarios [SCENARIO ...] [--tolerance 0.5] [--update-baseline]
+
+Each scenario starts ``benchmarks.mock_server`` in a subprocess, so that its
+CPU time and memory aren't counted, and points the OpenAI, Anthropic and
+Gemini SDKs at it. Requests go through the same service stack the CLI uses,
+from ``get_service_for_model``; the chat scenarios drive ``ChatInterface.run``
+with scripted input and render to an off-screen terminal, including history
+writes. No API key or network access is needed.
+
+For every scenario the benchmark reports the median and p95 end-to-end
+latency, the median time to first token, the CPU time of this process per
+request and the peak traced Python memory. Modules are imported and service
+clients created before measuring, as they would be by the time a chat sends
+its first request. Memory is measured in a second pass, because tracing
+allocations slows everything else down. The benchmark exits with a non-zero
+status if CPU time or memory grew by more than the tolerance against the
+stored baseline; latency mostly reflects the mock's simulated timing.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from benchmarks.mock_server import MockSettings
+from cliai.config import get_model_by_id
+from cliai.services import AIService, Message, Role, get_service_for_model
+from cliai.services.metrics import InstrumentedService, RequestMetrics
+from cliai.services.transport import aclose_http_clients
+
+DEFAULT_BASELINE = Path(__file__).with_name("scenarios_baseline.json")
+
+
+@dataclass
+class Scenario:
+    """A workload to run against the mock server."""
+
+    model_id: str
+    settings: MockSettings = field(default_factory=MockSettings)
+    # Requests, or chat turns
+    requests: int = 20
+    concurrency: int = 1
+    stream: bool = True
+    # Earlier turns sent with every request, about 2 kB each
+    history: int = 0
+    # Drive the chat interface instead of calling the service directly
+    chat: bool = False
+    # Print finished blocks of chat replies instead of redrawing them in a box
+    scroll: bool = False
+
+
+FAST = MockSettings(ttft=0.05, tokens_per_second=2000, tokens=300)
+
+SCENARIOS: dict[str, Scenario] = {
+    "openai-stream": Scenario("gpt-4o-2024-08-06", FAST),
+    "anthropic-stream": Scenario("claude-3-7-sonnet-20250219", FAST),
+    "gemini-stream": Scenario("gemini-pro", FAST),
+    "openai-complete": Scenario("gpt-4o-2024-08-06", FAST, stream=False),
+    "openai-concurrent": Scenario("gpt-4o-2024-08-06", FAST, requests=64, concurrency=8),
+    "anthropic-long-context": Scenario("claude-3-7-sonnet-20250219", FAST, history=200),
+    "openai-errors": Scenario(
+        "gpt-4o-2024-08-06", MockSettings(ttft=0.05, tokens_per_second=2000, error_rate=0.2)
+    ),
+    "chat-openai": Scenario(
+        "gpt-4o-2024-08-06",
+        MockSettings(ttft=0.05, tokens_per_second=2000, tokens=2000),
+        requests=5,
+        chat=True,
+    ),
+    "chat-anthropic-long-context": Scenario(
+        "claude-3-7-sonnet-20250219",
+        MockSettings(ttft=0.05, tokens_per_second=2000, tokens=2000),
+        requests=5,
+        history=200,
+        chat=True,
+    ),
+    "chat-openai-long-reply": Scenario(
+        "gpt-4o-2024-08-06",
+        MockSettings(ttft=0.05, tokens_per_second=10000, tokens=20000),
+        requests=2,
+        chat=True,
+    ),
+    "chat-openai-long-reply-scroll": Scenario(
+        "gpt-4o-2024-08-06",
+        MockSettings(ttft=0.05, tokens_per_second=10000, tokens=20000),
+        requests=2,
+        chat=True,
+        scroll=True,
+    ),
+}
+
+
+@dataclass
+class Result:
+    """Measurements of one scenario."""
+
+    # Seconds per request until the reply was complete, and until its first chunk
+    latencies: list[float] = field(default_factory=list)
+    first_tokens: list[float] = field(default_factory=list)
+    cpu_per_request: float = 0.0
+    peak_memory: int = 0
+
+    def record(self, metrics: RequestMetrics) -> None:
+        """Add the metrics of a finished request; used as a metrics sink."""
+        self.latencies.append(metrics.duration)
+        if metrics.time_to_first_token is not None:
+            self.first_tokens.append(metrics.time_to_first_token)
+
+
+def start_mock(settings: MockSettings) -> tuple["subprocess.Popen[str]", dict[str, str]]:
+    """Start the mock server in a subprocess and get the environment pointing at it."""
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.mock_server",
+            "--port=0",
+            "--grpc-port=0",
+            f"--ttft-ms={settings.ttft * 1000}",
+            f"--tokens-per-second={settings.tokens_per_second}",
+            f"--tokens={settings.tokens}",
+            f"--error-rate={settings.error_rate}",
+            f"--error-status={settings.error_status}",
+            f"--seed={settings.seed}",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    assert process.stdout is not None
+    return process, json.loads(process.stdout.readline())
+
+
+def conversation(turns: int) -> list[Message]:
+    """Build a conversation of a system prompt and ``turns`` earlier turns."""
+    messages = [Message(role=Role.SYSTEM, content="You are a helpful assistant.")]
+    for index in range(turns):
+        messages.append(Message(role=Role.USER, content=f"Question {index}: " + "why? " * 100))
+        messages.append(
+            Message(role=Role.ASSISTANT, content=f"Answer {index}: " + "because. " * 200)
+        )
+    return messages
+
+
+async def run_requests(scenario: Scenario, services: list[AIService]) -> None:
+    """Send the scenario's requests through the service stack."""
+    messages = conversation(scenario.history)
+    messages.append(Message(role=Role.USER, content="Explain the benchmark."))
+
+    async def worker(service: AIService, requests: int) -> None:
+        for _ in range(requests):
+            response = await service.generate_response(messages, stream=scenario.stream)
+            if not isinstance(response, str):
+                async for _ in response:
+                    pass
+
+    # One service per concurrent request, like the batch command's workers
+    counts = [
+        len(range(index, scenario.requests, scenario.concurrency))
+        for index in range(scenario.concurrency)
+    ]
+    await asyncio.gather(*(worker(service, count) for service, count in zip(services, counts)))
+
+
+async def run_chat(scenario: Scenario, service: AIService) -> None:
+    """Chat through the chat interface with scripted input on an off-screen terminal."""
+    from rich.console import Console
+
+    from cliai.ui import ChatInterface
+
+    chat = ChatInterface(
+        service.model_config,
+        service,
+        new_conversation=True,
+        prefetch=False,
+        scroll=scenario.scroll,
+    )
+    chat.console = Console(file=io.StringIO(), width=100, height=40, force_terminal=True)
+    chat.messages = conversation(scenario.history)
+
+    prompts = "".join(f"Explain part {index}.\n" for index in range(scenario.requests))
+    stdin, sys.stdin = sys.stdin, io.StringIO(prompts)
+    try:
+        async for _ in chat.run():
+            pass
+    except EOFError:
+        # The scripted input ran out
+        pass
+    finally:
+        sys.stdin = stdin
+
+
+async def run_scenario(scenario: Scenario, trace_memory: bool) -> Result:
+    """Run a scenario once, measuring CPU time or, with ``trace_memory``, peak memory."""
+    import cliai.ui  # noqa: F401
+
+    model_config = get_model_by_id(scenario.model_id)
+    assert model_config is not None
+    result = Result()
+    services = []
+    for _ in range(scenario.concurrency):
+        service = get_service_for_model(model_config)
+        assert isinstance(service, InstrumentedService)
+        service.sinks.append(result.record)
+        services.append(service)
+
+    if trace_memory:
+        tracemalloc.start()
+    cpu_start = time.process_time()
+    try:
+        if scenario.chat:
+            await run_chat(scenario, services[0])
+        else:
+            await run_requests(scenario, services)
+            for service in services:
+                await service.close()
+    finally:
+        result.cpu_per_request = (time.process_time() - cpu_start) / scenario.requests
+        if trace_memory:
+            result.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        await aclose_http_clients()
+    return result
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))] if ordered else 0.0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run: {', '.join(SCENARIOS)}")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.5, help="Allowed growth against the baseline"
+    )
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="Store the measurements as baseline"
+    )
+    args = parser.parse_args()
+    names = args.scenarios or list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    baseline: dict[str, dict[str, float]] = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+
+    # Keep history, caches and the daemon socket of this run out of the user's cache
+    cache_dir = tempfile.TemporaryDirectory()
+    os.environ["XDG_CACHE_HOME"] = cache_dir.name
+    os.environ["CLIAI_DAEMON_SOCKET"] = str(Path(cache_dir.name) / "daemon.sock")
+    for name in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "GOOGLE_API_KEY"):
+        os.environ[name] = "mock"
+
+    print(
+        f"{'scenario':<28} {'p50 ms':>8} {'p95 ms':>8} {'ttft ms':>8} "
+        f"{'cpu ms/req':>10} {'peak KiB':>9}"
+    )
+    results: dict[str, dict[str, float]] = {}
+    failed = False
+    for name in names:
+        scenario = SCENARIOS[name]
+        process, environment = start_mock(scenario.settings)
+        os.environ.update(environment)
+        try:
+            timed = asyncio.run(run_scenario(scenario, trace_memory=False))
+            traced = asyncio.run(run_scenario(scenario, trace_memory=True))
+        finally:
+            process.terminate()
+            process.wait()
+
+        measured = {"cpu_per_request": timed.cpu_per_request, "peak_memory": traced.peak_memory}
+        results[name] = measured
+        regressions = [
+            metric
+            for metric, value in measured.items()
+            if metric in baseline.get(name, {})
+            and value > baseline[name][metric] * (1 + args.tolerance)
+        ]
+        failed = failed or bool(regressions)
+
+        ttft = f"{statistics.median(timed.first_tokens) * 1000:.1f}" if timed.first_tokens else "-"
+        status = f"  REGRESSION ({', '.join(regressions)})" if regressions else ""
+        print(
+            f"{name:<28} {_percentile(timed.latencies, 50) * 1000:>8.1f} "
+            f"{_percentile(timed.latencies, 95) * 1000:>8.1f} {ttft:>8} "
+            f"{timed.cpu_per_request * 1000:>10.2f} {traced.peak_memory / 1024:>9.0f}{status}"
+        )
+
+    cache_dir.cleanup()
+    if args.update_baseline or not baseline:
+        args.baseline.write_text(json.dumps({**baseline, **results}, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
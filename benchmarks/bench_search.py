@@ -0,0 +1,113 @@
+"""Benchmark history search latency over a large synthetic history.
+
+Usage:
+    python -m benchmarks.bench_search [--messages 50000] [--like]
+
+A temporary history database is filled with conversations of synthetic
+messages whose word frequencies follow Zipf's law, like natural text. They
+are written through ``ConversationStore`` so that the full-text index is
+maintained by its triggers as in normal use. Each query is then timed
+through ``ConversationStore.search``; ``--like`` also times the LIKE fallback
+used when SQLite has no FTS5.
+"""
+
+import argparse
+import itertools
+import random
+import statistics
+import string
+import tempfile
+import time
+from pathlib import Path
+
+from cliai.config import AVAILABLE_MODELS
+from cliai.history import ConversationStore
+from cliai.services import Message, Role
+
+VOCABULARY_SIZE = 20000
+MESSAGES_PER_CONVERSATION = 20
+
+
+def vocabulary(rng: random.Random) -> list[str]:
+    """Build distinct made-up words, most frequent first."""
+    words: dict[str, None] = {}
+    while len(words) < VOCABULARY_SIZE:
+        words["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))] = None
+    return list(words)
+
+
+def queries(words: list[str]) -> list[str]:
+    """Pick queries from very common to rare words, and a word that never occurs."""
+    return [
+        words[0],
+        words[50],
+        f"{words[20]} {words[300]}",
+        words[2000],
+        f"{words[500]} {words[5000]}",
+        "zzzzzzzzzzzz",
+    ]
+
+
+def fill(store: ConversationStore, count: int, seed: int = 0) -> tuple[float, list[str]]:
+    """Write ``count`` messages.
+
+    Returns:
+        The seconds it took and the queries to time
+    """
+    rng = random.Random(seed)
+    words = vocabulary(rng)
+    cumulative = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    start = time.perf_counter()
+    for offset in range(0, count, MESSAGES_PER_CONVERSATION):
+        conversation = store.create_conversation(rng.choice(AVAILABLE_MODELS))
+        messages = [
+            Message(
+                role=Role.USER if index % 2 == 0 else Role.ASSISTANT,
+                content=" ".join(
+                    rng.choices(words, cum_weights=cumulative, k=rng.randint(20, 200))
+                ),
+            )
+            for index in range(min(MESSAGES_PER_CONVERSATION, count - offset))
+        ]
+        store.append_messages(conversation.id, messages)
+    return time.perf_counter() - start, queries(words)
+
+
+def time_queries(store: ConversationStore, queries: list[str], repeat: int = 5) -> dict[str, float]:
+    """Return the median milliseconds per search for each query."""
+    timings = {}
+    for query in queries:
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            store.search(query)
+            samples.append((time.perf_counter() - start) * 1000)
+        timings[query] = statistics.median(samples)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=50000, help="Number of stored messages")
+    parser.add_argument("--like", action="store_true", help="Also time the LIKE fallback")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ConversationStore(Path(directory) / "history.sqlite3")
+        try:
+            seconds, queries = fill(store, args.messages)
+            print(f"wrote {args.messages} messages in {seconds:.1f} s")
+
+            modes = [("fts5" if store.full_text_search else "like", store.full_text_search)]
+            if args.like and store.full_text_search:
+                modes.append(("like", False))
+            for name, full_text_search in modes:
+                store.full_text_search = full_text_search
+                for query, milliseconds in time_queries(store, queries).items():
+                    print(f"{name:5} {query!r:30} {milliseconds:8.2f} ms")
+        finally:
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark cold-start time of cliai commands.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 5] [--tolerance 0.25] [--update-baseline]
+
+Each command is started in a fresh interpreter with ``python -X importtime``.
+The median wall time is compared with a stored baseline and the benchmark
+exits with a non-zero status if any command got slower than the tolerance
+allows, or if a command imports a provider SDK it doesn't need.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+DEFAULT_BASELINE = Path(__file__).with_name("startup_baseline.json")
+
+# Command name -> (interpreter arguments, provider SDKs the command must not import)
+COMMANDS: dict[str, tuple[list[str], list[str]]] = {
+    "help": (["-m", "cliai", "--help"], ["openai", "anthropic", "google.generativeai"]),
+    "models": (["-m", "cliai", "models"], ["openai", "anthropic", "google.generativeai"]),
+    # What `cliai ask` loads before its request: no Rich and no provider SDK
+    "ask": (
+        ["-c", "import cliai.main"],
+        ["rich", "openai", "anthropic", "google.generativeai"],
+    ),
+    # A chat with an OpenAI model: the CLI plus only the OpenAI service
+    "chat-openai": (
+        ["-c", "import cliai.main, cliai.ui, cliai.services.openai_service"],
+        ["anthropic", "google.generativeai"],
+    ),
+}
+
+
+def measure(args: list[str]) -> tuple[float, dict[str, int]]:
+    """Run the interpreter once and return wall time and cumulative import times."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    elapsed = time.perf_counter() - start
+
+    imports: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            imports[name.strip()] = int(cumulative)
+    return elapsed, imports
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline"
+    )
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="Store the measured times as baseline"
+    )
+    args = parser.parse_args()
+
+    baseline: dict[str, float] = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+
+    results: dict[str, float] = {}
+    failed = False
+
+    for name, (command, forbidden) in COMMANDS.items():
+        times = []
+        imports: dict[str, int] = {}
+        for _ in range(args.runs):
+            elapsed, imports = measure(command)
+            times.append(elapsed)
+        median = statistics.median(times)
+        results[name] = median
+
+        status = ""
+        if name in baseline and median > baseline[name] * (1 + args.tolerance):
+            status = f"  REGRESSION (baseline {baseline[name] * 1000:.0f} ms)"
+            failed = True
+        print(f"{name:12} {median * 1000:8.0f} ms{status}")
+
+        slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)[:5]
+        for module, micros in slowest:
+            print(f"    {module:40} {micros / 1000:8.1f} ms")
+
+        for module in forbidden:
+            if module in imports:
+                print(f"    unexpected import: {module}")
+                failed = True
+
+    if args.update_baseline or not baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Benchmark CPU time per rendered token for streamed Markdown responses.
+
+Usage:
+    python -m benchmarks.bench_streaming [--tokens 20000] [--naive]
+
+A synthetic Markdown reply is streamed token by token into the renderer and
+drawn to an off-screen console at the live display's refresh cadence. As in
+the chat interface, the view is bounded to one screen while streaming and the
+full reply is drawn once at the end.
+"""
+
+import argparse
+import io
+import random
+import time
+
+from rich.console import Console
+from rich.markdown import Markdown
+from rich.panel import Panel
+
+from cliai.ui.streaming import ChunkCoalescer, StreamingMarkdown, REFRESH_PER_SECOND
+
+SCREEN_LINES = 40
+WORDS = "the model streams tokens into a panel while the terminal redraws each frame".split()
+
+
+def synthetic_tokens(count: int, seed: int = 0) -> list[str]:
+    """Build a Markdown reply of roughly ``count`` tokens, one string per token."""
+    rng = random.Random(seed)
+    tokens: list[str] = []
+    while len(tokens) < count:
+        kind = rng.random()
+        if kind < 0.15:
+            tokens.append("## Section\n\n")
+        elif kind < 0.35:
+            tokens.append("```python\n")
+            for _ in range(rng.randint(3, 15)):
+                tokens.extend(["    value", " =", " compute", "(x)", "\n"])
+            tokens.append("```\n\n")
+        elif kind < 0.5:
+            for _ in range(rng.randint(2, 6)):
+                tokens.append("- ")
+                tokens.extend(" " + rng.choice(WORDS) for _ in range(rng.randint(3, 10)))
+                tokens.append("\n")
+            tokens.append("\n")
+        else:
+            tokens.extend(" " + rng.choice(WORDS) for _ in range(rng.randint(20, 80)))
+            tokens.append("\n\n")
+    return tokens[:count]
+
+
+def run(tokens: list[str], naive: bool, tokens_per_second: int) -> float:
+    """Stream ``tokens`` and return CPU seconds spent per token."""
+    console = Console(file=io.StringIO(), width=100, force_terminal=True)
+    tokens_per_refresh = max(1, tokens_per_second // REFRESH_PER_SECOND)
+    start = time.process_time()
+
+    if naive:
+        content = ""
+        panel = Panel(Markdown(""))
+        for index, token in enumerate(tokens, 1):
+            content += token
+            panel = Panel(Markdown(content))
+            if index % tokens_per_refresh == 0:
+                console.print(panel)
+        console.print(panel)
+    else:
+        renderer = StreamingMarkdown(max_lines=SCREEN_LINES)
+        panel = Panel(renderer)
+        for index, token in enumerate(tokens, 1):
+            renderer.append(token)
+            if index % tokens_per_refresh == 0:
+                console.print(panel)
+        renderer.max_lines = None
+        console.print(panel)
+
+    return (time.process_time() - start) / len(tokens)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=20000, help="Number of streamed tokens")
+    parser.add_argument(
+        "--rate", type=int, default=100, help="Simulated stream rate in tokens per second"
+    )
+    parser.add_argument(
+        "--naive", action="store_true", help="Also measure re-parsing the full reply per token"
+    )
+    args = parser.parse_args()
+
+    # Exercise the coalescer so its import cost is not attributed to the first run
+    ChunkCoalescer().ready()
+
+    tokens = synthetic_tokens(args.tokens)
+    per_token = run(tokens, naive=False, tokens_per_second=args.rate)
+    print(f"incremental: {per_token * 1e6:10.1f} us CPU/token ({args.tokens} tokens)")
+
+    if args.naive:
+        per_token = run(tokens, naive=True, tokens_per_second=args.rate)
+        print(f"naive:       {per_token * 1e6:10.1f} us CPU/token ({args.tokens} tokens)")
+
+
+if __name__ == "__main__":
+    main()
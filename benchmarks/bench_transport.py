@@ -0,0 +1,158 @@
+"""Benchmark per-request overhead with and without the shared connection pool.
+
+Usage:
+    python -m benchmarks.bench_transport [--requests 200] [--concurrency 8] [--handshake-ms 30]
+
+A local HTTP stub answers OpenAI chat completion requests. The same requests
+are sent through the OpenAI SDK twice: once with a new client per request, as
+every service used to create its own, and once through the pooled client from
+``cliai.services.transport``. The stub has no TLS, so ``--handshake-ms`` adds
+a delay to the first response on each new connection to stand in for the
+TCP and TLS handshakes of a real API endpoint.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from cliai.services.transport import aclose_http_clients, get_http_client
+
+COMPLETION = json.dumps(
+    {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "bench",
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": "ok"},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+).encode()
+
+
+class StubServer:
+    """A keep-alive HTTP/1.1 server that returns a fixed chat completion."""
+
+    def __init__(self, handshake: float):
+        self.handshake = handshake
+        self.connections = 0
+        self._server: asyncio.Server | None = None
+
+    async def start(self) -> int:
+        """Start listening on a free local port and return it."""
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        first = True
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        length = int(value)
+                await reader.readexactly(length)
+
+                if first:
+                    await asyncio.sleep(self.handshake)
+                    first = False
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(COMPLETION)).encode() + b"\r\n"
+                    b"\r\n" + COMPLETION
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def send(client: AsyncOpenAI) -> float:
+    """Send one request and return its latency in seconds."""
+    start = time.perf_counter()
+    await client.chat.completions.create(
+        model="bench", messages=[{"role": "user", "content": "hi"}]
+    )
+    return time.perf_counter() - start
+
+
+async def run(base_url: str, requests: int, concurrency: int, pooled: bool) -> list[float]:
+    """Send ``requests`` requests, ``concurrency`` at a time, and return their latencies."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> float:
+        async with semaphore:
+            if pooled:
+                client = AsyncOpenAI(
+                    api_key="bench",
+                    base_url=base_url,
+                    max_retries=0,
+                    http_client=get_http_client(DefaultAsyncHttpxClient),
+                )
+                return await send(client)
+            async with AsyncOpenAI(api_key="bench", base_url=base_url, max_retries=0) as client:
+                return await send(client)
+
+    try:
+        return await asyncio.gather(*(one() for _ in range(requests)))
+    finally:
+        await aclose_http_clients()
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    print(f"{'mode':<8} {'connections':>11} {'mean ms':>8} {'p95 ms':>8} {'req/s':>8}")
+    for pooled in (False, True):
+        server = StubServer(args.handshake_ms / 1000)
+        port = await server.start()
+        try:
+            start = time.perf_counter()
+            latencies = await run(
+                f"http://127.0.0.1:{port}/v1", args.requests, args.concurrency, pooled
+            )
+            elapsed = time.perf_counter() - start
+        finally:
+            await server.stop()
+
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(
+            f"{'pooled' if pooled else 'fresh':<8} {server.connections:>11} "
+            f"{statistics.mean(latencies) * 1000:>8.2f} {p95 * 1000:>8.2f} "
+            f"{len(latencies) / elapsed:>8.0f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="requests per mode")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight")
+    parser.add_argument(
+        "--handshake-ms",
+        type=float,
+        default=30.0,
+        help="simulated connection setup time per new connection",
+    )
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""Local mock of the OpenAI, Anthropic and Gemini streaming APIs.
+
+Usage:
+    python -m benchmarks.mock_server [--port 8400] [--grpc-port 8401] [--ttft-ms 200]
+        [--tokens-per-second 80] [--tokens 400] [--error-rate 0] [--error-status 500]
+
+Point cliai at it with the environment variables it prints on start:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8400/v1
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8400
+    GOOGLE_API_ENDPOINT=http://127.0.0.1:8401
+
+OpenAI chat completions and Anthropic messages are served over HTTP/1.1,
+streamed as server-sent events or answered as JSON. Gemini is served over
+gRPC without TLS, which is what the Gemini SDK's async client speaks. Every
+reply is a synthetic Markdown text of ``--tokens`` tokens, sent after
+``--ttft-ms`` at ``--tokens-per-second``; ``--error-rate`` of the requests
+fail with ``--error-status`` instead. API keys are not checked.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import signal
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+from benchmarks.bench_streaming import synthetic_tokens
+
+_GEMINI_SERVICE = "google.ai.generativelanguage.v1beta.GenerativeService"
+_STATUS_TEXT = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+@dataclass
+class MockSettings:
+    """How the mock server answers."""
+
+    # Seconds before the first token
+    ttft: float = 0.2
+    tokens_per_second: float = 80.0
+    # Tokens in every reply
+    tokens: int = 400
+    # Fraction of requests that fail
+    error_rate: float = 0.0
+    # HTTP status of failed requests; gRPC requests fail with UNAVAILABLE
+    error_status: int = 500
+    seed: int = 0
+
+
+class MockProviderServer:
+    """Serve the mocked provider APIs on local ports."""
+
+    def __init__(self, settings: MockSettings):
+        self.settings = settings
+        self.reply = synthetic_tokens(settings.tokens, settings.seed)
+        self.requests = 0
+        self.http_port = 0
+        self.grpc_port = 0
+        self._random = random.Random(settings.seed)
+        self._http: asyncio.Server | None = None
+        self._grpc: Any = None
+
+    @property
+    def environment(self) -> dict[str, str]:
+        """Environment variables that point the provider SDKs at this server."""
+        return {
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{self.http_port}/v1",
+            "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{self.http_port}",
+            "GOOGLE_API_ENDPOINT": f"http://127.0.0.1:{self.grpc_port}",
+        }
+
+    async def start(self, http_port: int = 0, grpc_port: int = 0) -> None:
+        """Start listening; port 0 picks a free port."""
+        self._http = await asyncio.start_server(self._handle_http, "127.0.0.1", http_port)
+        self.http_port = self._http.sockets[0].getsockname()[1]
+        self._grpc = self._create_grpc_server()
+        self.grpc_port = self._grpc.add_insecure_port(f"127.0.0.1:{grpc_port}")
+        await self._grpc.start()
+
+    async def stop(self) -> None:
+        if self._http is not None:
+            self._http.close()
+        if self._grpc is not None:
+            await self._grpc.stop(grace=None)
+
+    def _fails(self) -> bool:
+        """Count a request and decide whether it should fail."""
+        self.requests += 1
+        return self._random.random() < self.settings.error_rate
+
+    def _reply_time(self) -> float:
+        """Get the seconds a streamed reply takes, to delay complete replies by as much."""
+        return self.settings.ttft + len(self.reply) / self.settings.tokens_per_second
+
+    async def _tokens(self) -> AsyncIterator[str]:
+        """Yield the reply's tokens at the configured time to first token and rate."""
+        await asyncio.sleep(self.settings.ttft)
+        start = time.monotonic()
+        for index, token in enumerate(self.reply):
+            delay = start + index / self.settings.tokens_per_second - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield token
+
+    # HTTP: OpenAI and Anthropic
+
+    async def _handle_http(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Answer requests on one keep-alive connection."""
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, target, _ = request_line.split(" ", 2)
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                path = target.partition("?")[0]
+                if method == "HEAD":
+                    await self._respond(writer, 200, b"", head_only=True)
+                elif method == "POST" and path.endswith("/chat/completions"):
+                    await self._openai(writer, json.loads(body))
+                elif method == "POST" and path.endswith("/messages"):
+                    await self._anthropic(writer, json.loads(body))
+                else:
+                    await self._respond(writer, 404, b'{"error": {"message": "Not found"}}')
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(
+        self, writer: asyncio.StreamWriter, status: int, body: bytes, head_only: bool = False
+    ) -> None:
+        """Send a complete JSON response."""
+        writer.write(
+            f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, 'Error')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "\r\n".encode()
+        )
+        if not head_only:
+            writer.write(body)
+        await writer.drain()
+
+    async def _stream(self, writer: asyncio.StreamWriter, events: AsyncIterator[str]) -> None:
+        """Send server-sent events, one HTTP chunk per event."""
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"\r\n"
+        )
+        async for event in events:
+            data = event.encode()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _openai(self, writer: asyncio.StreamWriter, request: dict[str, Any]) -> None:
+        """Answer a chat completion request."""
+        if self._fails():
+            error = {"error": {"message": "Mock failure", "type": "server_error"}}
+            await self._respond(writer, self.settings.error_status, json.dumps(error).encode())
+            return
+
+        model = request.get("model", "mock")
+        usage = {
+            "prompt_tokens": _count_tokens(request.get("messages", [])),
+            "completion_tokens": len(self.reply),
+            "total_tokens": 0,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not request.get("stream"):
+            await asyncio.sleep(self._reply_time())
+            completion = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(self.reply)},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+            await self._respond(writer, 200, json.dumps(completion).encode())
+            return
+
+        include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+
+        async def events() -> AsyncIterator[str]:
+            def chunk(delta: dict[str, Any], finish_reason: str | None = None) -> str:
+                data = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                return f"data: {json.dumps(data)}\n\n"
+
+            yield chunk({"role": "assistant", "content": ""})
+            async for token in self._tokens():
+                yield chunk({"content": token})
+            yield chunk({}, "stop")
+            if include_usage:
+                data = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": model,
+                    "choices": [],
+                    "usage": usage,
+                }
+                yield f"data: {json.dumps(data)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        await self._stream(writer, events())
+
+    async def _anthropic(self, writer: asyncio.StreamWriter, request: dict[str, Any]) -> None:
+        """Answer a messages request."""
+        if self._fails():
+            error = {"type": "error", "error": {"type": "api_error", "message": "Mock failure"}}
+            await self._respond(writer, self.settings.error_status, json.dumps(error).encode())
+            return
+
+        model = request.get("model", "mock")
+        input_tokens = _count_tokens(request.get("messages", [])) + _count_tokens(
+            request.get("system") or []
+        )
+        message = {
+            "id": "msg_mock",
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [],
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": 1},
+        }
+
+        if not request.get("stream"):
+            await asyncio.sleep(self._reply_time())
+            message["content"] = [{"type": "text", "text": "".join(self.reply)}]
+            message["stop_reason"] = "end_turn"
+            message["usage"] = {"input_tokens": input_tokens, "output_tokens": len(self.reply)}
+            await self._respond(writer, 200, json.dumps(message).encode())
+            return
+
+        async def events() -> AsyncIterator[str]:
+            def event(data: dict[str, Any]) -> str:
+                return f"event: {data['type']}\ndata: {json.dumps(data)}\n\n"
+
+            yield event({"type": "message_start", "message": message})
+            yield event(
+                {
+                    "type": "content_block_start",
+                    "index": 0,
+                    "content_block": {"type": "text", "text": ""},
+                }
+            )
+            async for token in self._tokens():
+                yield event(
+                    {
+                        "type": "content_block_delta",
+                        "index": 0,
+                        "delta": {"type": "text_delta", "text": token},
+                    }
+                )
+            yield event({"type": "content_block_stop", "index": 0})
+            yield event(
+                {
+                    "type": "message_delta",
+                    "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                    "usage": {"output_tokens": len(self.reply)},
+                }
+            )
+            yield event({"type": "message_stop"})
+
+        await self._stream(writer, events())
+
+    # gRPC: Gemini
+
+    def _create_grpc_server(self) -> Any:
+        """Create a gRPC server for the Gemini generate methods."""
+        import grpc
+        from google.ai import generativelanguage_v1beta as glm
+
+        def response(text: str, finish: bool, prompt_tokens: int) -> Any:
+            candidate = glm.Candidate(
+                content=glm.Content(parts=[glm.Part(text=text)], role="model"),
+                index=0,
+            )
+            result = glm.GenerateContentResponse(candidates=[candidate])
+            if finish:
+                candidate.finish_reason = glm.Candidate.FinishReason.STOP
+                result.usage_metadata = glm.GenerateContentResponse.UsageMetadata(
+                    prompt_token_count=prompt_tokens,
+                    candidates_token_count=len(self.reply),
+                    total_token_count=prompt_tokens + len(self.reply),
+                )
+            return result
+
+        def prompt_tokens(request: Any) -> int:
+            text = "".join(part.text for content in request.contents for part in content.parts)
+            return len(text) // 4
+
+        async def generate(request: Any, context: Any) -> Any:
+            if self._fails():
+                await context.abort(grpc.StatusCode.UNAVAILABLE, "Mock failure")
+            await asyncio.sleep(self._reply_time())
+            return response("".join(self.reply), True, prompt_tokens(request))
+
+        async def stream(request: Any, context: Any) -> AsyncIterator[Any]:
+            if self._fails():
+                await context.abort(grpc.StatusCode.UNAVAILABLE, "Mock failure")
+            tokens = prompt_tokens(request)
+            last = len(self.reply) - 1
+            index = 0
+            async for token in self._tokens():
+                yield response(token, index == last, tokens)
+                index += 1
+
+        handlers = {
+            "GenerateContent": grpc.unary_unary_rpc_method_handler(
+                generate,
+                request_deserializer=glm.GenerateContentRequest.deserialize,
+                response_serializer=glm.GenerateContentResponse.serialize,
+            ),
+            "StreamGenerateContent": grpc.unary_stream_rpc_method_handler(
+                stream,
+                request_deserializer=glm.GenerateContentRequest.deserialize,
+                response_serializer=glm.GenerateContentResponse.serialize,
+            ),
+        }
+        server = grpc.aio.server()
+        server.add_generic_rpc_handlers(
+            [grpc.method_handlers_generic_handler(_GEMINI_SERVICE, handlers)]
+        )
+        return server
+
+
+def _count_tokens(messages: list[Any] | str) -> int:
+    """Roughly count the tokens of OpenAI or Anthropic messages or system blocks."""
+    if isinstance(messages, str):
+        return len(messages) // 4
+    return len(json.dumps(messages)) // 4
+
+
+async def serve(settings: MockSettings, http_port: int, grpc_port: int) -> None:
+    """Serve until interrupted, printing the environment to use on start."""
+    server = MockProviderServer(settings)
+    await server.start(http_port, grpc_port)
+    # The first line is machine-readable, so that benchmarks can start the
+    # server as a subprocess and read where it listens
+    print(json.dumps(server.environment), flush=True)
+    for name, value in server.environment.items():
+        print(f"{name}={value}", file=sys.stderr)
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopped.set)
+    try:
+        await stopped.wait()
+    finally:
+        await server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8400, help="HTTP port, 0 for any")
+    parser.add_argument("--grpc-port", type=int, default=8401, help="gRPC port, 0 for any")
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="stream rate")
+    parser.add_argument("--tokens", type=int, default=400, help="tokens per reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of failures")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of failures")
+    parser.add_argument("--seed", type=int, default=0, help="seed for replies and failures")
+    args = parser.parse_args()
+
+    settings = MockSettings(
+        ttft=args.ttft_ms / 1000,
+        tokens_per_second=args.tokens_per_second,
+        tokens=args.tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    )
+    asyncio.run(serve(settings, args.port, args.grpc_port))
+
+
+if __name__ == "__main__":
+    main()
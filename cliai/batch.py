@@ -0,0 +1,225 @@
+"""Non-interactive batch processing of prompts for CLI AI Chat."""
+
+import asyncio
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Any
+
+from .config import get_model_by_id
+from .services import AIService, Message, Role, get_service_for_model
+
+# Bytes read at a time when looking for the end of the last complete line
+_BLOCK_SIZE = 64 * 1024
+
+
+@dataclass
+class BatchRequest:
+    """A single request read from a batch input file."""
+
+    id: str
+    model_id: str
+    messages: list[Message]
+
+
+@dataclass
+class BatchSummary:
+    """Counts of what happened during a batch run."""
+
+    total: int = 0
+    skipped: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    errors: list[str] = field(default_factory=list)
+
+
+def parse_request(data: Any, line_number: int, default_model: str | None) -> BatchRequest:
+    """Build a batch request from one decoded input line.
+
+    A line has an optional ``id`` (defaults to the line number), an optional
+    ``model`` (defaults to ``default_model``), an optional ``system`` prompt,
+    and either a ``messages`` list of ``{"role", "content"}`` objects or a
+    single ``prompt`` string.
+
+    Raises:
+        ValueError: If the line is not a valid request
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"line {line_number}: expected a JSON object")
+
+    model_id = data.get("model") or default_model
+    if not model_id:
+        raise ValueError(f"line {line_number}: no model given")
+
+    messages = []
+    if data.get("system"):
+        if not isinstance(data["system"], str):
+            raise ValueError(f"line {line_number}: 'system' must be a string")
+        messages.append(Message(role=Role.SYSTEM, content=data["system"]))
+
+    if "messages" in data:
+        if not isinstance(data["messages"], list):
+            raise ValueError(f"line {line_number}: 'messages' must be a list")
+        for msg_data in data["messages"]:
+            if not isinstance(msg_data, dict) or not {"role", "content"} <= msg_data.keys():
+                raise ValueError(
+                    f"line {line_number}: each message must be an object with 'role' and 'content'"
+                )
+            try:
+                role = Role(msg_data["role"])
+            except ValueError as e:
+                raise ValueError(f"line {line_number}: {e}") from e
+            if not isinstance(msg_data["content"], str):
+                raise ValueError(f"line {line_number}: message content must be a string")
+            messages.append(Message(role=role, content=msg_data["content"]))
+    elif "prompt" in data:
+        if not isinstance(data["prompt"], str):
+            raise ValueError(f"line {line_number}: 'prompt' must be a string")
+        messages.append(Message(role=Role.USER, content=data["prompt"]))
+    else:
+        raise ValueError(f"line {line_number}: expected 'messages' or 'prompt'")
+
+    return BatchRequest(id=str(data.get("id", line_number)), model_id=model_id, messages=messages)
+
+
+def read_requests(input_file: Path, default_model: str | None) -> list[BatchRequest]:
+    """Read all requests from a JSONL input file."""
+    requests = []
+    with open(input_file, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"line {line_number}: {e}") from e
+            requests.append(parse_request(data, line_number, default_model))
+    return requests
+
+
+def read_completed_ids(output_file: Path) -> set[str]:
+    """Get the IDs of requests that already have a response in the output file."""
+    completed: set[str] = set()
+    if not output_file.exists():
+        return completed
+
+    with open(output_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written last line from an interrupted run
+                continue
+            # Lines without an ID weren't written by a batch run
+            if isinstance(result, dict) and "response" in result and "id" in result:
+                completed.add(str(result["id"]))
+    return completed
+
+
+def drop_partial_line(output_file: Path) -> None:
+    """Cut off a partially written last line so that appended results start on a new line."""
+    if not output_file.exists():
+        return
+
+    with open(output_file, "rb+") as f:
+        # Only the end of the file is read, in blocks, back to the last newline
+        size = end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - _BLOCK_SIZE)
+            f.seek(start)
+            block = f.read(end - start)
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                if start + newline + 1 < size:
+                    f.truncate(start + newline + 1)
+                return
+            end = start
+        f.truncate(0)
+
+
+class BatchRunner:
+    """Run batch requests concurrently and write results as they complete."""
+
+    def __init__(self, concurrency: int = 8, cache: bool = False, metrics_log: bool = False):
+        """Initialize the batch runner.
+
+        Args:
+            concurrency: Maximum number of requests in flight at once
+            cache: Whether to answer repeated requests from the response cache
+            metrics_log: Whether to append request metrics to the metrics log
+        """
+        self.concurrency = concurrency
+        self.cache = cache
+        self.metrics_log = metrics_log
+        self._services: dict[str, AIService] = {}
+
+    def _get_service(self, model_id: str) -> AIService:
+        """Get the shared service for a model, creating it on first use."""
+        if model_id not in self._services:
+            model_config = get_model_by_id(model_id)
+            if model_config is None:
+                raise ValueError(f"Unknown model: {model_id}")
+            self._services[model_id] = get_service_for_model(
+                model_config, cache=self.cache, metrics_log=self.metrics_log
+            )
+        return self._services[model_id]
+
+    async def run(
+        self, requests: list[BatchRequest], output: IO[str], completed: set[str] | None = None
+    ) -> BatchSummary:
+        """Run requests, skipping those already completed.
+
+        Args:
+            requests: The requests to run
+            output: Text stream that receives one JSON result per line
+            completed: IDs of requests to skip
+
+        Returns:
+            A summary of the run
+        """
+        completed = completed or set()
+        summary = BatchSummary(total=len(requests))
+        queue: asyncio.Queue[BatchRequest] = asyncio.Queue()
+
+        for request in requests:
+            if request.id in completed:
+                summary.skipped += 1
+            else:
+                queue.put_nowait(request)
+
+        async def worker() -> None:
+            while True:
+                try:
+                    request = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+
+                result: dict[str, Any] = {"id": request.id, "model": request.model_id}
+                try:
+                    service = self._get_service(request.model_id)
+                    response = await service.generate_response(request.messages, stream=False)
+                    if not isinstance(response, str):
+                        response = "".join([chunk async for chunk in response])
+                    result["response"] = response
+                    summary.succeeded += 1
+                except Exception as e:
+                    result["error"] = str(e)
+                    summary.failed += 1
+                    summary.errors.append(f"{request.id}: {e}")
+
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, self.concurrency))))
+        finally:
+            await self.close()
+
+        return summary
+
+    async def close(self) -> None:
+        """Close all services used by the runner."""
+        for service in self._services.values():
+            await service.close()
+        self._services.clear()
@@ -3,30 +3,48 @@
 from .models import (
     Provider,
     ModelConfig,
+    ModelsFileError,
     AVAILABLE_MODELS,
     DEFAULT_MODEL_ID,
+    get_available_models,
     get_model_by_id,
     get_models_by_provider,
     get_default_model,
+    get_models_file,
+    load_models,
 )
 
 from .environment import (
     get_api_key,
     get_cache_dir,
+    get_daemon_socket,
     get_history_file,
+    get_legacy_history_file,
+    get_rate_limits,
+    get_list_setting,
+    get_number_setting,
     MissingAPIKeyError,
 )
 
 __all__ = [
     "Provider",
     "ModelConfig",
+    "ModelsFileError",
     "AVAILABLE_MODELS",
     "DEFAULT_MODEL_ID",
+    "get_available_models",
     "get_model_by_id",
     "get_models_by_provider",
     "get_default_model",
+    "get_models_file",
+    "load_models",
     "get_api_key",
     "get_cache_dir",
+    "get_daemon_socket",
     "get_history_file",
+    "get_legacy_history_file",
+    "get_rate_limits",
+    "get_list_setting",
+    "get_number_setting",
     "MissingAPIKeyError",
 ]
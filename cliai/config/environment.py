@@ -1,22 +1,29 @@
 import os
 from pathlib import Path
-from dotenv import load_dotenv
 
 from .models import Provider
 
 
-# Load environment variables from .env file
-load_dotenv()
+_dotenv_loaded = False
+
+
+def _load_dotenv() -> None:
+    """Load environment variables from a .env file the first time they are needed."""
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _dotenv_loaded = True
 
 
 class MissingAPIKeyError(Exception):
     """Exception raised when an API key is missing."""
 
-    def __init__(self, provider: Provider):
+    def __init__(self, provider: Provider, env_var: str | None = None):
         self.provider = provider
-        super().__init__(
-            f"Missing API key for {provider.value}. Please set {self._get_env_var_name(provider)}."
-        )
+        self.env_var = env_var or self._get_env_var_name(provider)
+        super().__init__(f"Missing API key for {provider.value}. Please set {self.env_var}.")
 
     @staticmethod
     def _get_env_var_name(provider: Provider) -> str:
@@ -29,9 +36,17 @@ class MissingAPIKeyError(Exception):
         return "UNKNOWN_API_KEY"
 
 
-def get_api_key(provider: Provider) -> str:
-    """Get the API key for a specific provider from environment variables."""
-    if provider == Provider.OPENAI:
+def get_api_key(provider: Provider, env_var: str | None = None) -> str:
+    """Get the API key for a specific provider from environment variables.
+
+    Args:
+        provider: The provider
+        env_var: Variable to read instead of the provider's usual one
+    """
+    _load_dotenv()
+    if env_var:
+        api_key = os.getenv(env_var)
+    elif provider == Provider.OPENAI:
         api_key = os.getenv("OPENAI_API_KEY")
     elif provider == Provider.ANTHROPIC:
         api_key = os.getenv("ANTHROPIC_API_KEY")
@@ -41,13 +56,68 @@ def get_api_key(provider: Provider) -> str:
         raise ValueError(f"Unsupported provider: {provider}")
 
     if api_key is None or api_key.strip() == "":
-        raise MissingAPIKeyError(provider)
+        raise MissingAPIKeyError(provider, env_var)
 
     return api_key
 
 
+def _get_float(name: str) -> float | None:
+    """Read a positive number from an environment variable."""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number, got {value!r}")
+    return number if number > 0 else None
+
+
+def get_number_setting(name: str, default: float) -> float:
+    """Read a positive number setting from the environment.
+
+    Args:
+        name: Name of the environment variable
+        default: Value to use when the variable is not set
+
+    Raises:
+        ValueError: If the variable is set to something that isn't a number
+    """
+    _load_dotenv()
+    value = _get_float(name)
+    return default if value is None else value
+
+
+def get_list_setting(name: str) -> list[str]:
+    """Read a comma-separated list setting from the environment.
+
+    Args:
+        name: Name of the environment variable
+
+    Returns:
+        The non-empty items, stripped of whitespace; empty if the variable is not set
+    """
+    _load_dotenv()
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+
+def get_rate_limits(provider: Provider) -> tuple[float | None, float | None]:
+    """Get the configured request and token limits for a provider.
+
+    Limits are read from CLIAI_<PROVIDER>_RPM (requests per minute) and
+    CLIAI_<PROVIDER>_TPM (tokens per minute), e.g. CLIAI_OPENAI_RPM.
+
+    Returns:
+        A (requests per minute, tokens per minute) tuple; None means unlimited
+    """
+    _load_dotenv()
+    prefix = f"CLIAI_{provider.name}"
+    return _get_float(f"{prefix}_RPM"), _get_float(f"{prefix}_TPM")
+
+
 def get_cache_dir() -> Path:
     """Get the cache directory for the application."""
+    _load_dotenv()
     user_cache_dir = os.getenv("XDG_CACHE_HOME")
     if user_cache_dir:
         base_dir = Path(user_cache_dir)
@@ -60,5 +130,26 @@ def get_cache_dir() -> Path:
 
 
 def get_history_file() -> Path:
-    """Get the path to the history file."""
+    """Get the path to the history database."""
+    return get_cache_dir() / "history.sqlite3"
+
+
+def get_legacy_history_file() -> Path:
+    """Get the path to the single-file JSON history used by earlier versions."""
     return get_cache_dir() / "history.json"
+
+
+def get_daemon_socket() -> Path:
+    """Get the path of the daemon's Unix socket.
+
+    CLIAI_DAEMON_SOCKET overrides the default, which is in XDG_RUNTIME_DIR
+    when it is set and in the cache directory otherwise.
+    """
+    _load_dotenv()
+    path = os.getenv("CLIAI_DAEMON_SOCKET")
+    if path:
+        return Path(path)
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "cliai.sock"
+    return get_cache_dir() / "daemon.sock"
@@ -1,5 +1,7 @@
+import os
 from enum import Enum, auto
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from pathlib import Path
 
 
 class Provider(str, Enum):
@@ -8,6 +10,10 @@ class Provider(str, Enum):
     OPENAI = "OpenAI"
     ANTHROPIC = "Anthropic"
     GOOGLE = "Google"
+    # Self-hosted servers with an OpenAI-compatible API, e.g. vLLM or llama.cpp
+    LOCAL = "Local"
+    # The router, which picks one of the other models for each request
+    AUTO = "Auto"
 
 
 @dataclass
@@ -19,6 +25,26 @@ class ModelConfig:
     provider: Provider
     max_tokens: int
     description: str
+    # Maximum number of input plus output tokens the model accepts
+    context_window: int = 8192
+    # API endpoint, instead of the provider's default one
+    base_url: str | None = None
+    # Environment variable holding the API key, instead of the provider's one
+    api_key_env: str | None = None
+    # Registered backend that serves the model, instead of the provider's
+    # default one; see cliai.services.registry
+    backend: str | None = None
+    # USD per million input and output tokens; unpriced models count as free
+    input_price: float | None = None
+    output_price: float | None = None
+    # USD per million input tokens read from and written to the prompt
+    # cache, if they are priced differently from other input
+    cached_input_price: float | None = None
+    cache_write_price: float | None = None
+    # Requests and tokens per minute allowed for this model, on top of the
+    # provider's limits; None means unlimited
+    requests_per_minute: float | None = None
+    tokens_per_minute: float | None = None
 
 
 # Supported model configurations
@@ -29,6 +55,10 @@ AVAILABLE_MODELS = [
         provider=Provider.OPENAI,
         max_tokens=4096,
         description="Most capable OpenAI model, preview version from Feb 2025",
+        context_window=128000,
+        input_price=75.0,
+        output_price=150.0,
+        cached_input_price=37.5,
     ),
     ModelConfig(
         id="gpt-4o-2024-08-06",
@@ -36,6 +66,10 @@ AVAILABLE_MODELS = [
         provider=Provider.OPENAI,
         max_tokens=4096,
         description="Optimized version of GPT-4 from Aug 2024",
+        context_window=128000,
+        input_price=2.5,
+        output_price=10.0,
+        cached_input_price=1.25,
     ),
     ModelConfig(
         id="claude-3-7-sonnet-20250219",
@@ -43,6 +77,11 @@ AVAILABLE_MODELS = [
         provider=Provider.ANTHROPIC,
         max_tokens=4096,
         description="Claude 3.7 Sonnet model from Feb 2025",
+        context_window=200000,
+        input_price=3.0,
+        output_price=15.0,
+        cached_input_price=0.3,
+        cache_write_price=3.75,
     ),
     ModelConfig(
         id="claude-3-5-sonnet-20241022",
@@ -50,6 +89,11 @@ AVAILABLE_MODELS = [
         provider=Provider.ANTHROPIC,
         max_tokens=4096,
         description="Claude 3.5 Sonnet model from Oct 2024",
+        context_window=200000,
+        input_price=3.0,
+        output_price=15.0,
+        cached_input_price=0.3,
+        cache_write_price=3.75,
     ),
     ModelConfig(
         id="gemini-pro",
@@ -57,6 +101,18 @@ AVAILABLE_MODELS = [
         provider=Provider.GOOGLE,
         max_tokens=4096,
         description="Google's Gemini Pro language model",
+        context_window=32760,
+        input_price=0.5,
+        output_price=1.5,
+    ),
+    ModelConfig(
+        id="auto",
+        name="Auto",
+        provider=Provider.AUTO,
+        max_tokens=4096,
+        description="Picks a model for each request by price, prompt length and recent latency",
+        # Chats are trimmed to this, and each request only goes to models it fits
+        context_window=128000,
     ),
 ]
 
@@ -64,9 +120,123 @@ AVAILABLE_MODELS = [
 DEFAULT_MODEL_ID = "gpt-4o-2024-08-06"
 
 
+class ModelsFileError(Exception):
+    """Exception raised when the models file can't be read."""
+
+
+def get_models_file() -> Path:
+    """Get the path of the file that defines additional models.
+
+    CLIAI_MODELS_FILE overrides the default, ``cliai/models.toml`` in
+    XDG_CONFIG_HOME or ``~/.config``.
+    """
+    # Imported here, as the environment module imports this one
+    from .environment import _load_dotenv
+
+    _load_dotenv()
+    path = os.getenv("CLIAI_MODELS_FILE")
+    if path:
+        return Path(path)
+    config_dir = os.getenv("XDG_CONFIG_HOME")
+    base_dir = Path(config_dir) if config_dir else Path.home() / ".config"
+    return base_dir / "cliai" / "models.toml"
+
+
+def _parse_provider(value: str) -> Provider:
+    """Parse a provider by its value or name, ignoring case."""
+    for provider in Provider:
+        if value.lower() in (provider.value.lower(), provider.name.lower()):
+            return provider
+    raise ValueError(f"Unknown provider: {value}")
+
+
+def load_models(path: Path) -> tuple[list[ModelConfig], str | None]:
+    """Read model definitions from a TOML file.
+
+    Each ``[[models]]`` table takes the fields of :class:`ModelConfig`.
+    ``name`` and ``description`` default to the ID and ``max_tokens`` to
+    4096; ``provider`` defaults to Local for models with a ``base_url``. A
+    top-level ``default_model`` replaces the default model.
+
+    Returns:
+        The models and the default model ID, if the file sets one
+
+    Raises:
+        ModelsFileError: If the file is not valid TOML or a model is invalid
+    """
+    import tomllib
+
+    try:
+        with path.open("rb") as file:
+            data = tomllib.load(file)
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        raise ModelsFileError(f"Can't read {path}: {e}") from e
+
+    known = {field.name for field in fields(ModelConfig)}
+    models = []
+    for index, entry in enumerate(data.get("models", []), 1):
+        try:
+            unknown = set(entry) - known
+            if unknown:
+                raise ValueError(f"unknown fields {', '.join(sorted(unknown))}")
+            if "id" not in entry:
+                raise ValueError("id is required")
+            entry = dict(entry)
+            entry.setdefault("name", entry["id"])
+            entry.setdefault("description", entry["name"])
+            entry.setdefault("max_tokens", 4096)
+            if "provider" in entry:
+                entry["provider"] = _parse_provider(entry["provider"])
+            elif entry.get("base_url"):
+                entry["provider"] = Provider.LOCAL
+            else:
+                raise ValueError("provider or base_url is required")
+            models.append(ModelConfig(**entry))
+        except (TypeError, ValueError) as e:
+            raise ModelsFileError(f"Invalid model {index} in {path}: {e}") from e
+    return models, data.get("default_model")
+
+
+_configured_models_added = False
+
+
+def _add_configured_models() -> None:
+    """Add the models from the models file, replacing built-in ones with the same ID.
+
+    The file is read the first time models are needed rather than on
+    import, so that commands which don't use models work without it and the
+    CLI can report an invalid file.
+
+    Raises:
+        ModelsFileError: If the file is not valid TOML or a model is invalid
+    """
+    global DEFAULT_MODEL_ID, _configured_models_added
+    if _configured_models_added:
+        return
+    path = get_models_file()
+    if path.is_file():
+        models, default_model_id = load_models(path)
+        models_by_id = {model.id: model for model in AVAILABLE_MODELS}
+        models_by_id.update((model.id, model) for model in models)
+        AVAILABLE_MODELS[:] = models_by_id.values()
+        if default_model_id:
+            DEFAULT_MODEL_ID = default_model_id
+    _configured_models_added = True
+
+
+def get_available_models() -> list[ModelConfig]:
+    """Get the built-in models and those from the models file.
+
+    Raises:
+        ModelsFileError: If the models file is not valid TOML or a model is invalid
+    """
+    _add_configured_models()
+    return AVAILABLE_MODELS
+
+
 def get_model_by_id(model_id: str) -> ModelConfig | None:
     """Get model configuration by ID."""
-    for model in AVAILABLE_MODELS:
+    for model in get_available_models():
         if model.id == model_id:
             return model
     return None
@@ -74,11 +244,12 @@ def get_model_by_id(model_id: str) -> ModelConfig | None:
 
 def get_models_by_provider(provider: Provider) -> list[ModelConfig]:
     """Get all models from a specific provider."""
-    return [model for model in AVAILABLE_MODELS if model.provider == provider]
+    return [model for model in get_available_models() if model.provider == provider]
 
 
 def get_default_model() -> ModelConfig:
     """Get the default model configuration."""
+    _add_configured_models()
     model = get_model_by_id(DEFAULT_MODEL_ID)
     if model is None:
         # Fallback to first available model if default is not found
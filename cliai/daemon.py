@@ -0,0 +1,350 @@
+"""Background daemon that keeps services and connections warm between commands.
+
+Every ``cliai`` process pays for imports, SDK client construction and TLS
+handshakes before its first request. The daemon does that once and serves
+requests over a Unix socket; :class:`RemoteService` is the thin client used
+in its place while the daemon is running.
+
+The protocol is JSON, one object per line. A client sends one command per
+connection: ``{"command": "generate", "model": ..., "messages": [...]}``
+is answered with ``{"chunk": ...}`` lines followed by ``{"done": true}`` or
+``{"error": ...}``; ``ping`` and ``shutdown`` are answered with one line.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, AsyncGenerator
+
+from .config import (
+    MissingAPIKeyError,
+    ModelConfig,
+    Provider,
+    get_cache_dir,
+    get_daemon_socket,
+    get_model_by_id,
+    get_number_setting,
+)
+from .services.base import AIService, Message, Role, Usage
+from .services.metrics import RequestTiming, current_timing, report_usage
+
+
+# Requests carry the whole conversation on a single line
+LINE_LIMIT = 64 * 2**20
+
+
+class DaemonError(Exception):
+    """An error reported by, or while talking to, the daemon."""
+
+
+def _encode(event: dict[str, Any]) -> bytes:
+    return json.dumps(event).encode() + b"\n"
+
+
+def _raise_error(event: dict[str, Any]) -> None:
+    """Raise the error described by an error event."""
+    if event.get("missing_api_key"):
+        raise MissingAPIKeyError(Provider(event["missing_api_key"]), event.get("env_var"))
+    raise DaemonError(event["error"])
+
+
+def is_daemon_running(path: Path | None = None) -> bool:
+    """Check whether a daemon is accepting connections on its socket."""
+    path = path or get_daemon_socket()
+    if not path.exists():
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+        except OSError:
+            return False
+    return True
+
+
+def send_command(command: str, path: Path | None = None) -> dict[str, Any]:
+    """Send a control command (``ping`` or ``shutdown``) and return the reply.
+
+    Raises:
+        DaemonError: If the daemon isn't running or reported an error
+    """
+    path = path or get_daemon_socket()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+            sock.sendall(_encode({"command": command}))
+            line = sock.makefile("rb").readline()
+        except OSError as e:
+            raise DaemonError(f"The daemon is not running ({e})")
+    if not line:
+        raise DaemonError("The daemon closed the connection")
+    reply = json.loads(line)
+    if "error" in reply:
+        _raise_error(reply)
+    return reply  # type: ignore[no-any-return]
+
+
+def start_daemon_process(timeout: float = 10.0) -> int:
+    """Start the daemon in the background and wait until it accepts connections.
+
+    Its output goes to daemon.log in the cache directory.
+
+    Returns:
+        The process ID of the daemon
+
+    Raises:
+        DaemonError: If the daemon exited or didn't start listening in time
+    """
+    log_path = get_cache_dir() / "daemon.log"
+    with open(log_path, "ab") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "cliai", "daemon", "start", "--foreground"],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise DaemonError(f"The daemon exited, see {log_path}")
+        if is_daemon_running():
+            return process.pid
+        time.sleep(0.05)
+    raise DaemonError(f"The daemon didn't start within {timeout:.0f}s, see {log_path}")
+
+
+class DaemonServer:
+    """Serve requests from warm services over a Unix socket."""
+
+    def __init__(self, path: Path | None = None, idle_timeout: float | None = None):
+        """Initialize the server.
+
+        Args:
+            path: Socket path, by default from get_daemon_socket()
+            idle_timeout: Seconds without requests after which the daemon
+                exits, by default CLIAI_DAEMON_IDLE_TIMEOUT or one hour
+        """
+        self.path = path or get_daemon_socket()
+        if idle_timeout is None:
+            idle_timeout = get_number_setting("CLIAI_DAEMON_IDLE_TIMEOUT", 3600.0)
+        self.idle_timeout = idle_timeout
+        # Services by (model ID, response cache enabled)
+        self._services: dict[tuple[str, bool], AIService] = {}
+        self._active = 0
+        self._last_activity = time.monotonic()
+        self._stopped: asyncio.Event | None = None
+
+    async def serve(self) -> None:
+        """Serve requests until shut down, signalled or idle for too long.
+
+        Raises:
+            DaemonError: If another daemon is already listening on the socket
+        """
+        if self.path.exists():
+            if is_daemon_running(self.path):
+                raise DaemonError(f"A daemon is already listening on {self.path}")
+            self.path.unlink()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        stopped = self._stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stopped.set)
+
+        # Only the current user may connect
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(
+                self._handle, path=str(self.path), limit=LINE_LIMIT
+            )
+        finally:
+            os.umask(umask)
+
+        watchdog = asyncio.create_task(self._stop_when_idle())
+        try:
+            await stopped.wait()
+        finally:
+            watchdog.cancel()
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                loop.remove_signal_handler(signum)
+            server.close()
+            self.path.unlink(missing_ok=True)
+            for service in self._services.values():
+                await service.close()
+            self._services.clear()
+
+    async def _stop_when_idle(self) -> None:
+        """Stop the server once no request has been seen for the idle timeout."""
+        assert self._stopped is not None
+        while True:
+            await asyncio.sleep(min(60.0, self.idle_timeout))
+            idle = time.monotonic() - self._last_activity
+            if not self._active and idle >= self.idle_timeout:
+                self._stopped.set()
+                return
+
+    def _service(self, model_config: ModelConfig, cache: bool) -> AIService:
+        """Get the warm service for a model, creating it on first use."""
+        from .services import get_service_for_model
+
+        key = (model_config.id, cache)
+        if key not in self._services:
+            # Usage is recorded by the clients, which know the session
+            self._services[key] = get_service_for_model(
+                model_config, cache=cache, usage_ledger=False
+            )
+        return self._services[key]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer the command sent on one connection."""
+        self._active += 1
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            request = json.loads(line)
+            command = request.get("command")
+
+            if command == "generate":
+                await self._generate(request, writer)
+            elif command == "ping":
+                models = sorted({model_id for model_id, _ in self._services})
+                writer.write(_encode({"pid": os.getpid(), "models": models}))
+            elif command == "shutdown":
+                writer.write(_encode({"pid": os.getpid()}))
+                assert self._stopped is not None
+                self._stopped.set()
+            else:
+                writer.write(_encode({"error": f"Unknown command: {command}"}))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # The client went away; closing its stream cancelled the request
+            pass
+        except Exception as e:
+            writer.write(_encode({"error": f"Invalid request: {e}"}))
+        finally:
+            self._active -= 1
+            self._last_activity = time.monotonic()
+            writer.close()
+
+    async def _generate(self, request: dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        """Stream the response to a generate command."""
+        model_config = get_model_by_id(request["model"])
+        if model_config is None:
+            writer.write(_encode({"error": f"Unknown model: {request['model']}"}))
+            return
+        messages = [
+            Message(role=Role(message["role"]), content=message["content"])
+            for message in request["messages"]
+        ]
+
+        # Collects the usage of this request, which shares the service with others
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        try:
+            service = self._service(model_config, bool(request.get("cache")))
+            response = await service.generate_response(messages, stream=True)
+            if isinstance(response, str):
+                writer.write(_encode({"chunk": response}))
+            else:
+                try:
+                    async for chunk in response:
+                        writer.write(_encode({"chunk": chunk}))
+                        await writer.drain()
+                finally:
+                    await response.aclose()
+        except MissingAPIKeyError as e:
+            writer.write(
+                _encode(
+                    {"error": str(e), "missing_api_key": e.provider.value, "env_var": e.env_var}
+                )
+            )
+            return
+        except ConnectionError:
+            raise
+        except Exception as e:
+            writer.write(_encode({"error": str(e)}))
+            return
+        finally:
+            current_timing.reset(token)
+
+        usage = timing.usage
+        writer.write(_encode({"done": True, "usage": asdict(usage) if usage else None}))
+
+
+class RemoteService(AIService):
+    """Send requests to the daemon instead of calling the provider in-process.
+
+    Timeouts, retries and the response cache are applied by the daemon's
+    service for the model.
+    """
+
+    def __init__(self, model_config: ModelConfig, cache: bool = False, path: Path | None = None):
+        """Initialize the client.
+
+        Args:
+            model_config: Configuration for the model to use
+            cache: Whether the daemon should use the response cache
+            path: Socket path, by default from get_daemon_socket()
+        """
+        self.model_config = model_config
+        self.cache = cache
+        self.path = path or get_daemon_socket()
+
+    async def generate_response(
+        self, messages: list[Message], stream: bool = True
+    ) -> AsyncGenerator[str, None] | str:
+        """Generate a response through the daemon."""
+        self.last_usage = None
+        if stream:
+            return self._stream_response(messages)
+        return "".join([chunk async for chunk in self._stream_response(messages)])
+
+    async def _stream_response(self, messages: list[Message]) -> AsyncGenerator[str, None]:
+        """Send the request and yield chunks as the daemon relays them."""
+        try:
+            reader, writer = await asyncio.open_unix_connection(str(self.path), limit=LINE_LIMIT)
+        except OSError as e:
+            raise DaemonError(f"Can't connect to the daemon ({e})")
+
+        try:
+            request = {
+                "command": "generate",
+                "model": self.model_config.id,
+                "cache": self.cache,
+                "messages": [
+                    {"role": message.role.value, "content": message.content} for message in messages
+                ],
+            }
+            writer.write(_encode(request))
+            await writer.drain()
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise DaemonError("The daemon closed the connection")
+                event = json.loads(line)
+                if "chunk" in event:
+                    yield event["chunk"]
+                elif "error" in event:
+                    _raise_error(event)
+                elif event.get("done"):
+                    if event.get("usage"):
+                        self.last_usage = Usage(**event["usage"])
+                        report_usage(self.last_usage)
+                    return
+        finally:
+            # Closing the connection early makes the daemon cancel the request
+            writer.close()
+
+    async def close(self) -> None:
+        """Nothing to close; each request uses its own connection."""
+        pass
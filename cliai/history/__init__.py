@@ -0,0 +1,14 @@
+"""Conversation history storage for CLI AI Chat."""
+
+from .store import HIGHLIGHT_END, HIGHLIGHT_START, Conversation, ConversationStore, SearchHit
+from .writer import ConversationRef, HistoryWriter
+
+__all__ = [
+    "Conversation",
+    "ConversationRef",
+    "ConversationStore",
+    "HIGHLIGHT_END",
+    "HIGHLIGHT_START",
+    "HistoryWriter",
+    "SearchHit",
+]
@@ -0,0 +1,520 @@
+"""Append-only conversation store backed by SQLite."""
+
+import json
+import re
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from ..config import ModelConfig, get_history_file, get_legacy_history_file
+from ..services import Message, Role
+
+
+# Schema migrations, applied in order. The index of the last applied
+# migration is kept in the database's user_version.
+_MIGRATIONS = [
+    """
+    CREATE TABLE conversations (
+        id INTEGER PRIMARY KEY,
+        model_id TEXT NOT NULL,
+        model_name TEXT NOT NULL,
+        provider TEXT NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        created TEXT NOT NULL,
+        last_updated TEXT NOT NULL
+    );
+    CREATE INDEX conversations_by_model ON conversations (model_id, last_updated);
+    CREATE TABLE messages (
+        id INTEGER PRIMARY KEY,
+        conversation_id INTEGER NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL
+    );
+    CREATE UNIQUE INDEX messages_by_conversation ON messages (conversation_id, position);
+    """,
+    # Rolling summary that replaces the first summary_covers non-system messages
+    """
+    ALTER TABLE conversations ADD COLUMN summary TEXT;
+    ALTER TABLE conversations ADD COLUMN summary_covers INTEGER NOT NULL DEFAULT 0;
+    """,
+    # Named sessions, unique per model
+    """
+    ALTER TABLE conversations ADD COLUMN name TEXT;
+    CREATE UNIQUE INDEX conversations_by_name ON conversations (model_id, name)
+        WHERE name IS NOT NULL;
+    """,
+]
+
+# Full-text index over message contents. It is kept outside the migrations
+# because SQLite may be built without FTS5; search then falls back to LIKE.
+# The index only stores the tokens and reads the text from the messages
+# table, and triggers keep it in sync as messages are added and removed.
+_SEARCH_INDEX = """
+CREATE VIRTUAL TABLE messages_fts USING fts5 (
+    content, content='messages', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE TRIGGER messages_fts_update AFTER UPDATE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+INSERT INTO messages_fts (messages_fts) VALUES ('rebuild');
+"""
+
+# Marks the matched terms in search snippets
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+
+@dataclass
+class Conversation:
+    """Metadata for a stored conversation."""
+
+    id: int
+    model_id: str
+    model_name: str
+    provider: str
+    message_count: int
+    created: str
+    last_updated: str
+    summary: str | None = None
+    # Number of non-system messages, from the start, that the summary replaces
+    summary_covers: int = 0
+    # Session name, None for unnamed conversations
+    name: str | None = None
+
+
+@dataclass
+class SearchHit:
+    """A message that matches a search query."""
+
+    conversation_id: int
+    # Position of the message in its conversation
+    position: int
+    role: str
+    # Excerpt around the match, with matched terms between HIGHLIGHT_START and HIGHLIGHT_END
+    snippet: str
+    model_id: str
+    model_name: str
+    session: str | None
+    last_updated: str
+
+
+class ConversationStore:
+    """Store conversations as individually appended messages.
+
+    Saving a turn only inserts the new messages, and finding the latest
+    conversation for a model, a session by name or a conversation by ID are
+    index lookups, so none of these costs grow with the size of the history.
+    """
+
+    def __init__(self, path: Path | None = None, check_same_thread: bool = True):
+        """Open (and if needed create) the conversation store.
+
+        A database file that is damaged is moved aside, see ``recovered_from``,
+        and an empty store is created in its place.
+
+        Args:
+            path: Path to the database file, defaults to the history file
+            check_same_thread: Whether only the creating thread may use the
+                store; the caller must serialize access when this is False
+        """
+        self.path = path or get_history_file()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Where a damaged database file was moved to
+        self.recovered_from: Path | None = None
+        try:
+            self._open(check_same_thread)
+        except sqlite3.DatabaseError as e:
+            if e.sqlite_errorcode not in (sqlite3.SQLITE_CORRUPT, sqlite3.SQLITE_NOTADB):
+                raise
+            self._connection.close()
+            self.recovered_from = self._move_aside()
+            self._open(check_same_thread)
+
+        if path is None:
+            self._import_legacy_history(get_legacy_history_file())
+
+    def _open(self, check_same_thread: bool) -> None:
+        """Connect to the database and bring its schema up to date."""
+        self._connection = sqlite3.connect(self.path, check_same_thread=check_same_thread)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # Sync the log on every commit, so a committed turn survives a power loss
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute("PRAGMA foreign_keys=ON")
+        self._migrate()
+        self.full_text_search = self._create_search_index()
+
+    def _move_aside(self) -> Path:
+        """Rename a damaged database file, and its log, so that a new one can be created.
+
+        Returns:
+            The new path of the damaged file
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        damaged = self.path.with_name(f"{self.path.name}.corrupt-{timestamp}")
+        for suffix in ("", "-wal", "-shm"):
+            source = self.path.with_name(self.path.name + suffix)
+            if source.exists():
+                source.rename(damaged.with_name(damaged.name + suffix))
+        return damaged
+
+    def _migrate(self) -> None:
+        """Bring the database schema up to date."""
+        version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        for index, script in enumerate(_MIGRATIONS[version:], version + 1):
+            with self._connection:
+                self._connection.executescript(script)
+                self._connection.execute(f"PRAGMA user_version = {index}")
+
+    def _create_search_index(self) -> bool:
+        """Create the full-text index if it doesn't exist yet.
+
+        Existing messages are indexed once, when the index is created.
+
+        Returns:
+            Whether full-text search is available
+        """
+        exists = self._connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+        ).fetchone()
+        if exists:
+            return True
+        try:
+            self._connection.executescript(f"BEGIN; {_SEARCH_INDEX} COMMIT;")
+        except sqlite3.OperationalError:
+            # No FTS5 in this SQLite build
+            self._connection.rollback()
+            return False
+        return True
+
+    def _import_legacy_history(self, legacy_file: Path) -> None:
+        """Import conversations from the old single-file JSON history, once.
+
+        The JSON file is renamed after a successful import so that it is not
+        imported again. A file that isn't a list of conversations is moved
+        aside like a damaged database, and entries that aren't conversations
+        or messages are skipped.
+        """
+        if not legacy_file.exists():
+            return
+
+        try:
+            with open(legacy_file, "r") as f:
+                history = json.load(f)
+        except IOError:
+            return
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            history = None
+        if not isinstance(history, list):
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            legacy_file.rename(legacy_file.with_name(f"{legacy_file.name}.corrupt-{timestamp}"))
+            return
+
+        with self._connection:
+            for conversation in history:
+                if not isinstance(conversation, dict):
+                    continue
+                messages = []
+                msg_list = conversation.get("messages")
+                for msg_data in msg_list if isinstance(msg_list, list) else []:
+                    if not isinstance(msg_data, dict):
+                        continue
+                    content = msg_data.get("content", "")
+                    try:
+                        role = Role(msg_data.get("role"))
+                    except ValueError:
+                        continue
+                    if isinstance(content, str):
+                        messages.append(Message(role=role, content=content))
+
+                now = datetime.now().isoformat()
+                cursor = self._connection.execute(
+                    "INSERT INTO conversations (model_id, model_name, provider, created, last_updated)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (
+                        _text(conversation, "model_id", ""),
+                        _text(conversation, "model_name", ""),
+                        _text(conversation, "provider", ""),
+                        _text(conversation, "created", now),
+                        _text(conversation, "last_updated", now),
+                    ),
+                )
+                self._insert_messages(cursor.lastrowid, 0, messages, touch=False)
+
+        legacy_file.rename(legacy_file.with_suffix(".json.migrated"))
+
+    def latest_conversation(self, model_id: str) -> Conversation | None:
+        """Get the most recently updated conversation with a model.
+
+        Args:
+            model_id: ID of the model
+
+        Returns:
+            The conversation, or None if there is none
+        """
+        row = self._connection.execute(
+            "SELECT * FROM conversations WHERE model_id = ? ORDER BY last_updated DESC LIMIT 1",
+            (model_id,),
+        ).fetchone()
+        return Conversation(**row) if row else None
+
+    def get_conversation(self, conversation_id: int) -> Conversation | None:
+        """Get a conversation by its ID.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            The conversation, or None if there is none
+        """
+        row = self._connection.execute(
+            "SELECT * FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        return Conversation(**row) if row else None
+
+    def find_session(self, model_id: str, name: str) -> Conversation | None:
+        """Get the conversation with a model that has the given session name.
+
+        Args:
+            model_id: ID of the model
+            name: Name of the session
+
+        Returns:
+            The conversation, or None if there is none
+        """
+        row = self._connection.execute(
+            "SELECT * FROM conversations WHERE model_id = ? AND name = ?", (model_id, name)
+        ).fetchone()
+        return Conversation(**row) if row else None
+
+    def list_conversations(self, model_id: str, limit: int = 20) -> list[Conversation]:
+        """List the most recently updated conversations with a model.
+
+        Only the conversations' metadata is read, not their messages.
+
+        Args:
+            model_id: ID of the model
+            limit: Maximum number of conversations to return
+
+        Returns:
+            The conversations, most recently updated first
+        """
+        rows = self._connection.execute(
+            "SELECT * FROM conversations WHERE model_id = ? ORDER BY last_updated DESC LIMIT ?",
+            (model_id, limit),
+        )
+        return [Conversation(**row) for row in rows]
+
+    def load_messages(self, conversation_id: int) -> list[Message]:
+        """Load the messages of a conversation in order.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            The stored messages
+        """
+        messages = []
+        rows = self._connection.execute(
+            "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY position",
+            (conversation_id,),
+        )
+        for row in rows:
+            try:
+                messages.append(Message(role=Role(row["role"]), content=row["content"]))
+            except ValueError:
+                # Skip invalid messages
+                continue
+        return messages
+
+    def create_conversation(
+        self, model_config: ModelConfig, name: str | None = None
+    ) -> Conversation:
+        """Create a new, empty conversation.
+
+        Args:
+            model_config: Configuration of the model the conversation is with
+            name: Session name, unique among the conversations with the model
+
+        Returns:
+            The new conversation
+
+        Raises:
+            sqlite3.IntegrityError: If a session with the name already exists
+        """
+        now = datetime.now().isoformat()
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO conversations"
+                " (model_id, model_name, provider, created, last_updated, name)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (model_config.id, model_config.name, model_config.provider.value, now, now, name),
+            )
+        return Conversation(
+            id=cursor.lastrowid or 0,
+            model_id=model_config.id,
+            model_name=model_config.name,
+            provider=model_config.provider.value,
+            message_count=0,
+            created=now,
+            last_updated=now,
+            name=name,
+        )
+
+    def append_messages(self, conversation_id: int, messages: list[Message]) -> None:
+        """Append messages to the end of a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+            messages: The new messages
+        """
+        with self._connection:
+            row = self._connection.execute(
+                "SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            self._insert_messages(conversation_id, row["message_count"] if row else 0, messages)
+
+    def replace_messages(self, conversation_id: int, messages: list[Message]) -> None:
+        """Replace all messages of a conversation.
+
+        This is only needed when earlier messages were changed, for example
+        when the conversation is cleared or the system prompt is edited.
+
+        Args:
+            conversation_id: ID of the conversation
+            messages: The complete list of messages
+        """
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM messages WHERE conversation_id = ?", (conversation_id,)
+            )
+            self._insert_messages(conversation_id, 0, messages)
+
+    def save_summary(self, conversation_id: int, summary: str | None, covers: int) -> None:
+        """Store the summary that replaces the first turns of a conversation.
+
+        The summarized messages themselves are kept.
+
+        Args:
+            conversation_id: ID of the conversation
+            summary: The summary text, or None to remove it
+            covers: Number of non-system messages the summary replaces
+        """
+        with self._connection:
+            self._connection.execute(
+                "UPDATE conversations SET summary = ?, summary_covers = ? WHERE id = ?",
+                (summary, covers, conversation_id),
+            )
+
+    def search(self, query: str, model_id: str | None = None, limit: int = 20) -> list[SearchHit]:
+        """Find messages that contain all words of a query.
+
+        With full-text search, hits are ranked by relevance (BM25) and words
+        also match their other forms, like "cache" and "caching". Without it,
+        the most recent matching messages come first.
+
+        Args:
+            query: Words to search for
+            model_id: Only search conversations with this model
+            limit: Maximum number of hits
+
+        Returns:
+            The matching messages, best first
+        """
+        words = query.split()
+        if not words:
+            return []
+
+        filters = ""
+        parameters: list[Any] = []
+        if model_id is not None:
+            filters = " AND c.model_id = ?"
+            parameters.append(model_id)
+
+        if self.full_text_search:
+            # Quote every word so that characters like - or : aren't read as operators
+            match = " ".join('"' + word.replace('"', '""') + '"' for word in words)
+            rows = self._connection.execute(
+                "SELECT m.conversation_id, m.position, m.role,"
+                " snippet(messages_fts, 0, ?, ?, '…', 16) AS snippet,"
+                " c.model_id, c.model_name, c.name AS session, c.last_updated"
+                " FROM messages_fts"
+                " JOIN messages m ON m.id = messages_fts.rowid"
+                " JOIN conversations c ON c.id = m.conversation_id"
+                f" WHERE messages_fts MATCH ?{filters}"
+                " ORDER BY rank LIMIT ?",
+                [HIGHLIGHT_START, HIGHLIGHT_END, match, *parameters, limit],
+            )
+            return [SearchHit(**row) for row in rows]
+
+        conditions = " AND ".join(["m.content LIKE ? ESCAPE '\\'"] * len(words))
+        patterns = ["%" + re.sub(r"([%_\\])", r"\\\1", word) + "%" for word in words]
+        rows = self._connection.execute(
+            "SELECT m.conversation_id, m.position, m.role, m.content AS snippet,"
+            " c.model_id, c.model_name, c.name AS session, c.last_updated"
+            " FROM messages m JOIN conversations c ON c.id = m.conversation_id"
+            f" WHERE {conditions}{filters}"
+            " ORDER BY c.last_updated DESC, m.position DESC LIMIT ?",
+            [*patterns, *parameters, limit],
+        )
+        hits = []
+        for row in rows:
+            hit = SearchHit(**row)
+            hit.snippet = _snippet(hit.snippet, words)
+            hits.append(hit)
+        return hits
+
+    def _insert_messages(
+        self, conversation_id: int | None, start: int, messages: list[Message], touch: bool = True
+    ) -> None:
+        """Insert messages from ``start`` and update the conversation's counters."""
+        rows: list[tuple[Any, ...]] = [
+            (conversation_id, position, message.role.value, message.content)
+            for position, message in enumerate(messages, start)
+        ]
+        self._connection.executemany(
+            "INSERT INTO messages (conversation_id, position, role, content) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        if touch:
+            self._connection.execute(
+                "UPDATE conversations SET message_count = ?, last_updated = ? WHERE id = ?",
+                (start + len(messages), datetime.now().isoformat(), conversation_id),
+            )
+        else:
+            self._connection.execute(
+                "UPDATE conversations SET message_count = ? WHERE id = ?",
+                (start + len(messages), conversation_id),
+            )
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        self._connection.close()
+
+
+def _snippet(content: str, words: list[str], width: int = 120) -> str:
+    """Cut an excerpt around the first of ``words`` in ``content`` and mark the words."""
+    pattern = re.compile("|".join(re.escape(word) for word in words), re.IGNORECASE)
+    match = pattern.search(content)
+    start = max(0, match.start() - width // 2) if match else 0
+    excerpt = content[start : start + width]
+    excerpt = pattern.sub(lambda m: f"{HIGHLIGHT_START}{m.group(0)}{HIGHLIGHT_END}", excerpt)
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if start + width < len(content) else ""
+    return prefix + excerpt + suffix
+
+
+def _text(data: dict[str, Any], key: str, default: str) -> str:
+    """Get a text field of imported JSON, or ``default`` if it is missing or not text."""
+    value = data.get(key)
+    return value if isinstance(value, str) else default
@@ -0,0 +1,151 @@
+"""Background writer that saves conversations without blocking the chat loop."""
+
+import asyncio
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from ..config import ModelConfig
+from ..services import Message
+from .store import ConversationStore
+
+
+@dataclass(eq=False)
+class ConversationRef:
+    """A conversation in the chat, which may not have been written yet."""
+
+    model_config: ModelConfig
+    # Session name, None for unnamed conversations
+    name: str | None = None
+    # Set by the first write, which creates the conversation
+    id: int | None = None
+    # The messages as last written
+    persisted: list[Message] = field(default_factory=list)
+
+
+class HistoryWriter:
+    """Write conversations to the history store from a background task.
+
+    Saving only records a snapshot and returns, so the next prompt never
+    waits for the disk. Snapshots are written in order by a single task, and
+    if several are queued for a conversation, only the latest one is written.
+    The new messages of a snapshot are committed as one SQLite transaction
+    with a full sync: after a crash or Ctrl+C the history is as of the last
+    completed write, so at most the turn being written is lost.
+    """
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        on_error: Callable[[Exception], None] | None = None,
+    ):
+        """Initialize the writer.
+
+        Args:
+            path: Path to the database file, defaults to the history file
+            on_error: Called with the exception when a write fails; the next
+                save of the conversation retries the unwritten messages
+        """
+        # Its own connection, used from one worker thread at a time
+        self.store = ConversationStore(path, check_same_thread=False)
+        self.on_error = on_error
+        self._messages: dict[ConversationRef, list[Message]] = {}
+        self._summaries: dict[ConversationRef, tuple[str | None, int]] = {}
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: asyncio.Task[None] | None = None
+
+    def save(self, conversation: ConversationRef, messages: list[Message]) -> None:
+        """Queue the messages of a conversation to be written.
+
+        Args:
+            conversation: The conversation, created on the first write
+            messages: All of its messages; only the new ones are appended,
+                unless earlier ones were changed
+        """
+        self._messages[conversation] = list(messages)
+        self._schedule()
+
+    def save_summary(self, conversation: ConversationRef, summary: str | None, covers: int) -> None:
+        """Queue the summary of a conversation to be written.
+
+        It is only written once the conversation has been created.
+
+        Args:
+            conversation: The conversation
+            summary: The summary text, or None to remove it
+            covers: Number of non-system messages the summary replaces
+        """
+        self._summaries[conversation] = (summary, covers)
+        self._schedule()
+
+    async def flush(self) -> None:
+        """Wait until everything queued so far has been written."""
+        await self._idle.wait()
+
+    async def close(self) -> None:
+        """Write what is still queued, then close the store."""
+        if self._task is not None:
+            await self.flush()
+            self._task.cancel()
+            self._task = None
+        self.store.close()
+
+    def _schedule(self) -> None:
+        """Wake up the writer task, starting it on first use."""
+        self._idle.clear()
+        self._wakeup.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        """Write queued snapshots until cancelled."""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            messages, self._messages = self._messages, {}
+            summaries, self._summaries = self._summaries, {}
+
+            for conversation in {**messages, **summaries}:
+                try:
+                    await asyncio.to_thread(
+                        self._write,
+                        conversation,
+                        messages.get(conversation),
+                        summaries.get(conversation),
+                    )
+                except Exception as e:
+                    if self.on_error is not None:
+                        self.on_error(e)
+
+            if not self._messages and not self._summaries:
+                self._idle.set()
+
+    def _write(
+        self,
+        conversation: ConversationRef,
+        messages: list[Message] | None,
+        summary: tuple[str | None, int] | None,
+    ) -> None:
+        """Write one conversation's snapshot; runs in a worker thread."""
+        if messages is not None:
+            if conversation.id is None:
+                conversation.id = self.store.create_conversation(
+                    conversation.model_config, conversation.name
+                ).id
+
+            # Only append the messages added since the last write, unless earlier
+            # messages were changed (cleared or a new system prompt)
+            persisted = conversation.persisted
+            if len(persisted) <= len(messages) and all(
+                old is new for old, new in zip(persisted, messages)
+            ):
+                if len(messages) > len(persisted):
+                    self.store.append_messages(conversation.id, messages[len(persisted) :])
+            else:
+                self.store.replace_messages(conversation.id, messages)
+            conversation.persisted = messages
+
+        if summary is not None and conversation.id is not None:
+            self.store.save_summary(conversation.id, *summary)
@@ -1,22 +1,20 @@
 """Main CLI application for CLI AI Chat."""
 
-import asyncio
-from typing import Optional, List, Annotated
+import functools
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Coroutine, Optional, List, Annotated, TypeVar
 
 import typer
-from rich.console import Console
-from rich.table import Table
-from rich.panel import Panel
 
 from .config import (
     ModelConfig,
+    ModelsFileError,
     Provider,
-    AVAILABLE_MODELS,
+    get_available_models,
     get_model_by_id,
     MissingAPIKeyError,
 )
 from .services import get_service_for_model, Message, Role
-from .ui import select_model, ChatInterface, STYLES
 
 
 # Create the Typer app
@@ -26,7 +24,46 @@ app = typer.Typer(
     add_completion=False,
 )
 
-console = Console()
+if TYPE_CHECKING:
+    from rich.console import Console
+
+
+@functools.cache
+def _console() -> "Console":
+    """Get the console, importing Rich only for commands that render output with it."""
+    from rich.console import Console
+
+    return Console()
+
+
+T = TypeVar("T")
+
+
+def _run(main: Coroutine[Any, Any, T]) -> T:
+    """Run a command's coroutine, then close the shared HTTP connection pool."""
+    import asyncio
+
+    async def run_and_close() -> T:
+        try:
+            return await main
+        finally:
+            from .services.transport import aclose_http_clients
+
+            await aclose_http_clients()
+
+    return asyncio.run(run_and_close())
+
+
+@app.callback()
+def load_models_file() -> None:
+    """Read the models file before any command, to report an invalid one cleanly."""
+    try:
+        get_available_models()
+    except ModelsFileError as e:
+        from .ui import STYLES
+
+        _console().print(f"Error: {e}", style=STYLES["error"])
+        raise typer.Exit(1)
 
 
 @app.command("chat")
@@ -55,15 +92,187 @@ def chat_command(
             help="Continue the previous conversation instead of starting a new one",
         ),
     ] = False,
+    session: Annotated[
+        Optional[str],
+        typer.Option(
+            "--session",
+            "-S",
+            help="Continue the named session, or start it if it doesn't exist yet",
+        ),
+    ] = None,
+    cache: Annotated[
+        bool,
+        typer.Option(
+            "--cache",
+            help="Answer repeated requests from the local response cache",
+            envvar="CLIAI_RESPONSE_CACHE",
+        ),
+    ] = False,
+    stats: Annotated[
+        bool,
+        typer.Option(
+            "--stats",
+            help="Show latency and token statistics after each response",
+            envvar="CLIAI_STATS",
+        ),
+    ] = False,
+    metrics_log: Annotated[
+        bool,
+        typer.Option(
+            "--metrics-log",
+            help="Append request metrics to metrics.jsonl in the cache directory",
+            envvar="CLIAI_METRICS_LOG",
+        ),
+    ] = False,
+    prefetch: Annotated[
+        bool,
+        typer.Option(
+            "--prefetch/--no-prefetch",
+            help=(
+                "Warm up the connection and prompt cache while you type; priming Claude's "
+                "prompt cache is a billed one-token request"
+            ),
+            envvar="CLIAI_PREFETCH",
+        ),
+    ] = True,
+    scroll: Annotated[
+        bool,
+        typer.Option(
+            "--scroll",
+            help="Print long replies as they stream instead of redrawing them in a box",
+            envvar="CLIAI_SCROLL",
+        ),
+    ] = False,
+    tee: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--tee",
+            help="Append the raw text of every reply to this file as it streams",
+            dir_okay=False,
+        ),
+    ] = None,
 ) -> None:
     """Start a chat session with an AI model."""
     # Default is to start a new conversation, unless --continue is specified
-    asyncio.run(_chat_async(model, system, not continue_conversation))
+    try:
+        _run(
+            _chat_async(
+                model,
+                system,
+                not continue_conversation,
+                cache,
+                stats,
+                metrics_log,
+                prefetch,
+                session,
+                scroll=scroll,
+                tee=tee,
+            )
+        )
+    except KeyboardInterrupt:
+        # Ctrl+C while waiting for input cancels the event loop
+        from .ui import STYLES
+
+        _console().print("\nExiting chat.", style=STYLES["info"])
+
+
+@app.command("ask")
+def ask_command(
+    prompt: Annotated[
+        Optional[str],
+        typer.Argument(help="The prompt; read from stdin when omitted or '-'"),
+    ] = None,
+    model: Annotated[
+        Optional[str],
+        typer.Option(
+            "--model",
+            "-m",
+            help="Model ID to use, the default model if not given",
+        ),
+    ] = None,
+    system: Annotated[
+        Optional[str],
+        typer.Option(
+            "--system",
+            "-s",
+            help="System message",
+        ),
+    ] = None,
+    json_events: Annotated[
+        bool,
+        typer.Option(
+            "--json",
+            help="Write one JSON event per line instead of the plain answer",
+        ),
+    ] = False,
+    cache: Annotated[
+        bool,
+        typer.Option(
+            "--cache",
+            help="Answer repeated requests from the local response cache",
+            envvar="CLIAI_RESPONSE_CACHE",
+        ),
+    ] = False,
+    metrics_log: Annotated[
+        bool,
+        typer.Option(
+            "--metrics-log",
+            help="Append request metrics to metrics.jsonl in the cache directory",
+            envvar="CLIAI_METRICS_LOG",
+        ),
+    ] = False,
+) -> None:
+    """Answer one prompt on stdout as it streams, for scripts and pipelines.
+
+    With --json, each line is an event: {"type": "chunk", "text": ...} for
+    every chunk, then {"type": "done", ...} with the request metrics, or
+    {"type": "error", "message": ...}.
+    """
+    import sys
+
+    from .config import get_default_model
+
+    if prompt is None or prompt == "-":
+        if sys.stdin.isatty():
+            print("Error: no prompt given as an argument or on stdin", file=sys.stderr)
+            raise typer.Exit(2)
+        prompt = sys.stdin.read()
+    if not prompt.strip():
+        print("Error: the prompt is empty", file=sys.stderr)
+        raise typer.Exit(2)
+
+    model_config = get_model_by_id(model) if model else get_default_model()
+    if model_config is None:
+        print(f"Error: unknown model {model!r}", file=sys.stderr)
+        raise typer.Exit(2)
+
+    messages = [Message(role=Role.USER, content=prompt)]
+    if system:
+        messages.insert(0, Message(role=Role.SYSTEM, content=system))
+
+    from .services.usage import current_session
+
+    current_session.set("ask")
+    try:
+        succeeded = _run(_ask_async(model_config, messages, json_events, cache, metrics_log))
+    except BrokenPipeError:
+        # The reader went away, e.g. `cliai ask ... | head`; silence the
+        # error Python would report when flushing stdout at exit
+        import os
+
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        raise typer.Exit(1)
+    except KeyboardInterrupt:
+        raise typer.Exit(130)
+    if not succeeded:
+        raise typer.Exit(1)
 
 
 @app.command("models")
 def models_command() -> None:
     """List all available AI models."""
+    from rich.table import Table
+
     table = Table(title="Available Models")
 
     table.add_column("Model ID", style="bold")
@@ -71,7 +280,7 @@ def models_command() -> None:
     table.add_column("Provider", style="cyan")
     table.add_column("Description")
 
-    for model in AVAILABLE_MODELS:
+    for model in get_available_models():
         provider_style = model.provider.value.lower()
 
         table.add_row(
@@ -81,11 +290,433 @@ def models_command() -> None:
             model.description,
         )
 
-    console.print(table)
+    _console().print(table)
+
+
+@app.command("batch")
+def batch_command(
+    input_file: Annotated[
+        Path,
+        typer.Argument(
+            help="JSONL file with one request per line",
+            exists=True,
+            dir_okay=False,
+        ),
+    ],
+    output_file: Annotated[
+        Path,
+        typer.Option(
+            "--output",
+            "-o",
+            help="JSONL file that receives the results",
+        ),
+    ],
+    model: Annotated[
+        Optional[str],
+        typer.Option(
+            "--model",
+            "-m",
+            help="Model ID for requests that don't specify one",
+        ),
+    ] = None,
+    concurrency: Annotated[
+        int,
+        typer.Option(
+            "--concurrency",
+            "-j",
+            help="Maximum number of requests in flight",
+            min=1,
+        ),
+    ] = 8,
+    resume: Annotated[
+        bool,
+        typer.Option(
+            "--resume/--overwrite",
+            help="Skip requests that already have a response in the output file",
+        ),
+    ] = True,
+    cache: Annotated[
+        bool,
+        typer.Option(
+            "--cache",
+            help="Answer repeated requests from the local response cache",
+            envvar="CLIAI_RESPONSE_CACHE",
+        ),
+    ] = False,
+    metrics_log: Annotated[
+        bool,
+        typer.Option(
+            "--metrics-log",
+            help="Append request metrics to metrics.jsonl in the cache directory",
+            envvar="CLIAI_METRICS_LOG",
+        ),
+    ] = False,
+) -> None:
+    """Run a JSONL file of requests without the interactive interface."""
+    from .batch import BatchRunner, drop_partial_line, read_completed_ids, read_requests
+    from .services.usage import current_session
+    from .ui import STYLES
+
+    try:
+        requests = read_requests(input_file, model)
+    except (ValueError, KeyError) as e:
+        _console().print(f"Error: invalid input file: {e}", style=STYLES["error"])
+        raise typer.Exit(1)
+
+    completed: set[str] = set()
+    if resume:
+        # An interrupted run may have left half a line at the end
+        drop_partial_line(output_file)
+        completed = read_completed_ids(output_file)
+    mode = "a" if resume else "w"
+    current_session.set("batch")
+
+    with open(output_file, mode, encoding="utf-8") as output:
+        runner = BatchRunner(concurrency=concurrency, cache=cache, metrics_log=metrics_log)
+        summary = _run(runner.run(requests, output, completed))
+
+    _console().print(
+        f"{summary.succeeded} succeeded, {summary.failed} failed, "
+        f"{summary.skipped} skipped (of {summary.total}). Results in {output_file}"
+    )
+    for error in summary.errors[:10]:
+        _console().print(f"  {error}", style=STYLES["error"])
+    if summary.failed:
+        raise typer.Exit(1)
+
+
+@app.command("compare")
+def compare_command(
+    prompt: Annotated[str, typer.Argument(help="The prompt to send to every model")],
+    models: Annotated[
+        List[str],
+        typer.Option(
+            "--model",
+            "-m",
+            help="Model ID to include; repeat for each model",
+        ),
+    ],
+    system: Annotated[
+        Optional[str],
+        typer.Option(
+            "--system",
+            "-s",
+            help="System message sent to every model",
+        ),
+    ] = None,
+    race: Annotated[
+        bool,
+        typer.Option(
+            "--race",
+            help="Only show the first model to finish and cancel the others",
+        ),
+    ] = False,
+    first_chunk: Annotated[
+        bool,
+        typer.Option(
+            "--first-chunk",
+            help="With --race, pick the first model to start answering instead",
+        ),
+    ] = False,
+) -> None:
+    """Send one prompt to several models at once and compare the answers."""
+    from .services.usage import current_session
+    from .ui import STYLES
+
+    model_configs = []
+    for model_id in models:
+        model_config = get_model_by_id(model_id)
+        if model_config is None:
+            _console().print(f"Error: unknown model {model_id!r}", style=STYLES["error"])
+            raise typer.Exit(1)
+        model_configs.append(model_config)
+
+    messages = [Message(role=Role.USER, content=prompt)]
+    if system:
+        messages.insert(0, Message(role=Role.SYSTEM, content=system))
+
+    current_session.set("compare")
+    _run(_compare_async(model_configs, messages, race, first_chunk))
+
+
+@app.command("cache")
+def cache_command(
+    clear: Annotated[
+        bool,
+        typer.Option(
+            "--clear",
+            help="Remove all cached responses and reset the statistics",
+        ),
+    ] = False,
+) -> None:
+    """Show response cache statistics."""
+    from rich.table import Table
+
+    from .services.cache import ResponseCache
+
+    cache = ResponseCache()
+    try:
+        if clear:
+            cache.clear()
+            _console().print("Response cache cleared.")
+            return
+
+        stats = cache.stats()
+        table = Table(title="Response Cache")
+        table.add_column("Entries", justify="right")
+        table.add_column("Size", justify="right")
+        table.add_column("Hits", justify="right")
+        table.add_column("Misses", justify="right")
+        table.add_column("Hit rate", justify="right")
+        table.add_row(
+            str(stats.entries),
+            f"{stats.size_bytes / 2**20:.1f} MB",
+            str(stats.hits),
+            str(stats.misses),
+            f"{stats.hit_rate:.0%}",
+        )
+        _console().print(table)
+    finally:
+        cache.close()
+
+
+@app.command("usage")
+def usage_command(
+    by: Annotated[
+        str,
+        typer.Option(
+            "--by",
+            help="Group requests by model, day or session",
+        ),
+    ] = "model",
+    days: Annotated[
+        int,
+        typer.Option(
+            "--days",
+            help="Only count requests from the last N days; 0 counts all",
+            min=0,
+        ),
+    ] = 30,
+) -> None:
+    """Show the tokens, cost and peak rates of recorded requests."""
+    import time
+
+    from rich.table import Table
+
+    from .services.usage import UsageLedger
+    from .ui import STYLES
+
+    if by not in ("model", "day", "session"):
+        _console().print(f"Error: can't group by {by!r}", style=STYLES["error"])
+        raise typer.Exit(2)
+
+    ledger = UsageLedger()
+    try:
+        summaries = ledger.summarize(by, since=time.time() - days * 86400 if days else None)
+    finally:
+        ledger.close()
+    if not summaries:
+        _console().print("No requests recorded.")
+        return
+
+    period = f"last {days} days" if days else "all time"
+    table = Table(title=f"Usage by {by}, {period}")
+    table.add_column(by.capitalize())
+    for column in ("Requests", "Errors", "Input", "Cached", "Output", "Cost", "TTFT"):
+        table.add_column(column, justify="right")
+    table.add_column("Peak RPM", justify="right")
+    table.add_column("Peak TPM", justify="right")
+    for summary in summaries:
+        ttft = summary.time_to_first_token
+        table.add_row(
+            summary.key,
+            str(summary.requests),
+            str(summary.errors),
+            f"{summary.input_tokens:,}",
+            f"{summary.cache_read_tokens + summary.cache_write_tokens:,}",
+            f"{summary.output_tokens:,}",
+            f"${summary.cost:.4f}",
+            f"{ttft * 1000:.0f} ms" if ttft is not None else "-",
+            str(summary.peak_requests_per_minute),
+            f"{summary.peak_tokens_per_minute:,}",
+        )
+    if len(summaries) > 1:
+        table.add_section()
+        table.add_row(
+            "Total",
+            str(sum(summary.requests for summary in summaries)),
+            str(sum(summary.errors for summary in summaries)),
+            f"{sum(summary.input_tokens for summary in summaries):,}",
+            f"{sum(s.cache_read_tokens + s.cache_write_tokens for s in summaries):,}",
+            f"{sum(summary.output_tokens for summary in summaries):,}",
+            f"${sum(summary.cost for summary in summaries):.4f}",
+        )
+    _console().print(table)
+
+
+@app.command("search")
+def search_command(
+    query: Annotated[str, typer.Argument(help="Words to search for")],
+    model: Annotated[
+        Optional[str],
+        typer.Option(
+            "--model",
+            "-m",
+            help="Only search conversations with this model",
+        ),
+    ] = None,
+    limit: Annotated[
+        int,
+        typer.Option(
+            "--limit",
+            "-n",
+            help="Maximum number of results",
+        ),
+    ] = 20,
+    open_hit: Annotated[
+        Optional[int],
+        typer.Option(
+            "--open",
+            help="Continue the conversation of result N in a chat",
+        ),
+    ] = None,
+) -> None:
+    """Search the messages of all saved conversations."""
+    import time
+
+    from rich.markup import escape
+    from rich.table import Table
+    from rich.text import Text
+
+    from .history import HIGHLIGHT_END, HIGHLIGHT_START, ConversationStore
+    from .ui import STYLES
+
+    store = ConversationStore()
+    try:
+        start = time.perf_counter()
+        hits = store.search(query, model_id=model, limit=limit)
+        elapsed = time.perf_counter() - start
+    finally:
+        store.close()
+
+    if open_hit is not None:
+        if not 1 <= open_hit <= len(hits):
+            _console().print(f"There is no result {open_hit}.", style=STYLES["error"])
+            raise typer.Exit(1)
+        hit = hits[open_hit - 1]
+        _run(_chat_async(hit.model_id, conversation_id=hit.conversation_id))
+        return
+
+    if not hits:
+        _console().print("No messages found.", style=STYLES["info"])
+        return
+
+    table = Table(title=f"Results for '{escape(query)}'")
+    table.add_column("#", justify="right", style="bold")
+    table.add_column("Conversation")
+    table.add_column("Model", style="cyan")
+    table.add_column("Updated")
+    table.add_column("Match")
+    for index, hit in enumerate(hits, 1):
+        snippet = Text(f"{hit.role}: ", style="dim")
+        for part_index, part in enumerate(hit.snippet.replace("\n", " ").split(HIGHLIGHT_START)):
+            if part_index:
+                highlighted, _, part = part.partition(HIGHLIGHT_END)
+                snippet.append(highlighted, style=STYLES["selected"])
+            snippet.append(part)
+        table.add_row(
+            str(index),
+            escape(hit.session or str(hit.conversation_id)),
+            hit.model_name,
+            hit.last_updated[:10],
+            snippet,
+        )
+    _console().print(table)
+    _console().print(
+        f"{len(hits)} results in {elapsed * 1000:.1f} ms. "
+        "Continue one with `cliai search QUERY --open N`.",
+        style=STYLES["info"],
+    )
+
+
+daemon_app = typer.Typer(
+    help="Keep models and connections warm in a background process used by other commands",
+)
+app.add_typer(daemon_app, name="daemon")
+
+
+@daemon_app.command("start")
+def daemon_start_command(
+    foreground: Annotated[
+        bool,
+        typer.Option(
+            "--foreground",
+            help="Run the daemon in this process instead of in the background",
+        ),
+    ] = False,
+) -> None:
+    """Start the daemon. While it runs, ask, chat and compare send requests through it."""
+    from .daemon import DaemonError, DaemonServer, is_daemon_running, start_daemon_process
+    from .ui import STYLES
+
+    if is_daemon_running():
+        _console().print("The daemon is already running.", style=STYLES["info"])
+        return
+
+    try:
+        if foreground:
+            _run(DaemonServer().serve())
+        else:
+            pid = start_daemon_process()
+            _console().print(f"Daemon started (pid {pid}).", style=STYLES["success"])
+    except DaemonError as e:
+        _console().print(f"Error: {e}", style=STYLES["error"])
+        raise typer.Exit(1)
+
+
+@daemon_app.command("stop")
+def daemon_stop_command() -> None:
+    """Stop the daemon."""
+    from .daemon import DaemonError, send_command
+    from .ui import STYLES
+
+    try:
+        reply = send_command("shutdown")
+    except DaemonError:
+        _console().print("The daemon is not running.", style=STYLES["info"])
+        return
+    _console().print(f"Daemon stopped (pid {reply['pid']}).", style=STYLES["success"])
+
+
+@daemon_app.command("status")
+def daemon_status_command() -> None:
+    """Show whether the daemon is running and which models it has loaded."""
+    from .config import get_daemon_socket
+    from .daemon import DaemonError, send_command
+    from .ui import STYLES
+
+    try:
+        reply = send_command("ping")
+    except DaemonError:
+        _console().print("The daemon is not running.", style=STYLES["info"])
+        raise typer.Exit(1)
+    models = ", ".join(reply["models"]) or "none yet"
+    _console().print(f"Daemon running (pid {reply['pid']}) on {get_daemon_socket()}")
+    _console().print(f"Loaded models: {models}")
 
 
 async def _chat_async(
-    model_id: Optional[str] = None, system_message: Optional[str] = None, new: bool = False
+    model_id: Optional[str] = None,
+    system_message: Optional[str] = None,
+    new: bool = False,
+    cache: bool = False,
+    stats: bool = False,
+    metrics_log: bool = False,
+    prefetch: bool = True,
+    session: Optional[str] = None,
+    conversation_id: Optional[int] = None,
+    scroll: bool = False,
+    tee: Optional[Path] = None,
 ) -> None:
     """Run the chat interface asynchronously.
 
@@ -93,16 +724,47 @@ async def _chat_async(
         model_id: Optional model ID to use
         system_message: Optional system message
         new: Whether to start a new conversation
+        cache: Whether to answer repeated requests from the response cache
+        stats: Whether to show latency and token statistics after each response
+        metrics_log: Whether to append request metrics to the metrics log
+        prefetch: Whether to warm up the service while the user is typing
+        session: Name of the session to continue or start
+        conversation_id: ID of a stored conversation to continue
+        scroll: Whether to print long replies as they stream instead of in a box
+        tee: File to append the raw text of every reply to
     """
+    # The chat UI is imported here so that commands which don't need it,
+    # like `cliai models`, start faster
+    from rich.panel import Panel
+
+    from .ui import select_model, ChatInterface, STYLES
+
     try:
         # Select the model to use
         model_config = select_model(model_id)
 
         # Create the service for the model
-        service = get_service_for_model(model_config)
+        service = get_service_for_model(
+            model_config, cache=cache, metrics_log=metrics_log, daemon=True
+        )
 
         # Create the chat interface
-        chat = ChatInterface(model_config, service, new_conversation=new)
+        # A separate service summarizes old turns in the background, so it
+        # never shares state with a request that is streaming
+        summarizer = get_service_for_model(model_config, daemon=True)
+
+        chat = ChatInterface(
+            model_config,
+            service,
+            new_conversation=new,
+            show_stats=stats,
+            prefetch=prefetch,
+            summarizer=summarizer,
+            session=session,
+            conversation_id=conversation_id,
+            scroll=scroll,
+            tee=tee,
+        )
 
         # Set custom system message if provided
         if system_message:
@@ -116,21 +778,157 @@ async def _chat_async(
             pass
 
     except MissingAPIKeyError as e:
-        console.print(Panel(f"Error: {e}", title="API Key Missing", border_style=STYLES["error"]))
+        _console().print(
+            Panel(f"Error: {e}", title="API Key Missing", border_style=STYLES["error"])
+        )
 
         # Suggest setting up the API key
-        provider_env_var = e._get_env_var_name(e.provider)
-        console.print(
-            f"\nPlease set the {provider_env_var} environment variable or add it to your .env file."
+        _console().print(
+            f"\nPlease set the {e.env_var} environment variable or add it to your .env file."
         )
-        console.print(f"You can get an API key from the {e.provider.value} website.")
+        if e.provider != Provider.LOCAL:
+            _console().print(f"You can get an API key from the {e.provider.value} website.")
 
     except KeyboardInterrupt:
         # Handle Ctrl+C gracefully
-        console.print("\nExiting chat.", style=STYLES["info"])
+        _console().print("\nExiting chat.", style=STYLES["info"])
+
+    except Exception as e:
+        _console().print(f"Error: {e}", style=STYLES["error"])
+
+
+async def _ask_async(
+    model_config: ModelConfig,
+    messages: list[Message],
+    json_events: bool = False,
+    cache: bool = False,
+    metrics_log: bool = False,
+) -> bool:
+    """Stream one answer to stdout without any terminal rendering.
+
+    Every chunk is written and flushed as soon as it arrives. Errors go to
+    stderr, or into the event stream with ``json_events``.
+
+    Args:
+        model_config: The model to ask
+        messages: The conversation to send
+        json_events: Whether to write JSON events instead of the plain answer
+        cache: Whether to answer repeated requests from the response cache
+        metrics_log: Whether to append request metrics to the metrics log
+
+    Returns:
+        Whether the answer was complete
+    """
+    import json
+    import sys
+    from dataclasses import asdict
+
+    from .services.metrics import InstrumentedService, RequestTiming, current_timing
+
+    out = sys.stdout
+    ends_with_newline = True
+
+    def emit(event: dict[str, Any]) -> None:
+        out.write(json.dumps(event) + "\n")
+        out.flush()
+
+    def write(chunk: str) -> None:
+        nonlocal ends_with_newline
+        if json_events:
+            emit({"type": "chunk", "text": chunk})
+        elif chunk:
+            out.write(chunk)
+            out.flush()
+            ends_with_newline = chunk.endswith("\n")
+
+    service = None
+    # Tells which model answers, which the router picks per request
+    timing = RequestTiming()
+    token = current_timing.set(timing)
+    try:
+        service = get_service_for_model(
+            model_config, cache=cache, metrics_log=metrics_log, daemon=True
+        )
+        response = await service.generate_response(messages, stream=True)
+        if isinstance(response, str):
+            write(response)
+        else:
+            async for chunk in response:
+                write(chunk)
+
+    except Exception as e:
+        if json_events:
+            emit({"type": "error", "message": str(e)})
+        else:
+            if not ends_with_newline:
+                out.write("\n")
+                out.flush()
+            print(f"Error: {e}", file=sys.stderr)
+        return False
+    finally:
+        current_timing.reset(token)
+        if service is not None:
+            await service.close()
+
+    if json_events:
+        metrics = service.last_metrics if isinstance(service, InstrumentedService) else None
+        emit(
+            {
+                "type": "done",
+                "model": (timing.model or model_config).id,
+                "metrics": asdict(metrics) if metrics else None,
+            }
+        )
+    elif not ends_with_newline:
+        out.write("\n")
+        out.flush()
+    return True
+
+
+async def _compare_async(
+    model_configs: list[ModelConfig],
+    messages: list[Message],
+    race: bool = False,
+    first_chunk: bool = False,
+) -> None:
+    """Send the messages to several models concurrently.
+
+    Args:
+        model_configs: The models to ask
+        messages: The conversation to send
+        race: Whether to only show the first answer and cancel the rest
+        first_chunk: Whether the race is won by the first chunk instead of
+            the first complete answer
+    """
+    from rich.panel import Panel
+
+    from .ui import STYLES
+    from .ui.compare_view import CompareView, show_race
+
+    services = []
+    try:
+        for model_config in model_configs:
+            services.append(get_service_for_model(model_config, daemon=True))
 
+        if race:
+            # The race closes the losers as soon as it is decided
+            racing, services = services, []
+            winner, _ = await show_race(_console(), racing, messages, first_chunk=first_chunk)
+            services = [winner]
+        else:
+            await CompareView(_console(), services).run(messages)
+
+    except MissingAPIKeyError as e:
+        _console().print(
+            Panel(f"Error: {e}", title="API Key Missing", border_style=STYLES["error"])
+        )
+    except KeyboardInterrupt:
+        _console().print("\nCancelled.", style=STYLES["info"])
     except Exception as e:
-        console.print(f"Error: {e}", style=STYLES["error"])
+        _console().print(f"Error: {e}", style=STYLES["error"])
+    finally:
+        for service in services:
+            await service.close()
 
 
 if __name__ == "__main__":
@@ -1,11 +1,15 @@
 """Service modules for AI model providers."""
 
-from .base import AIService, Message, Role
+from .base import AIService, Message, Role, Usage
 from .factory import get_service_for_model
+from .tokens import TokenCounter, fit_to_context
 
 __all__ = [
     "AIService",
     "Message",
     "Role",
+    "Usage",
     "get_service_for_model",
+    "TokenCounter",
+    "fit_to_context",
 ]
@@ -1,15 +1,24 @@
 from typing import AsyncGenerator, List, Dict, Any
 
 import anthropic
-from anthropic import AsyncAnthropic
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
 
 from ..config import ModelConfig, get_api_key, Provider
-from .base import AIService, Message, Role
+from .base import AIService, Message, Role, Usage
+from .metrics import report_usage
+from .scheduler import estimate_tokens, get_scheduler
+from .transport import get_http_client, prewarm_connection
+
+
+# Shortest prompt prefix, in tokens, that Anthropic writes to the prompt cache
+_MIN_CACHEABLE_TOKENS = 1024
 
 
 class AnthropicService(AIService):
     """Service for Anthropic Claude models."""
 
+    supports_assistant_prefix = True
+
     def __init__(self, model_config: ModelConfig):
         """Initialize the Anthropic service.
 
@@ -17,54 +26,178 @@ class AnthropicService(AIService):
             model_config: Configuration for the model to use
         """
         self.model_config = model_config
-        api_key = get_api_key(Provider.ANTHROPIC)
-        self.client = AsyncAnthropic(api_key=api_key)
+        api_key = get_api_key(Provider.ANTHROPIC, model_config.api_key_env)
+        # Rate limit retries are handled by the shared scheduler, and
+        # connections come from the pool shared by all services
+        self.http_client = get_http_client(DefaultAsyncHttpxClient)
+        self.client = AsyncAnthropic(
+            api_key=api_key,
+            base_url=model_config.base_url,
+            max_retries=0,
+            http_client=self.http_client,
+        )
+        self.scheduler = get_scheduler()
 
     async def generate_response(
         self, messages: list[Message], stream: bool = True
     ) -> AsyncGenerator[str, None] | str:
         """Generate a response from the Anthropic model."""
-        anthropic_messages = self._convert_messages(messages)
+        system, anthropic_messages = self._convert_messages(messages)
+        tokens = estimate_tokens(messages, self.model_config.max_tokens)
+        self.last_usage = None
 
         if stream:
-            return self._stream_response(anthropic_messages)
+            return self._stream_response(system, anthropic_messages, tokens)
         else:
-            return await self._complete_response(anthropic_messages)
+            return await self._complete_response(system, anthropic_messages, tokens)
+
+    def _request_params(
+        self, system: list[dict[str, Any]], anthropic_messages: list[dict[str, Any]]
+    ) -> dict[str, Any]:
+        """Build the parameters shared by streamed and complete requests."""
+        params: dict[str, Any] = {
+            "model": self.model_config.id,
+            "messages": anthropic_messages,
+            "max_tokens": self.model_config.max_tokens,
+        }
+        if system:
+            params["system"] = system
+        return params
 
-    async def _complete_response(self, anthropic_messages: list[dict[str, Any]]) -> str:
+    async def _complete_response(
+        self, system: list[dict[str, Any]], anthropic_messages: list[dict[str, Any]], tokens: int
+    ) -> str:
         """Get a complete response from the model."""
-        response = await self.client.messages.create(
-            model=self.model_config.id,
-            messages=anthropic_messages,
-            max_tokens=self.model_config.max_tokens,
+        params = self._request_params(system, anthropic_messages)
+        response = await self.scheduler.call(
+            Provider.ANTHROPIC,
+            self.model_config.id,
+            lambda: self.client.messages.create(**params),
+            tokens=tokens,
         )
+        self.last_usage = _usage(response.usage)
+        report_usage(self.last_usage)
         return response.content[0].text
 
     async def _stream_response(
-        self, anthropic_messages: list[dict[str, Any]]
+        self, system: list[dict[str, Any]], anthropic_messages: list[dict[str, Any]], tokens: int
     ) -> AsyncGenerator[str, None]:
         """Stream a response from the model."""
-        stream = await self.client.messages.create(
-            model=self.model_config.id,
-            messages=anthropic_messages,
-            max_tokens=self.model_config.max_tokens,
-            stream=True,
+        params = self._request_params(system, anthropic_messages)
+        stream = self.scheduler.stream(
+            Provider.ANTHROPIC,
+            self.model_config.id,
+            lambda: self.client.messages.create(**params, stream=True),
+            tokens=tokens,
         )
 
+        usage = Usage()
         async for chunk in stream:
-            if chunk.type == "content_block_delta" and chunk.delta.text:
+            if chunk.type == "content_block_delta" and getattr(chunk.delta, "text", None):
                 yield chunk.delta.text
+            elif chunk.type == "message_start":
+                start_usage = chunk.message.usage
+                usage.input_tokens = start_usage.input_tokens
+                usage.cache_read_tokens = start_usage.cache_read_input_tokens or 0
+                usage.cache_write_tokens = start_usage.cache_creation_input_tokens or 0
+            elif chunk.type == "message_delta":
+                usage.output_tokens = chunk.usage.output_tokens
+                self.last_usage = usage
+                report_usage(usage)
+
+    async def warmup(self, messages: list[Message]) -> None:
+        """Open a connection and prime the prompt cache with the conversation so far.
+
+        Once the conversation is long enough to be cached, a one-token request
+        with the same prefix as the next turn writes it to the prompt cache,
+        so the real request only has to read it. The warmup pays for writing
+        the whole prompt to the cache, at the cache write price, plus one
+        output token. The real request would otherwise pay for that write, so
+        it is only wasted if no request follows before the cache entry
+        expires. Its usage is reported for the warmup like a request's.
+        """
+        await prewarm_connection(self.http_client, str(self.client.base_url))
+        if estimate_tokens(messages, 0) < _MIN_CACHEABLE_TOKENS:
+            return
+
+        # The next request adds a user message, and the cache breakpoint goes
+        # on the message before it; a placeholder puts it in the same place
+        placeholder = Message(role=Role.USER, content=".")
+        system, anthropic_messages = self._convert_messages([*messages, placeholder])
+        params = self._request_params(system, anthropic_messages)
+        params["max_tokens"] = 1
+        response = await self.scheduler.call(
+            Provider.ANTHROPIC,
+            self.model_config.id,
+            lambda: self.client.messages.create(**params),
+            tokens=estimate_tokens(messages, 1),
+        )
+        report_usage(_usage(response.usage))
 
-    def _convert_messages(self, messages: list[Message]) -> list[dict[str, Any]]:
-        """Convert our message format to Anthropic's format."""
-        result = []
-        for message in messages:
-            # Anthropic doesn't have a direct system message,
-            # so we'll convert system messages to user messages for now
-            role = "user" if message.role == Role.SYSTEM else message.role.value
-            result.append({"role": role, "content": message.content})
-        return result
+    def _convert_messages(
+        self, messages: list[Message]
+    ) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+        """Convert our message format to Anthropic's format.
+
+        System messages go into the separate system prompt. Prompt cache
+        breakpoints are placed at the end of the system prompt and at the
+        end of the conversation before the newest user message, so each
+        turn reads everything up to the previous turn from the cache.
+
+        Returns:
+            The system prompt blocks and the conversation messages
+        """
+        system: list[dict[str, Any]] = [
+            {"type": "text", "text": message.content}
+            for message in messages
+            if message.role == Role.SYSTEM and message.content
+        ]
+        if system:
+            system[-1]["cache_control"] = {"type": "ephemeral"}
+
+        conversation = [message for message in messages if message.role != Role.SYSTEM]
+        last_user = max(
+            (i for i, message in enumerate(conversation) if message.role == Role.USER),
+            default=-1,
+        )
+
+        result: list[dict[str, Any]] = []
+        for index, message in enumerate(conversation):
+            content = message.content
+            if index == len(conversation) - 1 and message.role == Role.ASSISTANT:
+                # A trailing assistant message is continued by the model, and
+                # the API rejects one that ends in whitespace
+                content = content.rstrip()
+
+            if index == last_user - 1:
+                result.append(
+                    {
+                        "role": message.role.value,
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": content,
+                                "cache_control": {"type": "ephemeral"},
+                            }
+                        ],
+                    }
+                )
+            else:
+                result.append({"role": message.role.value, "content": content})
+        return system, result
 
     async def close(self) -> None:
         """Close the Anthropic client."""
-        await self.client.close()
+        # Closing the SDK client would close the shared connection pool,
+        # which is closed by aclose_http_clients() when the command ends
+        pass
+
+
+def _usage(usage: Any) -> Usage:
+    """Convert the usage of a complete Anthropic response."""
+    return Usage(
+        input_tokens=usage.input_tokens,
+        output_tokens=usage.output_tokens,
+        cache_read_tokens=usage.cache_read_input_tokens or 0,
+        cache_write_tokens=usage.cache_creation_input_tokens or 0,
+    )
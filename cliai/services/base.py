@@ -1,8 +1,10 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum, auto
 from typing import AsyncGenerator
 
+from ..config import ModelConfig
+
 
 class Role(str, Enum):
     """Message role in a conversation."""
@@ -18,11 +20,45 @@ class Message:
 
     role: Role
     content: str
+    # (tokenizer, content, token count) of the last count, see TokenCounter
+    token_count_cache: tuple[str, str, int] | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+
+@dataclass
+class Usage:
+    """Token usage a provider reported for one response."""
+
+    # Input tokens, not counting those read from or written to the prompt cache
+    input_tokens: int = 0
+    output_tokens: int = 0
+    # Input tokens read from the provider's prompt cache
+    cache_read_tokens: int = 0
+    # Input tokens written to the provider's prompt cache
+    cache_write_tokens: int = 0
+
+    def __add__(self, other: "Usage") -> "Usage":
+        return Usage(
+            input_tokens=self.input_tokens + other.input_tokens,
+            output_tokens=self.output_tokens + other.output_tokens,
+            cache_read_tokens=self.cache_read_tokens + other.cache_read_tokens,
+            cache_write_tokens=self.cache_write_tokens + other.cache_write_tokens,
+        )
 
 
 class AIService(ABC):
     """Base class for AI model services."""
 
+    model_config: ModelConfig
+
+    # Usage of the most recent response, once the provider has reported it
+    last_usage: Usage | None = None
+
+    # Whether a trailing assistant message is continued by the model instead
+    # of being answered, which allows resuming an interrupted response
+    supports_assistant_prefix: bool = False
+
     @abstractmethod
     async def generate_response(
         self, messages: list[Message], stream: bool = True
@@ -39,7 +75,47 @@ class AIService(ABC):
         """
         pass
 
+    async def warmup(self, messages: list[Message]) -> None:
+        """Prepare for a request that will extend these messages.
+
+        Called while the user is still typing, so that work like connection
+        setup is done before the request is sent. The default does nothing.
+
+        Args:
+            messages: The conversation the next request will extend
+        """
+        pass
+
     @abstractmethod
     async def close(self) -> None:
         """Close any resources used by the service."""
         pass
+
+
+class ServiceWrapper(AIService):
+    """Base class for services that add behaviour around another service."""
+
+    def __init__(self, inner: AIService):
+        """Initialize the wrapper.
+
+        Args:
+            inner: The service to wrap
+        """
+        self.inner = inner
+        self.model_config = inner.model_config
+
+    @property  # type: ignore[override]
+    def supports_assistant_prefix(self) -> bool:
+        return self.inner.supports_assistant_prefix
+
+    @property  # type: ignore[override]
+    def last_usage(self) -> Usage | None:
+        return self.inner.last_usage
+
+    async def warmup(self, messages: list[Message]) -> None:
+        """Warm up the wrapped service."""
+        await self.inner.warmup(messages)
+
+    async def close(self) -> None:
+        """Close the wrapped service."""
+        await self.inner.close()
@@ -0,0 +1,234 @@
+"""On-disk cache of model responses."""
+
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncGenerator
+
+from ..config import ModelConfig, get_cache_dir, get_number_setting
+from .base import AIService, Message, ServiceWrapper, Usage
+from .metrics import report_usage
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model_id TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_by_access ON responses (last_access);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# Splits a cached response into word-sized chunks when it is replayed
+_REPLAY_CHUNK = re.compile(r"\s*\S+|\s+")
+
+
+@dataclass
+class CacheStats:
+    """Usage statistics of the response cache."""
+
+    hits: int
+    misses: int
+    entries: int
+    size_bytes: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def cache_key(model_config: ModelConfig, messages: list[Message], **params: object) -> str:
+    """Build a stable key for a request.
+
+    Args:
+        model_config: Configuration of the model the request is sent to
+        messages: The messages of the request
+        **params: Any other generation parameters that affect the response
+
+    Returns:
+        A hex digest identifying the request
+    """
+    data = {
+        "provider": model_config.provider.value,
+        "model": model_config.id,
+        "max_tokens": model_config.max_tokens,
+        "messages": [[message.role.value, message.content] for message in messages],
+        "params": params,
+    }
+    encoded = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Store complete responses, evicting the least recently used ones.
+
+    Entries older than ``max_age`` seconds are dropped, and the least
+    recently used entries are dropped when the cache grows beyond
+    ``max_bytes``.
+    """
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        max_bytes: int | None = None,
+        max_age: float | None = None,
+    ):
+        """Open the response cache.
+
+        Args:
+            path: Database file, defaults to responses.sqlite3 in the cache directory
+            max_bytes: Maximum total size of cached responses, from CLIAI_CACHE_MAX_MB by default
+            max_age: Maximum age of an entry in seconds, from CLIAI_CACHE_MAX_AGE_DAYS by default
+        """
+        self.path = path or get_cache_dir() / "responses.sqlite3"
+        self.max_bytes = max_bytes or int(get_number_setting("CLIAI_CACHE_MAX_MB", 100) * 2**20)
+        self.max_age = max_age or get_number_setting("CLIAI_CACHE_MAX_AGE_DAYS", 30) * 86400
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def _count(self, name: str) -> None:
+        self._connection.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1)"
+            " ON CONFLICT (name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, key: str) -> str | None:
+        """Look up a response and record the hit or miss."""
+        now = time.time()
+        with self._connection:
+            row = self._connection.execute(
+                "SELECT response FROM responses WHERE key = ? AND created >= ?",
+                (key, now - self.max_age),
+            ).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+
+            self._count("hits")
+            self._connection.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (now, key)
+            )
+            return str(row[0])
+
+    def put(self, key: str, model_id: str, response: str) -> None:
+        """Store a response and evict old entries if needed."""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses"
+                " (key, model_id, response, size, created, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_id, response, size, now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        """Drop expired entries, then least recently used ones until under the size limit."""
+        self._connection.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age,))
+
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._connection.execute("SELECT key, size FROM responses ORDER BY last_access")
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def stats(self) -> CacheStats:
+        """Get hit and size statistics of the cache."""
+        counters = dict(self._connection.execute("SELECT name, value FROM stats").fetchall())
+        entries, size = self._connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        return CacheStats(
+            hits=counters.get("hits", 0),
+            misses=counters.get("misses", 0),
+            entries=entries,
+            size_bytes=size,
+        )
+
+    def clear(self) -> None:
+        """Remove all cached responses and reset the statistics."""
+        with self._connection:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.execute("DELETE FROM stats")
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        self._connection.close()
+
+
+class CachedService(ServiceWrapper):
+    """Answer repeated requests from a response cache.
+
+    Cached responses are replayed in word-sized chunks through the same
+    streaming interface, so callers can't tell a hit from a live response.
+    Only responses that were received completely are stored.
+    """
+
+    def __init__(self, inner: AIService, cache: ResponseCache | None = None):
+        """Initialize the service.
+
+        Args:
+            inner: The service to wrap
+            cache: The cache to use, the default on-disk cache if not given
+        """
+        super().__init__(inner)
+        self.cache = cache or ResponseCache()
+
+    async def generate_response(
+        self, messages: list[Message], stream: bool = True
+    ) -> AsyncGenerator[str, None] | str:
+        """Generate a response, from the cache if possible."""
+        key = cache_key(self.model_config, messages)
+        cached = self.cache.get(key)
+
+        if cached is not None:
+            # A cached response doesn't use any tokens
+            report_usage(Usage())
+            return self._replay(cached) if stream else cached
+
+        response = await self.inner.generate_response(messages, stream=stream)
+        if isinstance(response, str):
+            self.cache.put(key, self.model_config.id, response)
+            return response
+        return self._record(key, response)
+
+    async def _replay(self, response: str) -> AsyncGenerator[str, None]:
+        """Yield a cached response in chunks."""
+        for match in _REPLAY_CHUNK.finditer(response):
+            yield match.group()
+
+    async def _record(
+        self, key: str, stream: AsyncGenerator[str, None]
+    ) -> AsyncGenerator[str, None]:
+        """Pass a streamed response through and store it once it is complete."""
+        chunks = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        self.cache.put(key, self.model_config.id, "".join(chunks))
+
+    async def close(self) -> None:
+        """Close the wrapped service and the cache."""
+        await super().close()
+        self.cache.close()
@@ -0,0 +1,136 @@
+"""Replace old turns of a long conversation with a rolling summary."""
+
+from dataclasses import dataclass
+
+from ..config import ModelConfig, get_number_setting
+from .base import AIService, Message, Role
+from .tokens import TokenCounter
+
+
+SUMMARY_INSTRUCTIONS = (
+    "You keep a running summary of a conversation between a user and an AI assistant. "
+    "Merge the existing summary, if there is one, with the new messages into a single "
+    "updated summary. Keep the facts, decisions, names, numbers, code identifiers and open "
+    "questions the assistant may need later, and leave out pleasantries. Write concise notes "
+    "in the language of the conversation."
+)
+
+
+@dataclass
+class Summary:
+    """A summary that stands in for the first turns of a conversation."""
+
+    text: str
+    # Number of non-system messages, from the start, that the summary replaces
+    covers: int
+
+
+def compaction_threshold(model_config: ModelConfig) -> int:
+    """Get the conversation size, in tokens, above which old turns are summarized.
+
+    Set with CLIAI_COMPACT_TOKENS; by default half the context window, at
+    most 32000 tokens.
+    """
+    default = min(model_config.context_window // 2, 32000)
+    return int(get_number_setting("CLIAI_COMPACT_TOKENS", default))
+
+
+def apply_summary(messages: list[Message], summary: Summary | None) -> list[Message]:
+    """Get the messages to send, with the summarized turns replaced by the summary.
+
+    The summary becomes a system message after the existing system messages,
+    so it stays part of the stable prefix that providers can cache.
+    """
+    if summary is None:
+        return messages
+    system = [message for message in messages if message.role == Role.SYSTEM]
+    conversation = [message for message in messages if message.role != Role.SYSTEM]
+    summary_message = Message(
+        role=Role.SYSTEM,
+        content=f"Summary of the earlier part of this conversation:\n\n{summary.text}",
+    )
+    return [*system, summary_message, *conversation[summary.covers :]]
+
+
+def plan_compaction(
+    messages: list[Message],
+    summary: Summary | None,
+    counter: TokenCounter,
+    threshold: int,
+) -> int | None:
+    """Decide how many turns a new summary should cover.
+
+    Nothing is compacted while the messages that would be sent stay under
+    ``threshold`` tokens. Otherwise the newest turns worth about a quarter of
+    the threshold are kept, and the summary covers everything before them.
+    The kept part always starts with a user message.
+
+    Returns:
+        The number of non-system messages the new summary should cover, or
+        None if no compaction is needed
+    """
+    if counter.count(apply_summary(messages, summary)) <= threshold:
+        return None
+
+    conversation = [message for message in messages if message.role != Role.SYSTEM]
+    covered = summary.covers if summary else 0
+    keep_tokens = threshold // 4
+
+    kept = 0
+    cut = len(conversation)
+    for index in range(len(conversation) - 1, covered - 1, -1):
+        kept += counter.count_message(conversation[index])
+        if kept > keep_tokens:
+            break
+        cut = index
+
+    # Keep whole turns: the kept part starts at a user message
+    while cut < len(conversation) and conversation[cut].role != Role.USER:
+        cut += 1
+    # Always keep the newest turn
+    last_user = max(
+        (i for i, message in enumerate(conversation) if message.role == Role.USER), default=0
+    )
+    cut = min(cut, last_user)
+    return cut if cut > covered else None
+
+
+async def summarize(
+    service: AIService,
+    messages: list[Message],
+    summary: Summary | None,
+    covers: int,
+) -> Summary:
+    """Ask the model for a summary that covers the first ``covers`` turns.
+
+    Only the turns the existing summary doesn't cover yet are sent, together
+    with that summary.
+
+    Args:
+        service: The service to ask
+        messages: The complete conversation
+        summary: The current summary, if any
+        covers: Number of non-system messages the new summary should cover
+
+    Returns:
+        The new summary
+    """
+    conversation = [message for message in messages if message.role != Role.SYSTEM]
+    new_messages = conversation[summary.covers if summary else 0 : covers]
+
+    transcript = "\n\n".join(
+        f"{'User' if message.role == Role.USER else 'Assistant'}: {message.content}"
+        for message in new_messages
+    )
+    prompt = f"New messages:\n\n{transcript}"
+    if summary:
+        prompt = f"Existing summary:\n\n{summary.text}\n\n{prompt}"
+
+    request = [
+        Message(role=Role.SYSTEM, content=SUMMARY_INSTRUCTIONS),
+        Message(role=Role.USER, content=prompt),
+    ]
+    response = await service.generate_response(request, stream=False)
+    if not isinstance(response, str):
+        response = "".join([chunk async for chunk in response])
+    return Summary(text=response.strip(), covers=covers)
@@ -1,27 +1,100 @@
+from typing import Callable
+
 from ..config import ModelConfig, Provider
 from .base import AIService
-from .openai_service import OpenAIService
-from .anthropic_service import AnthropicService
-from .google_service import GoogleService
+from .metrics import InstrumentedService, MetricsLog, RequestMetrics
+from .registry import create_service
+from .resilience import ResilientService
 
 
-def get_service_for_model(model_config: ModelConfig) -> AIService:
+def get_service_for_model(
+    model_config: ModelConfig,
+    cache: bool = False,
+    metrics_log: bool = False,
+    daemon: bool = False,
+    usage_ledger: bool = True,
+) -> AIService:
     """Create an AI service for the specified model.
 
+    The service is created by the model's backend, see
+    :mod:`cliai.services.registry`; backends are imported on demand, so only
+    the SDK of the selected provider is loaded. The service is wrapped with
+    timeouts and retries, and every request is measured. The auto model gets
+    a router, which picks one of the other models for each request.
+
     Args:
         model_config: Configuration for the model to use
+        cache: Whether to answer repeated requests from the response cache
+        metrics_log: Whether to append request metrics to the metrics log
+        daemon: Whether to send requests through the background daemon when
+            it is running, instead of calling the provider in this process
+        usage_ledger: Whether to record the usage of each request in the usage ledger
 
     Returns:
         An appropriate AIService instance for the model
 
     Raises:
-        ValueError: If the provider is not supported
+        ValueError: If the model's backend doesn't exist
     """
-    if model_config.provider == Provider.OPENAI:
-        return OpenAIService(model_config)
-    elif model_config.provider == Provider.ANTHROPIC:
-        return AnthropicService(model_config)
-    elif model_config.provider == Provider.GOOGLE:
-        return GoogleService(model_config)
-    else:
-        raise ValueError(f"Unsupported provider: {model_config.provider}")
+    if model_config.provider == Provider.AUTO:
+        # The models the router picks log their own metrics and usage
+        return InstrumentedService(
+            _create_router(model_config, cache, metrics_log, daemon, usage_ledger)
+        )
+
+    service: AIService | None = None
+    if daemon:
+        from ..daemon import RemoteService, is_daemon_running
+
+        if is_daemon_running():
+            service = RemoteService(model_config, cache=cache)
+
+    if service is None:
+        service = _create_local_service(model_config, cache)
+
+    sinks: list[Callable[[RequestMetrics], None]] = []
+    if metrics_log:
+        sinks.append(MetricsLog())
+    if usage_ledger:
+        from .usage import get_usage_ledger
+
+        sinks.append(get_usage_ledger())
+
+    return InstrumentedService(service, sinks)
+
+
+def _create_local_service(model_config: ModelConfig, cache: bool) -> AIService:
+    """Create the provider's service with timeouts, retries and the optional cache."""
+    service = ResilientService(create_service(model_config))
+
+    if cache:
+        from .cache import CachedService
+
+        service = CachedService(service)
+
+    return service
+
+
+def _create_router(
+    model_config: ModelConfig, cache: bool, metrics_log: bool, daemon: bool, usage_ledger: bool
+) -> AIService:
+    """Create the router with the optional cache.
+
+    It fails over between the services of the models it picks, which have
+    their own timeouts and retries, so it isn't wrapped with them again.
+    """
+    from .router import RouterService
+
+    service: AIService = RouterService(
+        model_config,
+        lambda config: get_service_for_model(
+            config, metrics_log=metrics_log, daemon=daemon, usage_ledger=usage_ledger
+        ),
+    )
+
+    if cache:
+        from .cache import CachedService
+
+        service = CachedService(service)
+
+    return service
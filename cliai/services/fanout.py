@@ -0,0 +1,132 @@
+"""Send one conversation to several services at once."""
+
+import asyncio
+from typing import AsyncGenerator
+
+from .base import AIService, Message
+
+
+async def _close_all(services: list[AIService]) -> None:
+    """Close services, ignoring errors from ones that were cancelled mid-request."""
+    for service in services:
+        try:
+            await service.close()
+        except Exception:
+            pass
+
+
+async def _collect(service: AIService, messages: list[Message]) -> str:
+    """Get the complete response of one service."""
+    response = await service.generate_response(messages, stream=True)
+    if isinstance(response, str):
+        return response
+
+    chunks = []
+    try:
+        async for chunk in response:
+            chunks.append(chunk)
+    finally:
+        await response.aclose()
+    return "".join(chunks)
+
+
+async def race_complete(
+    services: list[AIService], messages: list[Message]
+) -> tuple[AIService, str]:
+    """Return the first complete response and cancel the other requests.
+
+    Services that lose the race, or fail, are closed. The winner is left
+    open and must be closed by the caller.
+
+    Raises:
+        Exception: The last error if every service failed
+    """
+    tasks = {asyncio.create_task(_collect(service, messages)): service for service in services}
+    pending = set(tasks)
+    error: BaseException | None = None
+    winner: asyncio.Task[str] | None = None
+
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                elif winner is None:
+                    winner = task
+    finally:
+        losers = [task for task in tasks if task is not winner]
+        for task in losers:
+            task.cancel()
+        await asyncio.gather(*losers, return_exceptions=True)
+        await _close_all([tasks[task] for task in losers])
+
+    if winner is None:
+        raise error or RuntimeError("No service returned a response")
+    return tasks[winner], winner.result()
+
+
+async def race_first_chunk(
+    services: list[AIService], messages: list[Message]
+) -> tuple[AIService, AsyncGenerator[str, None]]:
+    """Stream the response of whichever service sends its first chunk first.
+
+    The other requests are cancelled and their services closed as soon as
+    the winner is known. The winner is left open and must be closed by the
+    caller.
+
+    Raises:
+        Exception: The last error if every service failed before its first chunk
+    """
+
+    async def first_chunk(service: AIService) -> tuple[str, AsyncGenerator[str, None] | None]:
+        response = await service.generate_response(messages, stream=True)
+        if isinstance(response, str):
+            return response, None
+        try:
+            return await response.__anext__(), response
+        except BaseException:
+            await response.aclose()
+            raise
+
+    tasks = {asyncio.create_task(first_chunk(service)): service for service in services}
+    pending = set(tasks)
+    error: BaseException | None = None
+    winner: asyncio.Task[tuple[str, AsyncGenerator[str, None] | None]] | None = None
+
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                elif winner is None:
+                    winner = task
+    finally:
+        losers = [task for task in tasks if task is not winner]
+        for task in losers:
+            task.cancel()
+        results = await asyncio.gather(*losers, return_exceptions=True)
+        # A loser may have finished at the same time as the winner
+        for result in results:
+            if isinstance(result, tuple) and result[1] is not None:
+                await result[1].aclose()
+        await _close_all([tasks[task] for task in losers])
+
+    if winner is None:
+        raise error or RuntimeError("No service returned a response")
+
+    first, rest = winner.result()
+
+    async def stream() -> AsyncGenerator[str, None]:
+        # Also close the winning response when the caller stops reading early
+        try:
+            yield first
+            if rest is not None:
+                async for chunk in rest:
+                    yield chunk
+        finally:
+            if rest is not None:
+                await rest.aclose()
+
+    return tasks[winner], stream()
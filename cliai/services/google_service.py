@@ -1,14 +1,35 @@
+import os
+from dataclasses import dataclass
 from typing import AsyncGenerator, Any, Awaitable, Callable
 
 import google.generativeai as genai
 from google.generativeai.types import GenerationConfig
 
 from ..config import ModelConfig, get_api_key, Provider
-from .base import AIService, Message, Role
+from .base import AIService, Message, Role, Usage
+from .metrics import report_usage
+from .scheduler import estimate_tokens, get_scheduler
+
+
+@dataclass
+class _ChatSession:
+    """A Gemini chat session and the conversation its history holds."""
+
+    chat: genai.ChatSession
+    system_instruction: str | None
+    # (role, content) of the messages in the chat session's history
+    messages: list[tuple[Role, str]]
 
 
 class GoogleService(AIService):
-    """Service for Google Gemini models."""
+    """Service for Google Gemini models.
+
+    A chat session is kept between requests, so each turn only converts and
+    adds the new user message. A request takes the session while it runs and
+    gives it back when it succeeds; concurrent requests, and conversations
+    that no longer match the session, for example after it was cleared or
+    trimmed, get a new one.
+    """
 
     def __init__(self, model_config: ModelConfig):
         """Initialize the Google service.
@@ -17,65 +38,168 @@ class GoogleService(AIService):
             model_config: Configuration for the model to use
         """
         self.model_config = model_config
-        api_key = get_api_key(Provider.GOOGLE)
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(
+        api_key = get_api_key(Provider.GOOGLE, model_config.api_key_env)
+        genai.configure(api_key=api_key, **_endpoint_options())
+        self.scheduler = get_scheduler()
+
+        self._system_instruction: str | None = None
+        self.model = self._create_model(None)
+        # The session of the latest successful request, unless a request is using it
+        self._session: _ChatSession | None = None
+
+    def _create_model(self, system_instruction: str | None) -> genai.GenerativeModel:
+        """Create the model client with a native system instruction."""
+        return genai.GenerativeModel(
             model_name=self.model_config.id,
             generation_config=GenerationConfig(
                 max_output_tokens=self.model_config.max_tokens,
             ),
+            system_instruction=system_instruction,
         )
 
     async def generate_response(
         self, messages: list[Message], stream: bool = True
     ) -> AsyncGenerator[str, None] | str:
         """Generate a response from the Google model."""
-        google_messages = self._convert_messages(messages)
+        session, prompt = self._take_session(messages)
+        tokens = estimate_tokens(messages, self.model_config.max_tokens)
+        self.last_usage = None
 
         if stream:
-            return self._stream_response(google_messages)
+            return self._stream_response(session, prompt, tokens)
         else:
-            return await self._complete_response(google_messages)
+            return await self._complete_response(session, prompt, tokens)
 
-    async def _complete_response(self, google_messages: list[dict[str, Any]]) -> str:
+    async def _complete_response(self, session: _ChatSession, prompt: str, tokens: int) -> str:
         """Get a complete response from the model."""
-        chat = self.model.start_chat(history=google_messages)
-        response = await chat.send_message_async("")
-        return response.text
+        response = await self.scheduler.call(
+            Provider.GOOGLE,
+            self.model_config.id,
+            lambda: session.chat.send_message_async(prompt),
+            tokens=tokens,
+        )
+        text = response.text
+
+        self._record_usage(response.usage_metadata)
+        self._give_back(session, prompt, text)
+        return text
 
     async def _stream_response(
-        self, google_messages: list[dict[str, Any]]
+        self, session: _ChatSession, prompt: str, tokens: int
     ) -> AsyncGenerator[str, None]:
         """Stream a response from the model."""
-        chat = self.model.start_chat(history=google_messages)
+        stream = self.scheduler.stream(
+            Provider.GOOGLE,
+            self.model_config.id,
+            lambda: session.chat.send_message_async(prompt, stream=True),
+            tokens=tokens,
+        )
 
-        async for chunk in chat.send_message_async("", stream=True):
+        chunks = []
+        usage_metadata = None
+        # An interrupted stream leaves the session history incomplete, so the
+        # session is only given back once the stream is complete
+        async for chunk in stream:
             if chunk.text:
+                chunks.append(chunk.text)
                 yield chunk.text
+            # Running totals; the last chunk has the final ones
+            if chunk.usage_metadata.total_token_count:
+                usage_metadata = chunk.usage_metadata
+
+        if usage_metadata is not None:
+            self._record_usage(usage_metadata)
+        self._give_back(session, prompt, "".join(chunks))
+
+    def _record_usage(self, usage_metadata: Any) -> None:
+        """Keep the token usage of a response; Gemini counts cached tokens as input."""
+        cached = usage_metadata.cached_content_token_count
+        self.last_usage = Usage(
+            input_tokens=usage_metadata.prompt_token_count - cached,
+            output_tokens=usage_metadata.candidates_token_count,
+            cache_read_tokens=cached,
+        )
+        report_usage(self.last_usage)
 
-    def _convert_messages(self, messages: list[Message]) -> list[dict[str, Any]]:
-        """Convert our message format to Google's format."""
-        result = []
+    def _take_session(self, messages: list[Message]) -> tuple[_ChatSession, str]:
+        """Get a chat session holding all but the last message, and the last message.
 
-        # Handle system message separately
-        system_messages = [m for m in messages if m.role == Role.SYSTEM]
-        user_messages = [m for m in messages if m.role != Role.SYSTEM]
+        Leading system messages become the model's system instruction. The
+        kept session is taken when its history is exactly the conversation,
+        so no other request can use it at the same time; otherwise a new
+        session is started.
+        """
+        system_count = 0
+        while system_count < len(messages) and messages[system_count].role == Role.SYSTEM:
+            system_count += 1
+
+        system_instruction = "\n\n".join(m.content for m in messages[:system_count]) or None
+        history = messages[system_count:-1]
+        prompt = messages[-1].content if len(messages) > system_count else ""
+        history_messages = [(message.role, message.content) for message in history]
+
+        session, self._session = self._session, None
+        if (
+            session is not None
+            and session.system_instruction == system_instruction
+            and session.messages == history_messages
+        ):
+            return session, prompt
+
+        if system_instruction != self._system_instruction:
+            self._system_instruction = system_instruction
+            self.model = self._create_model(system_instruction)
+        chat = self.model.start_chat(history=self._convert_messages(history))
+        return _ChatSession(chat, system_instruction, history_messages), prompt
+
+    def _give_back(self, session: _ChatSession, prompt: str, response: str) -> None:
+        """Keep a session whose request succeeded for the next turn of its conversation."""
+        session.messages += [(Role.USER, prompt), (Role.ASSISTANT, response)]
+        self._session = session
 
-        # Add system message as a parameter if present
-        if system_messages:
-            # For now we just use the first system message
-            system_content = system_messages[0].content
-        else:
-            system_content = None
+    def _convert_messages(self, messages: list[Message]) -> list[dict[str, Any]]:
+        """Convert our message format to Google's format.
 
-        # Convert remaining messages
-        for message in user_messages:
-            role = "user" if message.role == Role.USER else "model"
+        System messages are sent as the system instruction and are not
+        expected here; any that appear mid-conversation are sent as user
+        messages.
+        """
+        result = []
+        for message in messages:
+            role = "model" if message.role == Role.ASSISTANT else "user"
             result.append({"role": role, "parts": [message.content]})
-
         return result
 
     async def close(self) -> None:
         """Close the Google client."""
         # Google Generative AI client doesn't need explicit closing
         pass
+
+
+def _endpoint_options() -> dict[str, Any]:
+    """Get client options for the Gemini API endpoint set with GOOGLE_API_ENDPOINT.
+
+    ``host:port`` is used over TLS like the real API; ``http://host:port``
+    is used without TLS, for local mock servers such as the one in
+    ``benchmarks``.
+    """
+    endpoint = os.getenv("GOOGLE_API_ENDPOINT", "").strip().rstrip("/")
+    if not endpoint:
+        return {}
+    if not endpoint.startswith("http://"):
+        return {"client_options": {"api_endpoint": endpoint.removeprefix("https://")}}
+
+    from google.ai.generativelanguage_v1beta.services.generative_service.transports import (
+        GenerativeServiceGrpcAsyncIOTransport,
+    )
+    from grpc import aio
+
+    def plaintext_transport(**kwargs: Any) -> GenerativeServiceGrpcAsyncIOTransport:
+        return GenerativeServiceGrpcAsyncIOTransport(
+            channel=lambda host, **_: aio.insecure_channel(host), **kwargs
+        )
+
+    return {
+        "client_options": {"api_endpoint": endpoint.removeprefix("http://")},
+        "transport": plaintext_transport,
+    }
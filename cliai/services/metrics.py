@@ -0,0 +1,291 @@
+"""Latency and throughput instrumentation for AI services."""
+
+import json
+import time
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import AsyncGenerator, Callable
+
+from ..config import ModelConfig, get_cache_dir
+from .base import AIService, Message, ServiceWrapper, Usage
+
+
+@dataclass
+class RequestTiming:
+    """Timestamps that services record while a request is in progress."""
+
+    # time.monotonic() when the provider accepted the request
+    connected: float | None = None
+    # Tokens the provider reported, summed over retries
+    usage: Usage | None = None
+    # The model that answered, when the router picked one
+    model: ModelConfig | None = None
+    # The timing of the enclosing measurement, which is told all of the above
+    # as well, e.g. the caller's timing of a request made through the router
+    parent: "RequestTiming | None" = None
+
+
+# The timing of the request being made in the current task, if it is measured
+current_timing: ContextVar[RequestTiming | None] = ContextVar("current_timing", default=None)
+
+
+def mark_connected() -> None:
+    """Record that the provider accepted the current request."""
+    now = time.monotonic()
+    timing = current_timing.get()
+    while timing is not None:
+        if timing.connected is None:
+            timing.connected = now
+        timing = timing.parent
+
+
+def report_usage(usage: Usage) -> None:
+    """Record the token usage the provider reported for the current request.
+
+    Unlike a service's ``last_usage``, this is kept per request, so it stays
+    correct when several requests share a service.
+    """
+    _add_usage(current_timing.get(), usage)
+
+
+def report_model(model: ModelConfig) -> None:
+    """Record which model answers the current request, for services that pick one."""
+    timing = current_timing.get()
+    while timing is not None:
+        timing.model = model
+        timing = timing.parent
+
+
+def _add_usage(timing: RequestTiming | None, usage: Usage) -> None:
+    """Add token usage to a timing and the timings enclosing it."""
+    while timing is not None:
+        timing.usage = usage if timing.usage is None else timing.usage + usage
+        timing = timing.parent
+
+
+def _percentile(values: list[float], percent: float) -> float | None:
+    """Get a percentile of ``values`` by the nearest-rank method."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, round(percent / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+@dataclass
+class RequestMetrics:
+    """Performance measurements of one request."""
+
+    model_id: str
+    provider: str
+    # Unix time the request started
+    timestamp: float
+    stream: bool
+    # Seconds until the provider accepted the request
+    connect_time: float | None = None
+    # Seconds until the first chunk of the response
+    time_to_first_token: float | None = None
+    # Seconds until the response was complete
+    duration: float = 0.0
+    chunks: int = 0
+    chunks_per_second: float | None = None
+    # Percentiles of the seconds between two chunks
+    inter_chunk_p50: float | None = None
+    inter_chunk_p90: float | None = None
+    inter_chunk_p99: float | None = None
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+    cache_read_tokens: int | None = None
+    cache_write_tokens: int | None = None
+    error: str | None = None
+    # Whether this was a billed warmup while the user was typing, e.g. to
+    # prime the prompt cache, rather than a request for an answer
+    warmup: bool = False
+
+    def status_line(self) -> str:
+        """Summarize the measurements in one line for the chat interface."""
+        parts = []
+        if self.connect_time is not None:
+            parts.append(f"connect {self.connect_time:.2f}s")
+        if self.time_to_first_token is not None:
+            parts.append(f"TTFT {self.time_to_first_token:.2f}s")
+        if self.inter_chunk_p50 is not None and self.inter_chunk_p99 is not None:
+            parts.append(
+                f"gap p50 {self.inter_chunk_p50 * 1000:.0f}ms p99 {self.inter_chunk_p99 * 1000:.0f}ms"
+            )
+        if self.chunks_per_second is not None:
+            parts.append(f"{self.chunks_per_second:.1f} chunks/s")
+        if self.input_tokens is not None:
+            tokens = f"{self.input_tokens} in / {self.output_tokens} out tokens"
+            if self.cache_read_tokens:
+                tokens += f" ({self.cache_read_tokens} cached)"
+            parts.append(tokens)
+        parts.append(f"total {self.duration:.2f}s")
+        return " · ".join(parts)
+
+
+class MetricsLog:
+    """Append request metrics to a JSONL file."""
+
+    def __init__(self, path: Path | None = None):
+        """Initialize the log.
+
+        Args:
+            path: File to append to, defaults to metrics.jsonl in the cache directory
+        """
+        self.path = path or get_cache_dir() / "metrics.jsonl"
+
+    def __call__(self, metrics: RequestMetrics) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(asdict(metrics)) + "\n")
+
+
+class InstrumentedService(ServiceWrapper):
+    """Measure every request made through another service.
+
+    The measurements of the latest request are kept in ``last_metrics`` and
+    passed to each of the sinks when the request finishes. Billed warmup
+    requests are passed to the sinks too.
+    """
+
+    def __init__(
+        self,
+        inner: AIService,
+        sinks: list[Callable[[RequestMetrics], None]] | None = None,
+    ):
+        """Initialize the service.
+
+        Args:
+            inner: The service to wrap
+            sinks: Functions called with the metrics of each finished request
+        """
+        super().__init__(inner)
+        self.sinks = list(sinks or [])
+        self.last_metrics: RequestMetrics | None = None
+
+    async def generate_response(
+        self, messages: list[Message], stream: bool = True
+    ) -> AsyncGenerator[str, None] | str:
+        """Generate a response and measure it."""
+        metrics = RequestMetrics(
+            model_id=self.model_config.id,
+            provider=self.model_config.provider.value,
+            timestamp=time.time(),
+            stream=stream,
+        )
+        timing = RequestTiming(parent=current_timing.get())
+        start = time.monotonic()
+
+        token = current_timing.set(timing)
+        try:
+            response = await self.inner.generate_response(messages, stream=stream)
+        except Exception as e:
+            metrics.error = str(e)
+            self._finish(metrics, timing, start, [])
+            raise
+        finally:
+            current_timing.reset(token)
+
+        if isinstance(response, str):
+            metrics.chunks = 1
+            self._finish(metrics, timing, start, [])
+            return response
+        return self._measure_stream(response, metrics, timing, start)
+
+    async def warmup(self, messages: list[Message]) -> None:
+        """Warm up the wrapped service, recording a billed warmup request like any other.
+
+        Warmups that didn't make a billed request, e.g. only opened a
+        connection, aren't recorded.
+        """
+        metrics = RequestMetrics(
+            model_id=self.model_config.id,
+            provider=self.model_config.provider.value,
+            timestamp=time.time(),
+            stream=False,
+            warmup=True,
+        )
+        timing = RequestTiming(parent=current_timing.get())
+        start = time.monotonic()
+
+        token = current_timing.set(timing)
+        try:
+            await self.inner.warmup(messages)
+        finally:
+            current_timing.reset(token)
+            if timing.usage is not None:
+                self._finish(metrics, timing, start, [])
+
+    async def _measure_stream(
+        self,
+        stream: AsyncGenerator[str, None],
+        metrics: RequestMetrics,
+        timing: RequestTiming,
+        start: float,
+    ) -> AsyncGenerator[str, None]:
+        """Pass a stream through while recording when each chunk arrives."""
+        gaps: list[float] = []
+        previous: float | None = None
+        iterator = stream.__aiter__()
+        try:
+            while True:
+                # Streams usually send the request on the first read, so the
+                # timing is made visible to the provider service for it
+                token = current_timing.set(timing)
+                try:
+                    chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    current_timing.reset(token)
+
+                now = time.monotonic()
+                if previous is None:
+                    metrics.time_to_first_token = now - start
+                else:
+                    gaps.append(now - previous)
+                previous = now
+                metrics.chunks += 1
+                yield chunk
+        except Exception as e:
+            metrics.error = str(e)
+            raise
+        finally:
+            self._finish(metrics, timing, start, gaps)
+
+    def _finish(
+        self, metrics: RequestMetrics, timing: RequestTiming, start: float, gaps: list[float]
+    ) -> None:
+        """Complete the metrics of a request and hand them to the sinks."""
+        metrics.duration = time.monotonic() - start
+        if timing.connected is not None:
+            metrics.connect_time = timing.connected - start
+
+        streaming_time = sum(gaps)
+        if streaming_time > 0:
+            metrics.chunks_per_second = len(gaps) / streaming_time
+        metrics.inter_chunk_p50 = _percentile(gaps, 50)
+        metrics.inter_chunk_p90 = _percentile(gaps, 90)
+        metrics.inter_chunk_p99 = _percentile(gaps, 99)
+
+        usage = timing.usage
+        if usage is None and metrics.error is None:
+            # Services that don't report usage per request only have last_usage
+            usage = self.inner.last_usage
+            if usage is not None:
+                _add_usage(timing.parent, usage)
+        if usage is not None and metrics.error is None:
+            metrics.input_tokens = usage.input_tokens
+            metrics.output_tokens = usage.output_tokens
+            metrics.cache_read_tokens = usage.cache_read_tokens
+            metrics.cache_write_tokens = usage.cache_write_tokens
+
+        if not metrics.warmup:
+            self.last_metrics = metrics
+        for sink in self.sinks:
+            try:
+                sink(metrics)
+            except OSError:
+                # Losing a measurement must never break a request
+                pass
@@ -0,0 +1,33 @@
+from ..config import ModelConfig, get_api_key
+from .openai_service import OpenAIService
+
+
+class OpenAICompatService(OpenAIService):
+    """Service for servers with an OpenAI-compatible API, such as vLLM or llama.cpp.
+
+    Requests go to the model's ``base_url`` through the same shared
+    connection pool and scheduler as OpenAI's, with rate limits and
+    concurrency tracked under the model's provider, usually Local.
+    """
+
+    def __init__(self, model_config: ModelConfig):
+        """Initialize the service.
+
+        Args:
+            model_config: Configuration for the model to use, with a ``base_url``
+
+        Raises:
+            ValueError: If the model has no ``base_url``
+        """
+        if not model_config.base_url:
+            raise ValueError(
+                f"Model {model_config.id} needs a base_url to use an OpenAI-compatible API"
+            )
+        super().__init__(model_config)
+
+    def _get_api_key(self) -> str:
+        """Get the API key from the model's ``api_key_env`` variable, if it has one."""
+        if self.model_config.api_key_env:
+            return get_api_key(self.model_config.provider, self.model_config.api_key_env)
+        # Self-hosted servers usually don't check keys, but the SDK needs one
+        return "none"
@@ -1,10 +1,14 @@
 from typing import AsyncGenerator, Any
 
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from openai.types import CompletionUsage
 from openai.types.chat import ChatCompletionMessageParam
 
 from ..config import ModelConfig, get_api_key, Provider
-from .base import AIService, Message, Role
+from .base import AIService, Message, Role, Usage
+from .metrics import report_usage
+from .scheduler import estimate_tokens, get_scheduler
+from .transport import get_http_client, prewarm_connection
 
 
 class OpenAIService(AIService):
@@ -17,48 +21,104 @@ class OpenAIService(AIService):
             model_config: Configuration for the model to use
         """
         self.model_config = model_config
-        api_key = get_api_key(Provider.OPENAI)
-        self.client = AsyncOpenAI(api_key=api_key)
+        api_key = self._get_api_key()
+        # Rate limit retries are handled by the shared scheduler, and
+        # connections come from the pool shared by all services
+        self.http_client = get_http_client(DefaultAsyncHttpxClient)
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=model_config.base_url,
+            max_retries=0,
+            http_client=self.http_client,
+        )
+        self.scheduler = get_scheduler()
+
+    def _get_api_key(self) -> str:
+        """Get the API key from the environment."""
+        return get_api_key(Provider.OPENAI, self.model_config.api_key_env)
 
     async def generate_response(
         self, messages: list[Message], stream: bool = True
     ) -> AsyncGenerator[str, None] | str:
         """Generate a response from the OpenAI model."""
         openai_messages = self._convert_messages(messages)
+        tokens = estimate_tokens(messages, self.model_config.max_tokens)
+        self.last_usage = None
 
         if stream:
-            return self._stream_response(openai_messages)
+            return self._stream_response(openai_messages, tokens)
         else:
-            return await self._complete_response(openai_messages)
+            return await self._complete_response(openai_messages, tokens)
 
-    async def _complete_response(self, openai_messages: list[ChatCompletionMessageParam]) -> str:
+    async def _complete_response(
+        self, openai_messages: list[ChatCompletionMessageParam], tokens: int
+    ) -> str:
         """Get a complete response from the model."""
-        response = await self.client.chat.completions.create(
-            model=self.model_config.id,
-            messages=openai_messages,
-            stream=False,
+        response = await self.scheduler.call(
+            self.model_config.provider,
+            self.model_config.id,
+            lambda: self.client.chat.completions.create(
+                model=self.model_config.id,
+                messages=openai_messages,
+                stream=False,
+            ),
+            tokens=tokens,
         )
+        if response.usage is not None:
+            self._record_usage(response.usage)
         return response.choices[0].message.content or ""
 
     async def _stream_response(
-        self, openai_messages: list[ChatCompletionMessageParam]
+        self, openai_messages: list[ChatCompletionMessageParam], tokens: int
     ) -> AsyncGenerator[str, None]:
         """Stream a response from the model."""
-        stream = await self.client.chat.completions.create(
-            model=self.model_config.id,
-            messages=openai_messages,
-            stream=True,
+        stream = self.scheduler.stream(
+            self.model_config.provider,
+            self.model_config.id,
+            lambda: self.client.chat.completions.create(
+                model=self.model_config.id,
+                messages=openai_messages,
+                stream=True,
+                # The usage comes in an extra chunk without choices at the end
+                stream_options={"include_usage": True},
+            ),
+            tokens=tokens,
         )
 
         async for chunk in stream:
-            content = chunk.choices[0].delta.content
-            if content:
-                yield content
+            if chunk.choices:
+                content = chunk.choices[0].delta.content
+                if content:
+                    yield content
+            if chunk.usage is not None:
+                self._record_usage(chunk.usage)
+
+    def _record_usage(self, usage: CompletionUsage) -> None:
+        """Keep the token usage of a response; OpenAI counts cached tokens as input."""
+        details = usage.prompt_tokens_details
+        cached = (details.cached_tokens or 0) if details is not None else 0
+        self.last_usage = Usage(
+            input_tokens=usage.prompt_tokens - cached,
+            output_tokens=usage.completion_tokens,
+            cache_read_tokens=cached,
+        )
+        report_usage(self.last_usage)
 
     def _convert_messages(self, messages: list[Message]) -> list[ChatCompletionMessageParam]:
         """Convert our message format to OpenAI's format."""
         return [{"role": message.role.value, "content": message.content} for message in messages]
 
+    async def warmup(self, messages: list[Message]) -> None:
+        """Open a connection to the API before the request is sent.
+
+        OpenAI caches prompt prefixes automatically, but a priming request
+        would be billed at the full input price, so only the connection is
+        warmed up.
+        """
+        await prewarm_connection(self.http_client, str(self.client.base_url))
+
     async def close(self) -> None:
         """Close the OpenAI client."""
-        await self.client.close()
+        # Closing the SDK client would close the shared connection pool,
+        # which is closed by aclose_http_clients() when the command ends
+        pass
@@ -0,0 +1,108 @@
+"""Registry of the backends that create services for models.
+
+A backend is a callable that takes a :class:`ModelConfig` and returns an
+:class:`AIService`, usually the service class itself. Backends are
+registered as ``"module:attribute"`` strings and only imported when a model
+that uses them is selected, so unused providers and their SDKs cost nothing
+at startup.
+
+Other packages can add backends through the ``cliai.providers`` entry point
+group, e.g. in their ``pyproject.toml``::
+
+    [project.entry-points."cliai.providers"]
+    mybackend = "mypackage.service:MyService"
+
+Models then select it with ``backend = "mybackend"`` in the models file.
+"""
+
+import importlib
+from typing import Callable
+
+from ..config import ModelConfig, Provider
+from .base import AIService
+
+ENTRY_POINT_GROUP = "cliai.providers"
+
+Backend = Callable[[ModelConfig], AIService]
+
+_backends: dict[str, str | Backend] = {
+    "openai": "cliai.services.openai_service:OpenAIService",
+    "anthropic": "cliai.services.anthropic_service:AnthropicService",
+    "google": "cliai.services.google_service:GoogleService",
+    "openai-compat": "cliai.services.openai_compat_service:OpenAICompatService",
+}
+
+# The backend used for models that don't name one
+_DEFAULT_BACKENDS = {
+    Provider.OPENAI: "openai",
+    Provider.ANTHROPIC: "anthropic",
+    Provider.GOOGLE: "google",
+    Provider.LOCAL: "openai-compat",
+}
+
+
+def register_backend(name: str, backend: str | Backend) -> None:
+    """Register a backend, replacing any backend with the same name.
+
+    Args:
+        name: Name models refer to it by
+        backend: The backend, or its ``"module:attribute"`` path to import on first use
+    """
+    _backends[name] = backend
+
+
+def backend_name(model_config: ModelConfig) -> str:
+    """Get the name of the backend that serves a model.
+
+    Raises:
+        ValueError: If the model names no backend and its provider has none
+    """
+    if model_config.backend:
+        return model_config.backend
+    if model_config.provider not in _DEFAULT_BACKENDS:
+        raise ValueError(f"No backend serves {model_config.provider.value} models")
+    return _DEFAULT_BACKENDS[model_config.provider]
+
+
+def get_backend(name: str) -> Backend:
+    """Get a backend by name, importing it if needed.
+
+    Raises:
+        ValueError: If no backend of that name is registered or installed
+    """
+    backend = _backends.get(name)
+    if backend is None:
+        backend = _entry_points().get(name)
+        if backend is None:
+            raise ValueError(
+                f"Unknown backend: {name}. Available backends: {', '.join(available_backends())}"
+            )
+    if isinstance(backend, str):
+        module_name, _, attribute = backend.partition(":")
+        backend = getattr(importlib.import_module(module_name), attribute)
+        _backends[name] = backend
+    return backend
+
+
+def available_backends() -> list[str]:
+    """Get the names of the registered and installed backends."""
+    return sorted({*_backends, *_entry_points()})
+
+
+def create_service(model_config: ModelConfig) -> AIService:
+    """Create the service for a model with its backend.
+
+    Raises:
+        ValueError: If the model's backend doesn't exist
+    """
+    return get_backend(backend_name(model_config))(model_config)
+
+
+def _entry_points() -> dict[str, str]:
+    """Get the backends installed by other packages, without importing them."""
+    from importlib.metadata import entry_points
+
+    return {
+        entry_point.name: entry_point.value
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP)
+    }
@@ -0,0 +1,221 @@
+"""Timeouts, retries and stream resumption for AI services."""
+
+import asyncio
+import random
+from dataclasses import dataclass
+from typing import AsyncGenerator, AsyncIterator
+
+from ..config import get_number_setting
+from .base import AIService, Message, Role, ServiceWrapper
+from .scheduler import current_connect_timeout, current_stream_opened, is_overloaded
+
+# SDK exception names that mean the request can safely be sent again
+_RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "InternalServerError",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "RemoteProtocolError",
+    "ReadError",
+    "ReadTimeout",
+    "ConnectError",
+    "ConnectTimeout",
+}
+
+
+@dataclass
+class RetryPolicy:
+    """Timeouts and retry settings for requests to a provider."""
+
+    # Seconds the provider has to accept a streamed request once it is sent
+    connect_timeout: float = 15.0
+    # Seconds until the first chunk of a streamed response arrives
+    first_token_timeout: float = 60.0
+    # Seconds allowed between two chunks of a streamed response
+    read_timeout: float = 60.0
+    # Seconds allowed for a complete, non-streamed response
+    request_timeout: float = 600.0
+    max_retries: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+
+    @classmethod
+    def from_environment(cls) -> "RetryPolicy":
+        """Build a policy from CLIAI_* environment variables, with defaults."""
+        default = cls()
+        return cls(
+            connect_timeout=get_number_setting("CLIAI_CONNECT_TIMEOUT", default.connect_timeout),
+            first_token_timeout=get_number_setting(
+                "CLIAI_FIRST_TOKEN_TIMEOUT", default.first_token_timeout
+            ),
+            read_timeout=get_number_setting("CLIAI_READ_TIMEOUT", default.read_timeout),
+            request_timeout=get_number_setting("CLIAI_REQUEST_TIMEOUT", default.request_timeout),
+            max_retries=int(get_number_setting("CLIAI_MAX_RETRIES", default.max_retries)),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Get a jittered exponential delay before retry number ``attempt``."""
+        delay = min(self.max_delay, self.base_delay * 2**attempt)
+        return random.uniform(delay / 2, delay)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Check whether a failed request can be sent again without side effects.
+
+    Rate limits and overload (429, 503, 529) are not included: the request
+    scheduler already backs off and retries those, and retrying them here as
+    well would multiply the attempts.
+    """
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if is_overloaded(error):
+        return False
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int) and status >= 500:
+        return True
+    return type(error).__name__ in _RETRYABLE_ERROR_NAMES
+
+
+class ResilientService(ServiceWrapper):
+    """Apply timeouts and retries to another service.
+
+    A stream that fails after part of the response was received is resumed
+    when the provider can continue a trailing assistant message: the retry
+    sends the partial text as an assistant prefix and only the continuation
+    is yielded. Otherwise a failure after the first chunk is raised.
+    """
+
+    def __init__(self, inner: AIService, policy: RetryPolicy | None = None):
+        """Initialize the service.
+
+        Args:
+            inner: The service to wrap
+            policy: Timeouts and retry settings, read from the environment by default
+        """
+        super().__init__(inner)
+        self.policy = policy or RetryPolicy.from_environment()
+
+    async def generate_response(
+        self, messages: list[Message], stream: bool = True
+    ) -> AsyncGenerator[str, None] | str:
+        """Generate a response, retrying failures that are safe to retry."""
+        if stream:
+            return self._stream_response(messages)
+        else:
+            return await self._complete_response(messages)
+
+    async def _complete_response(self, messages: list[Message]) -> str:
+        """Get a complete response, retrying on transient errors."""
+        attempt = 0
+        while True:
+            try:
+                response = await asyncio.wait_for(
+                    self.inner.generate_response(messages, stream=False),
+                    self.policy.request_timeout,
+                )
+                if isinstance(response, str):
+                    return response
+                return "".join([chunk async for chunk in response])
+            except Exception as error:
+                if not is_retryable(error) or attempt >= self.policy.max_retries:
+                    raise
+            await asyncio.sleep(self.policy.backoff(attempt))
+            attempt += 1
+
+    async def _stream_response(self, messages: list[Message]) -> AsyncGenerator[str, None]:
+        """Stream a response, resuming it after transient errors where possible."""
+        received: list[str] = []
+        attempt = 0
+
+        while True:
+            request_messages = messages
+            # Leading whitespace to drop from a resumed stream, see below
+            skip_leading_whitespace = False
+
+            if received:
+                # Continue after the text we already have. Providers reject a
+                # prefix that ends in whitespace, so it is trimmed, and the
+                # model will usually produce that whitespace again.
+                prefix = "".join(received)
+                request_messages = messages + [
+                    Message(role=Role.ASSISTANT, content=prefix.rstrip())
+                ]
+                skip_leading_whitespace = prefix != prefix.rstrip()
+
+            iterator: AsyncIterator[str] | None = None
+            try:
+                response = await self.inner.generate_response(request_messages, stream=True)
+                if isinstance(response, str):
+                    yield response
+                    return
+
+                iterator = response.__aiter__()
+                read_chunk = self._first_chunk
+                while True:
+                    try:
+                        chunk = await read_chunk(iterator)
+                    except StopAsyncIteration:
+                        return
+                    read_chunk = self._next_chunk
+
+                    if skip_leading_whitespace:
+                        chunk = chunk.lstrip()
+                        if not chunk:
+                            continue
+                        skip_leading_whitespace = False
+
+                    received.append(chunk)
+                    yield chunk
+
+            except Exception as error:
+                if not is_retryable(error) or attempt >= self.policy.max_retries:
+                    raise
+                if received and not self.inner.supports_assistant_prefix:
+                    raise
+            finally:
+                await _close_iterator(iterator)
+
+            await asyncio.sleep(self.policy.backoff(attempt))
+            attempt += 1
+
+    async def _first_chunk(self, iterator: AsyncIterator[str]) -> str:
+        """Read the first chunk of a stream, which is when the request is sent.
+
+        The scheduler applies the connect timeout to opening the stream. The
+        first token timeout only starts once the stream is open, so waiting
+        for a concurrency slot or backing off from rate limits doesn't count.
+        """
+        opened = asyncio.Event()
+        connect_token = current_connect_timeout.set(self.policy.connect_timeout)
+        opened_token = current_stream_opened.set(opened)
+        try:
+            # The task takes a copy of both settings
+            read = asyncio.ensure_future(iterator.__anext__())
+        finally:
+            current_stream_opened.reset(opened_token)
+            current_connect_timeout.reset(connect_token)
+
+        waiting = asyncio.ensure_future(opened.wait())
+        try:
+            await asyncio.wait([read, waiting], return_when=asyncio.FIRST_COMPLETED)
+            return await asyncio.wait_for(read, self.policy.first_token_timeout)
+        finally:
+            waiting.cancel()
+            if not read.done():
+                read.cancel()
+                await asyncio.wait([read])
+
+    async def _next_chunk(self, iterator: AsyncIterator[str]) -> str:
+        """Read the next chunk of a stream within the read timeout."""
+        return await asyncio.wait_for(iterator.__anext__(), self.policy.read_timeout)
+
+
+async def _close_iterator(iterator: AsyncIterator[str] | None) -> None:
+    """Close an abandoned response stream, ignoring errors from the dead connection."""
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
@@ -0,0 +1,449 @@
+"""Pick a model for each request by price, prompt length and recent latency."""
+
+import asyncio
+import json
+import math
+import os
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, AsyncGenerator, Callable, Coroutine, TypeVar
+
+from ..config import (
+    MissingAPIKeyError,
+    ModelConfig,
+    Provider,
+    get_api_key,
+    get_available_models,
+    get_cache_dir,
+    get_list_setting,
+    get_model_by_id,
+    get_number_setting,
+)
+from .base import AIService, Message
+from .metrics import InstrumentedService, RequestMetrics, report_model
+from .scheduler import estimate_tokens
+
+T = TypeVar("T")
+
+# Weights of the newest sample in the averages of latency and its
+# deviation, as for TCP's round-trip time (RFC 6298)
+_ALPHA = 0.125
+_BETA = 0.25
+# Seconds after which an error rate counts half as much
+_ERROR_HALF_LIFE = 300.0
+# Seconds assumed for models that haven't been measured yet
+_DEFAULT_FIRST_TOKEN = 1.0
+_DEFAULT_DURATION = 10.0
+# Reply length assumed when estimating the price of a request
+_EXPECTED_OUTPUT_TOKENS = 500
+# Models tried for one request, including hedged requests
+_MAX_ATTEMPTS = 3
+_MIN_HEDGE_DELAY = 1.0
+# Seconds to collect the stats of further requests before saving them
+_SAVE_DELAY = 1.0
+
+
+@dataclass
+class ModelStats:
+    """Moving averages of the latency and errors of a model's requests."""
+
+    # Seconds until the first chunk of streamed responses
+    first_token: float | None = None
+    first_token_deviation: float = 0.0
+    # Seconds until complete responses
+    duration: float | None = None
+    duration_deviation: float = 0.0
+    # Share of failed requests, as of ``updated``
+    error_rate: float = 0.0
+    samples: int = 0
+    # Unix time of the latest request
+    updated: float = 0.0
+
+    def latency(self, stream: bool) -> float:
+        """Get the expected seconds until a response starts, or completes if not streamed."""
+        if stream:
+            return _DEFAULT_FIRST_TOKEN if self.first_token is None else self.first_token
+        return _DEFAULT_DURATION if self.duration is None else self.duration
+
+    def hedge_delay(self, stream: bool) -> float:
+        """Get the seconds to wait for a response before also trying another model.
+
+        Like TCP's retransmission timeout, this is the average latency plus
+        four times its average deviation, so a model that is usually fast is
+        given up on sooner.
+        """
+        if stream:
+            mean, deviation = self.first_token, self.first_token_deviation
+        else:
+            mean, deviation = self.duration, self.duration_deviation
+        if mean is None:
+            mean = self.latency(stream)
+            deviation = mean / 2
+        return max(_MIN_HEDGE_DELAY, mean + 4 * deviation)
+
+    def current_error_rate(self, now: float) -> float:
+        """Get the error rate, fading while the model isn't used."""
+        return self.error_rate * math.pow(0.5, max(0.0, now - self.updated) / _ERROR_HALF_LIFE)
+
+    def add(self, metrics: RequestMetrics) -> None:
+        """Update the averages with a finished request."""
+        now = metrics.timestamp + metrics.duration
+        failed = metrics.error is not None
+        self.error_rate = (1 - _ALPHA) * self.current_error_rate(now) + _ALPHA * failed
+        self.samples += 1
+        self.updated = now
+        if failed:
+            return
+
+        if metrics.stream:
+            latency = metrics.time_to_first_token
+            if latency is None:
+                # Cancelled before its first chunk, e.g. by a faster hedged
+                # request: it would have taken at least this long
+                latency = max(metrics.duration, self.first_token or 0.0)
+            self.first_token, self.first_token_deviation = _smooth(
+                self.first_token, self.first_token_deviation, latency
+            )
+        else:
+            self.duration, self.duration_deviation = _smooth(
+                self.duration, self.duration_deviation, metrics.duration
+            )
+
+
+def _smooth(mean: float | None, deviation: float, sample: float) -> tuple[float, float]:
+    """Add a sample to a moving average and its moving average deviation."""
+    if mean is None:
+        return sample, sample / 2
+    deviation = (1 - _BETA) * deviation + _BETA * abs(sample - mean)
+    return (1 - _ALPHA) * mean + _ALPHA * sample, deviation
+
+
+class RoutingStats:
+    """Per-model stats of recent requests, shared by all commands through a file.
+
+    Recording a request only updates the stats in memory; a background task
+    saves them a moment later from a worker thread, so a burst of requests
+    is saved once and the event loop never waits for the disk.
+    """
+
+    def __init__(self, path: Path | None = None):
+        """Load the stats.
+
+        Args:
+            path: JSON file to keep them in, defaults to routing.json in the cache directory
+        """
+        self.path = path or get_cache_dir() / "routing.json"
+        self.models: dict[str, ModelStats] = {}
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self.models = {model_id: ModelStats(**stats) for model_id, stats in data.items()}
+        except (OSError, ValueError, TypeError):
+            # Missing or from another version; the stats are rebuilt as requests are made
+            pass
+        self._changed = False
+        self._flushing = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    def get(self, model_id: str) -> ModelStats:
+        """Get the stats of a model, empty if it hasn't been used yet."""
+        return self.models.get(model_id) or ModelStats()
+
+    def record(self, metrics: RequestMetrics) -> None:
+        """Add the metrics of a finished request and save the stats; used as a metrics sink."""
+        if metrics.warmup:
+            # One-token requests would skew the latency
+            return
+        self.models.setdefault(metrics.model_id, ModelStats()).add(metrics)
+        self._changed = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._save_later())
+
+    async def flush(self) -> None:
+        """Save recorded stats now and wait until they are written."""
+        if self._task is not None:
+            self._flushing.set()
+            await self._task
+            self._flushing.clear()
+
+    async def _save_later(self) -> None:
+        """Save the stats until no more changes are recorded."""
+        while self._changed:
+            try:
+                await asyncio.wait_for(self._flushing.wait(), _SAVE_DELAY)
+            except TimeoutError:
+                pass
+            self._changed = False
+            data = json.dumps({model_id: asdict(stats) for model_id, stats in self.models.items()})
+            try:
+                await asyncio.to_thread(self._write, data)
+            except OSError:
+                # Losing a measurement must never break a request
+                pass
+
+    def _write(self, data: str) -> None:
+        """Write the stats file, replaced at once so other commands never read part of it."""
+        temporary = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        temporary.write_text(data, encoding="utf-8")
+        os.replace(temporary, self.path)
+
+
+def _has_api_key(model: ModelConfig) -> bool:
+    """Check whether the API key a model needs is set."""
+    if model.provider == Provider.LOCAL and not model.api_key_env:
+        return True
+    try:
+        get_api_key(model.provider, model.api_key_env)
+    except (MissingAPIKeyError, ValueError):
+        return False
+    return True
+
+
+def route_candidates() -> list[ModelConfig]:
+    """Get the models the router may pick.
+
+    These are the models listed in CLIAI_ROUTE_MODELS, separated by commas,
+    or else every model whose API key is set.
+
+    Raises:
+        ValueError: If CLIAI_ROUTE_MODELS names an unknown model
+    """
+    model_ids = get_list_setting("CLIAI_ROUTE_MODELS")
+    if not model_ids:
+        return [
+            model
+            for model in get_available_models()
+            if model.provider != Provider.AUTO and _has_api_key(model)
+        ]
+
+    models = []
+    for model_id in model_ids:
+        model = get_model_by_id(model_id)
+        if model is None or model.provider == Provider.AUTO:
+            raise ValueError(f"Unknown model in CLIAI_ROUTE_MODELS: {model_id}")
+        models.append(model)
+    return models
+
+
+def rank_models(
+    models: list[ModelConfig],
+    messages: list[Message],
+    stream: bool,
+    stats: RoutingStats,
+    latency_price: float,
+    now: float | None = None,
+) -> list[ModelConfig]:
+    """Order models from best to worst for a request.
+
+    Models whose context window is too small for the conversation are left
+    out. The others are ordered by the estimated price of the request plus
+    the expected latency valued at ``latency_price``, divided by the share
+    of recent requests that succeeded: the expected cost of an answer.
+
+    Args:
+        models: The models to choose from
+        messages: The conversation to send
+        stream: Whether the response is streamed, so only its start counts
+        stats: Recent latency and errors of the models
+        latency_price: USD a second of waiting is worth
+        now: Unix time, the current time by default
+    """
+    now = time.time() if now is None else now
+    input_tokens = estimate_tokens(messages, 0)
+
+    def cost(model: ModelConfig) -> float:
+        output_tokens = min(model.max_tokens, _EXPECTED_OUTPUT_TOKENS)
+        price = (
+            input_tokens * (model.input_price or 0.0) + output_tokens * (model.output_price or 0.0)
+        ) / 1_000_000
+        model_stats = stats.get(model.id)
+        success_rate = max(0.05, 1 - model_stats.current_error_rate(now))
+        return (price + latency_price * model_stats.latency(stream)) / success_rate
+
+    fitting = [
+        model for model in models if input_tokens + model.max_tokens <= model.context_window
+    ]
+    return sorted(fitting, key=cost)
+
+
+class RouterService(AIService):
+    """Send each request to the model expected to answer it best.
+
+    Models are ranked per request with :func:`rank_models`, from stats of
+    earlier requests that every command records in the cache directory.
+    When a model fails, the request goes to the next one. When it is slow,
+    measured against its own usual latency, the next model is sent the
+    request as well and the first answer wins, which cuts the tail latency
+    when a provider has problems. Up to three models are tried. The model
+    that answers is recorded in the request's timing, see ``report_model``.
+    """
+
+    def __init__(
+        self,
+        model_config: ModelConfig,
+        create_service: Callable[[ModelConfig], AIService],
+        stats: RoutingStats | None = None,
+        candidates: list[ModelConfig] | None = None,
+    ):
+        """Initialize the router.
+
+        Args:
+            model_config: Configuration of the router's model entry
+            create_service: Creates the service for a model it picks
+            stats: Stats of recent requests, loaded from the cache directory by default
+            candidates: Models to pick from, see :func:`route_candidates` for the default
+
+        Raises:
+            ValueError: If there are no models to pick from
+        """
+        self.model_config = model_config
+        self.stats = stats or RoutingStats()
+        self.candidates = route_candidates() if candidates is None else candidates
+        if not self.candidates:
+            raise ValueError("No models to route to; set an API key or CLIAI_ROUTE_MODELS")
+        # USD a second of waiting for an answer is worth
+        self.latency_price = get_number_setting("CLIAI_ROUTE_LATENCY_PRICE", 0.01)
+        self._create_service = create_service
+        self._services: dict[str, AIService] = {}
+
+    def rank(self, messages: list[Message], stream: bool) -> list[ModelConfig]:
+        """Get the models to try for a request, best first.
+
+        Raises:
+            ValueError: If the conversation doesn't fit any of the models
+        """
+        ranked = rank_models(self.candidates, messages, stream, self.stats, self.latency_price)
+        if not ranked:
+            raise ValueError("The conversation is too long for all of the models")
+        return ranked[:_MAX_ATTEMPTS]
+
+    def _service(self, model: ModelConfig) -> AIService:
+        """Get the service of a model, creating it on first use."""
+        service = self._services.get(model.id)
+        if service is None:
+            service = self._services[model.id] = self._create_service(model)
+            if isinstance(service, InstrumentedService):
+                service.sinks.append(self.stats.record)
+        return service
+
+    async def generate_response(
+        self, messages: list[Message], stream: bool = True
+    ) -> AsyncGenerator[str, None] | str:
+        """Generate a response with the best model that answers in time."""
+        models = self.rank(messages, stream)
+
+        if not stream:
+
+            async def complete(service: AIService) -> str:
+                response = await service.generate_response(messages, stream=False)
+                if isinstance(response, str):
+                    return response
+                return "".join([chunk async for chunk in response])
+
+            service, text = await self._hedge(models, complete, stream)
+            report_model(service.model_config)
+            return text
+
+        async def first_chunk(service: AIService) -> tuple[str, AsyncGenerator[str, None] | None]:
+            response = await service.generate_response(messages, stream=True)
+            if isinstance(response, str):
+                return response, None
+            try:
+                return await response.__anext__(), response
+            except StopAsyncIteration:
+                return "", None
+            except BaseException:
+                await response.aclose()
+                raise
+
+        service, (first, rest) = await self._hedge(models, first_chunk, stream)
+        report_model(service.model_config)
+
+        async def stream_response() -> AsyncGenerator[str, None]:
+            try:
+                yield first
+                if rest is not None:
+                    async for chunk in rest:
+                        yield chunk
+            finally:
+                if rest is not None:
+                    await rest.aclose()
+
+        return stream_response()
+
+    async def _hedge(
+        self,
+        models: list[ModelConfig],
+        attempt: Callable[[AIService], Coroutine[Any, Any, T]],
+        stream: bool,
+    ) -> tuple[AIService, T]:
+        """Try the models in order until one answers.
+
+        The next model is tried as soon as one fails, and also when the
+        latest one hasn't answered within its hedge delay; the first answer
+        wins and the other requests are cancelled.
+
+        Raises:
+            Exception: The last error if every model failed
+        """
+        queue = list(models)
+        tasks: dict[asyncio.Task[T], AIService] = {}
+        pending: set[asyncio.Task[T]] = set()
+        error: BaseException | None = None
+        winner: asyncio.Task[T] | None = None
+        delay = 0.0
+
+        def start_next() -> None:
+            nonlocal delay
+            model = queue.pop(0)
+            service = self._service(model)
+            task = asyncio.create_task(attempt(service))
+            tasks[task] = service
+            pending.add(task)
+            delay = self.stats.get(model.id).hedge_delay(stream)
+
+        try:
+            start_next()
+            while pending and winner is None:
+                done, _ = await asyncio.wait(
+                    pending, timeout=delay if queue else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Too slow; send the request to the next model as well
+                    start_next()
+                    continue
+                for task in done:
+                    pending.discard(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        if queue:
+                            start_next()
+                    elif winner is None:
+                        winner = task
+        finally:
+            losers = [task for task in tasks if task is not winner]
+            for task in losers:
+                task.cancel()
+            results = await asyncio.gather(*losers, return_exceptions=True)
+            # A loser may have answered at the same time as the winner
+            for result in results:
+                if isinstance(result, tuple) and result[1] is not None:
+                    await result[1].aclose()
+
+        if winner is None:
+            raise error or RuntimeError("No model returned a response")
+        return tasks[winner], winner.result()
+
+    async def warmup(self, messages: list[Message]) -> None:
+        """Warm up the model the next request will most likely go to."""
+        try:
+            models = self.rank(messages, stream=True)
+        except ValueError:
+            return
+        await self._service(models[0]).warmup(messages)
+
+    async def close(self) -> None:
+        """Close the services of the models that were used and save their stats."""
+        for service in self._services.values():
+            await service.close()
+        await self.stats.flush()
@@ -0,0 +1,401 @@
+"""Shared rate limiting and concurrency control for provider requests."""
+
+import asyncio
+import random
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncGenerator, AsyncIterable, Awaitable, Callable, TypeVar
+
+from ..config import Provider, get_available_models, get_rate_limits
+from .base import Message
+from .metrics import mark_connected
+
+T = TypeVar("T")
+
+# HTTP status codes that mean the provider wants us to slow down
+_OVERLOAD_STATUS_CODES = {429, 503, 529}
+
+# Seconds the provider has to accept a streaming request once it is sent,
+# set by the service that applies timeouts. Waiting for a slot and backing
+# off from rate limits don't count.
+current_connect_timeout: ContextVar[float | None] = ContextVar(
+    "current_connect_timeout", default=None
+)
+
+# Event that the scheduler sets once a streaming request has been admitted
+# and the provider has accepted it. The service that applies timeouts
+# provides it to start the first token deadline only then.
+current_stream_opened: ContextVar[asyncio.Event | None] = ContextVar(
+    "current_stream_opened", default=None
+)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+@dataclass
+class RateLimits:
+    """Request and token limits for a provider or a model."""
+
+    requests_per_minute: float | None = None
+    tokens_per_minute: float | None = None
+
+
+def estimate_tokens(messages: list[Message], max_tokens: int) -> int:
+    """Roughly estimate the tokens a request counts against a tokens-per-minute limit.
+
+    Providers count the requested output tokens as well as the input.
+    """
+    return sum(len(message.content) for message in messages) // 4 + max_tokens
+
+
+class TokenBucket:
+    """A token bucket that hands out reservations instead of blocking.
+
+    A reservation always succeeds but may leave the bucket in debt; the
+    caller then waits for the returned delay before sending its request.
+    """
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` tokens and return how long to wait before using them."""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+
+class AdaptiveConcurrency:
+    """Limit in-flight requests with additive-increase/multiplicative-decrease.
+
+    Every successful request raises the limit by ``1 / limit`` (about one
+    slot per round of requests); an overload signal halves it. Like TCP
+    congestion control, only requests sent after the last decrease can
+    trigger another one, so one burst of rejections halves the limit once.
+    """
+
+    def __init__(
+        self,
+        initial: float = 4,
+        minimum: float = 1,
+        maximum: float = 64,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._clock = clock
+        self._last_decrease = float("-inf")
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        """Wait for a free slot and take it.
+
+        Returns:
+            The time the slot was taken, to be passed to :meth:`on_overload`
+        """
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self._clock()
+
+    async def release(self) -> None:
+        """Give back a slot."""
+        # Freed before waiting for the lock, so that a release that is
+        # cancelled itself doesn't leak the slot
+        self.in_flight -= 1
+        async with self._condition:
+            self._condition.notify_all()
+
+    def on_success(self) -> None:
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_overload(self, started: float) -> None:
+        if started >= self._last_decrease:
+            self.limit = max(self.minimum, self.limit / 2)
+            self._last_decrease = self._clock()
+
+
+def is_overloaded(error: BaseException) -> bool:
+    """Check whether an SDK error is a rate limit or overload response."""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return isinstance(status, int) and status in _OVERLOAD_STATUS_CODES
+
+
+def _parse_duration(value: str) -> float | None:
+    """Parse a delay like ``"20"``, ``"1.5"``, ``"250ms"`` or ``"1m30s"``."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    parts = _DURATION_PART.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+    try:
+        return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(error: BaseException) -> float | None:
+    """Get the delay a provider asked for in a rate limit error, if any."""
+    response = getattr(error, "response", None)
+    headers: Any = getattr(response, "headers", None) or {}
+
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+
+    for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        if name in headers:
+            delay = _parse_duration(headers[name])
+            if delay is not None:
+                return max(0.0, delay)
+
+    # Google API errors carry a RetryInfo detail instead of headers
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and hasattr(delay, "total_seconds"):
+            return float(delay.total_seconds())
+
+    return None
+
+
+class RequestScheduler:
+    """Pace requests to each provider and model and back off when overloaded.
+
+    Requests and tokens per minute are limited with token buckets per
+    provider and per model. In-flight requests are limited per provider by
+    an adaptive limit. Rate limit responses are retried after the delay the
+    provider asked for (or a jittered exponential backoff), and that delay
+    holds back every request to the same provider and model so retries
+    don't pile up.
+    """
+
+    def __init__(
+        self,
+        limits: dict[str, RateLimits] | None = None,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ):
+        """Initialize the scheduler.
+
+        Args:
+            limits: Limits keyed by provider name or model ID
+            max_retries: Maximum retries of a rate limited request
+            base_delay: First backoff delay when the provider gives no hint
+            max_delay: Upper bound for any backoff delay
+            clock: Monotonic clock, replaceable for testing
+            sleep: Sleep function, replaceable for testing
+        """
+        self.limits = dict(limits or {})
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._clock = clock
+        self._sleep = sleep
+        self._request_buckets: dict[str, TokenBucket] = {}
+        self._token_buckets: dict[str, TokenBucket] = {}
+        self._concurrency: dict[str, AdaptiveConcurrency] = {}
+        self._paused_until: dict[str, float] = {}
+
+    def set_limits(self, key: str, limits: RateLimits) -> None:
+        """Set the limits for a provider name or model ID."""
+        self.limits[key] = limits
+        self._request_buckets.pop(key, None)
+        self._token_buckets.pop(key, None)
+
+    def concurrency(self, provider: str) -> AdaptiveConcurrency:
+        """Get the adaptive concurrency limit of a provider."""
+        if provider not in self._concurrency:
+            self._concurrency[provider] = AdaptiveConcurrency(clock=self._clock)
+        return self._concurrency[provider]
+
+    def _buckets(self, key: str) -> list[tuple[TokenBucket, bool]]:
+        """Get the (bucket, counts tokens) pairs that apply to a key."""
+        limits = self.limits.get(key)
+        if limits is None:
+            return []
+
+        buckets = []
+        if limits.requests_per_minute:
+            if key not in self._request_buckets:
+                self._request_buckets[key] = TokenBucket(limits.requests_per_minute, self._clock)
+            buckets.append((self._request_buckets[key], False))
+        if limits.tokens_per_minute:
+            if key not in self._token_buckets:
+                self._token_buckets[key] = TokenBucket(limits.tokens_per_minute, self._clock)
+            buckets.append((self._token_buckets[key], True))
+        return buckets
+
+    async def _acquire(self, provider: str, model_id: str, tokens: int) -> float:
+        """Wait for the rate limits to allow a request, then for a concurrency slot.
+
+        Returns:
+            The time the concurrency slot was taken
+        """
+        while True:
+            now = self._clock()
+            pause = max(self._paused_until.get(key, 0.0) for key in (provider, model_id))
+            if pause <= now:
+                break
+            await self._sleep(pause - now)
+
+        delay = 0.0
+        for bucket, counts_tokens in self._buckets(provider) + self._buckets(model_id):
+            delay = max(delay, bucket.reserve(tokens if counts_tokens else 1))
+        if delay > 0:
+            await self._sleep(delay)
+
+        return await self.concurrency(provider).acquire()
+
+    def _backoff(
+        self, provider: str, model_id: str, error: BaseException, attempt: int, started: float
+    ) -> float:
+        """Register an overload response and return how long to wait before retrying."""
+        self.concurrency(provider).on_overload(started)
+
+        delay = retry_after(error)
+        if delay is None:
+            delay = self.base_delay * 2**attempt
+            delay = random.uniform(delay / 2, delay)
+        delay = min(delay, self.max_delay)
+
+        # Hold back every request to this provider and model, not just the retry
+        resume = self._clock() + delay
+        for key in (provider, model_id):
+            self._paused_until[key] = max(self._paused_until.get(key, 0.0), resume)
+        return delay
+
+    async def call(
+        self,
+        provider: Provider | str,
+        model_id: str,
+        request: Callable[[], Awaitable[T]],
+        tokens: int = 0,
+    ) -> T:
+        """Send a request through the scheduler.
+
+        Args:
+            provider: Provider the request goes to
+            model_id: Model the request is for
+            request: Function that sends the request; called again on retry
+            tokens: Estimated number of tokens the request uses
+
+        Returns:
+            The result of ``request``
+        """
+        key = provider.value if isinstance(provider, Provider) else provider
+        concurrency = self.concurrency(key)
+        attempt = 0
+        while True:
+            started = await self._acquire(key, model_id, tokens)
+            try:
+                result = await request()
+                mark_connected()
+            except Exception as error:
+                if not is_overloaded(error) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(key, model_id, error, attempt, started)
+            else:
+                concurrency.on_success()
+                return result
+            finally:
+                await concurrency.release()
+
+            await self._sleep(delay)
+            attempt += 1
+
+    async def stream(
+        self,
+        provider: Provider | str,
+        model_id: str,
+        request: Callable[[], Awaitable[AsyncIterable[T]]],
+        tokens: int = 0,
+    ) -> AsyncGenerator[T, None]:
+        """Open a streaming request through the scheduler and yield its items.
+
+        Opening the stream is retried like :meth:`call`. The concurrency slot
+        is held until the stream is exhausted or closed.
+        """
+        key = provider.value if isinstance(provider, Provider) else provider
+        concurrency = self.concurrency(key)
+        attempt = 0
+        while True:
+            started = await self._acquire(key, model_id, tokens)
+            opened = False
+            try:
+                stream = await asyncio.wait_for(request(), current_connect_timeout.get())
+                mark_connected()
+                opened = True
+                stream_opened = current_stream_opened.get()
+                if stream_opened is not None:
+                    stream_opened.set()
+            except Exception as error:
+                if not is_overloaded(error) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(key, model_id, error, attempt, started)
+            finally:
+                # Also when opening is cancelled, e.g. by a timeout or a lost race
+                if not opened:
+                    await concurrency.release()
+            if opened:
+                break
+
+            await self._sleep(delay)
+            attempt += 1
+
+        try:
+            async for item in stream:
+                yield item
+            concurrency.on_success()
+        finally:
+            await concurrency.release()
+
+
+_scheduler: RequestScheduler | None = None
+
+
+def get_scheduler() -> RequestScheduler:
+    """Get the scheduler shared by all services in this process.
+
+    Provider limits are read from the environment, see
+    :func:`cliai.config.get_rate_limits`, and model limits from the
+    ``requests_per_minute`` and ``tokens_per_minute`` of the models.
+    """
+    global _scheduler
+    if _scheduler is None:
+        limits = {}
+        for provider in Provider:
+            requests_per_minute, tokens_per_minute = get_rate_limits(provider)
+            if requests_per_minute or tokens_per_minute:
+                limits[provider.value] = RateLimits(requests_per_minute, tokens_per_minute)
+        _scheduler = RequestScheduler(limits)
+        for model in get_available_models():
+            if model.requests_per_minute or model.tokens_per_minute:
+                _scheduler.set_limits(
+                    model.id, RateLimits(model.requests_per_minute, model.tokens_per_minute)
+                )
+    return _scheduler
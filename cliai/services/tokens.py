@@ -0,0 +1,117 @@
+"""Token counting and context window budgeting."""
+
+from typing import Callable
+
+from ..config import ModelConfig, Provider
+from .base import Message, Role
+
+# Average characters per token of each provider's tokenizer on English text
+# and code, used when no exact tokenizer is available
+_CHARS_PER_TOKEN = {
+    Provider.OPENAI: 4.0,
+    Provider.ANTHROPIC: 3.5,
+    Provider.GOOGLE: 4.0,
+}
+
+# Tokens each message adds for its role and separators
+_MESSAGE_OVERHEAD = 4
+
+
+def _load_tokenizer(model_config: ModelConfig) -> tuple[str, Callable[[str], int]] | None:
+    """Load an exact tokenizer for the model if one is installed."""
+    if model_config.provider != Provider.OPENAI:
+        return None
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        encoding = tiktoken.encoding_for_model(model_config.id)
+    except KeyError:
+        encoding = tiktoken.get_encoding("o200k_base")
+    return f"tiktoken:{encoding.name}", lambda text: len(encoding.encode(text))
+
+
+class TokenCounter:
+    """Count the tokens of messages for one model.
+
+    Uses tiktoken for OpenAI models when it is installed, and a per-provider
+    characters-per-token estimate otherwise. The count is cached on each
+    message, so only new or changed messages are tokenized.
+    """
+
+    def __init__(self, model_config: ModelConfig):
+        """Initialize the counter.
+
+        Args:
+            model_config: Configuration of the model the messages are sent to
+        """
+        self.model_config = model_config
+        tokenizer = _load_tokenizer(model_config)
+        if tokenizer is None:
+            chars_per_token = _CHARS_PER_TOKEN.get(model_config.provider, 4.0)
+            self.name = f"estimate:{chars_per_token}"
+            self._count_text: Callable[[str], int] = lambda text: int(
+                len(text) / chars_per_token + 0.5
+            )
+        else:
+            self.name, self._count_text = tokenizer
+
+    def count_text(self, text: str) -> int:
+        """Count the tokens in a piece of text."""
+        return self._count_text(text)
+
+    def count_message(self, message: Message) -> int:
+        """Count the tokens of a message, including its overhead."""
+        cache = message.token_count_cache
+        if cache is not None and cache[0] == self.name and cache[1] is message.content:
+            return cache[2]
+
+        count = self._count_text(message.content) + _MESSAGE_OVERHEAD
+        message.token_count_cache = (self.name, message.content, count)
+        return count
+
+    def count(self, messages: list[Message]) -> int:
+        """Count the tokens of a list of messages."""
+        return sum(self.count_message(message) for message in messages)
+
+
+def fit_to_context(
+    messages: list[Message], model_config: ModelConfig, counter: TokenCounter
+) -> tuple[list[Message], int]:
+    """Drop the oldest turns until a conversation fits the model's context window.
+
+    System messages at the start of the conversation and the last message
+    are always kept, and room is left for the model's output. The kept
+    conversation never starts with an assistant message.
+
+    Args:
+        messages: The conversation
+        model_config: Configuration of the model the messages are sent to
+        counter: Token counter for the model
+
+    Returns:
+        The messages to send and the number of messages that were dropped
+    """
+    system_count = 0
+    while system_count < len(messages) and messages[system_count].role == Role.SYSTEM:
+        system_count += 1
+
+    budget = model_config.context_window - model_config.max_tokens
+    budget -= counter.count(messages[:system_count])
+
+    # Walk back from the newest message; counts are cached, so this only
+    # tokenizes messages that were added since the last request
+    start = len(messages)
+    while start > system_count:
+        cost = counter.count_message(messages[start - 1])
+        if cost > budget and start < len(messages):
+            break
+        budget -= cost
+        start -= 1
+
+    while start < len(messages) - 1 and messages[start].role == Role.ASSISTANT:
+        start += 1
+
+    return messages[:system_count] + messages[start:], start - system_count
@@ -0,0 +1,92 @@
+"""HTTP connection pools shared by the provider clients."""
+
+import importlib
+import importlib.util
+import os
+from typing import Any, TypeVar
+
+from ..config import get_number_setting
+
+
+C = TypeVar("C")
+
+# One pooled client per SDK client class. The SDKs pin their own httpx
+# version, and their clients don't accept an HTTP client from another one;
+# connections can't be shared across API hosts anyway.
+_http_clients: dict[type, Any] = {}
+
+
+def http2_available() -> bool:
+    """Check whether HTTP/2 can be used and hasn't been disabled."""
+    if os.getenv("CLIAI_HTTP2", "1").strip().lower() in ("0", "false", "no"):
+        return False
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_http_client(client_class: type[C]) -> C:
+    """Create an HTTP client with pool limits read from the environment.
+
+    ``CLIAI_MAX_CONNECTIONS`` (default 100) and ``CLIAI_MAX_KEEPALIVE``
+    (default 20) bound the pool, and idle connections are closed after
+    ``CLIAI_KEEPALIVE_EXPIRY`` seconds (default 60). HTTP/2 is used when the
+    ``h2`` package is installed, unless ``CLIAI_HTTP2=0``.
+
+    Args:
+        client_class: An httpx ``AsyncClient`` class, usually the SDK's
+            ``DefaultAsyncHttpxClient`` so that its defaults are kept
+    """
+    httpx = _httpx_package(client_class)
+    limits = httpx.Limits(
+        max_connections=int(get_number_setting("CLIAI_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=int(get_number_setting("CLIAI_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=get_number_setting("CLIAI_KEEPALIVE_EXPIRY", 60.0),
+    )
+    # Timeouts are set per request by the SDKs and enforced by ResilientService
+    return client_class(http2=http2_available(), limits=limits)  # type: ignore[call-arg]
+
+
+def _httpx_package(client_class: type) -> Any:
+    """Find the httpx package a client class is built on."""
+    for base in client_class.__mro__:
+        if base.__name__ == "AsyncClient":
+            return importlib.import_module(base.__module__.partition(".")[0])
+    raise TypeError(f"{client_class.__name__} is not an httpx AsyncClient")
+
+
+def get_http_client(client_class: type[C]) -> C:
+    """Get the HTTP client of the given class shared by all services in this process.
+
+    Passing it to the provider SDKs lets every service, batch worker and
+    fan-out request reuse warm connections instead of paying for DNS, TCP and
+    TLS setup each time. Services must not close it; the command that runs
+    the event loop calls :func:`aclose_http_clients` when it is done.
+
+    Args:
+        client_class: An httpx ``AsyncClient`` class, usually the SDK's
+            ``DefaultAsyncHttpxClient``
+    """
+    client = _http_clients.get(client_class)
+    if client is None or client.is_closed:
+        client = _http_clients[client_class] = create_http_client(client_class)
+    return client  # type: ignore[no-any-return]
+
+
+async def prewarm_connection(client: Any, url: str) -> None:
+    """Open a pooled connection to the host of ``url`` before the first request.
+
+    Any response, even an error status, leaves a connection with DNS, TCP and
+    TLS already done in the pool for the next request to the same host.
+    """
+    await client.head(url)
+
+
+async def aclose_http_clients() -> None:
+    """Close the shared HTTP clients.
+
+    The clients are bound to the event loop they were used on, so this must
+    be awaited before that loop ends.
+    """
+    clients = list(_http_clients.values())
+    _http_clients.clear()
+    for client in clients:
+        await client.aclose()
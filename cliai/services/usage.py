@@ -0,0 +1,246 @@
+"""Ledger of the tokens, latency and cost of every request."""
+
+import sqlite3
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+
+from ..config import ModelConfig, get_cache_dir, get_model_by_id
+from .metrics import RequestMetrics
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    model_id TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    session TEXT,
+    stream INTEGER NOT NULL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    cache_read_tokens INTEGER,
+    cache_write_tokens INTEGER,
+    duration REAL NOT NULL,
+    time_to_first_token REAL,
+    cost REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS requests_by_time ON requests (timestamp);
+"""
+
+# SQL expressions of the groups usage can be summarized by
+_GROUPS = {
+    "model": "model_id",
+    "day": "date(timestamp, 'unixepoch', 'localtime')",
+    "session": "COALESCE(session, '-')",
+}
+
+# The session or command the requests made in the current task belong to
+current_session: ContextVar[str | None] = ContextVar("current_session", default=None)
+
+
+def request_cost(
+    model_config: ModelConfig,
+    input_tokens: int,
+    output_tokens: int,
+    cache_read_tokens: int = 0,
+    cache_write_tokens: int = 0,
+) -> float | None:
+    """Compute the price of a request in USD.
+
+    Cached input is charged at the model's cache prices, or at the input
+    price for models that have none.
+
+    Returns:
+        The price, or None if the model has no prices
+    """
+    if model_config.input_price is None and model_config.output_price is None:
+        return None
+    input_price = model_config.input_price or 0.0
+    cached_input_price = model_config.cached_input_price
+    cache_write_price = model_config.cache_write_price
+    return (
+        input_tokens * input_price
+        + cache_read_tokens * (input_price if cached_input_price is None else cached_input_price)
+        + cache_write_tokens * (input_price if cache_write_price is None else cache_write_price)
+        + output_tokens * (model_config.output_price or 0.0)
+    ) / 1_000_000
+
+
+@dataclass
+class UsageSummary:
+    """Usage of a group of requests."""
+
+    # Model ID, day or session
+    key: str
+    requests: int
+    errors: int
+    input_tokens: int
+    output_tokens: int
+    cache_read_tokens: int
+    cache_write_tokens: int
+    # USD, of the requests to models with prices
+    cost: float
+    # Mean seconds until the first chunk of streamed responses
+    time_to_first_token: float | None
+    # Most requests, and input plus output tokens, within one minute
+    peak_requests_per_minute: int
+    peak_tokens_per_minute: int
+
+
+class UsageLedger:
+    """Record the usage of every request in an SQLite database.
+
+    A ledger is a metrics sink: add it to an :class:`InstrumentedService`
+    and it records each finished request with the current session. Each
+    record is a single-row insert in WAL mode, cheap enough to make on the
+    event loop when a response is complete.
+    """
+
+    def __init__(self, path: Path | None = None):
+        """Initialize the ledger; the database is opened on first use.
+
+        Args:
+            path: Path to the database file, defaults to usage.sqlite3 in the cache directory
+        """
+        self.path = path or get_cache_dir() / "usage.sqlite3"
+        self._connection: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=5.0)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(_SCHEMA)
+        return self._connection
+
+    def __call__(self, metrics: RequestMetrics) -> None:
+        cost = None
+        model_config = get_model_by_id(metrics.model_id)
+        if model_config is not None and metrics.input_tokens is not None:
+            cost = request_cost(
+                model_config,
+                metrics.input_tokens,
+                metrics.output_tokens or 0,
+                metrics.cache_read_tokens or 0,
+                metrics.cache_write_tokens or 0,
+            )
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT INTO requests (timestamp, model_id, provider, session, stream,"
+                    " input_tokens, output_tokens, cache_read_tokens, cache_write_tokens,"
+                    " duration, time_to_first_token, cost, error)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        metrics.timestamp,
+                        metrics.model_id,
+                        metrics.provider,
+                        current_session.get(),
+                        metrics.stream,
+                        metrics.input_tokens,
+                        metrics.output_tokens,
+                        metrics.cache_read_tokens,
+                        metrics.cache_write_tokens,
+                        metrics.duration,
+                        metrics.time_to_first_token,
+                        cost,
+                        metrics.error,
+                    ),
+                )
+        except sqlite3.Error as e:
+            # Metrics sinks may only raise OSError, which the service ignores
+            raise OSError(f"Can't record usage: {e}") from e
+
+    def summarize(self, by: str = "model", since: float | None = None) -> list[UsageSummary]:
+        """Sum up the usage of the recorded requests.
+
+        Args:
+            by: Group by "model", "day" or "session"
+            since: Unix time of the oldest requests to include, all by default
+
+        Returns:
+            One summary per group: days newest first, and models or sessions
+            the most expensive and then the most used first
+        """
+        group = _GROUPS[by]
+        where = "WHERE timestamp >= ?" if since is not None else ""
+        params = (since,) if since is not None else ()
+        connection = self._connect()
+
+        rows = connection.execute(
+            f"""
+            SELECT {group} AS key, COUNT(*), COUNT(error),
+                TOTAL(input_tokens), TOTAL(output_tokens),
+                TOTAL(cache_read_tokens), TOTAL(cache_write_tokens),
+                TOTAL(cost), AVG(CASE WHEN stream THEN time_to_first_token END)
+            FROM requests {where}
+            GROUP BY key
+            """,
+            params,
+        ).fetchall()
+        peaks = {
+            key: (requests, tokens)
+            for key, requests, tokens in connection.execute(
+                f"""
+                SELECT key, MAX(requests), MAX(tokens) FROM (
+                    SELECT {group} AS key, COUNT(*) AS requests,
+                        TOTAL(input_tokens) + TOTAL(cache_read_tokens)
+                            + TOTAL(cache_write_tokens) + TOTAL(output_tokens) AS tokens
+                    FROM requests {where}
+                    GROUP BY key, CAST(timestamp / 60 AS INTEGER)
+                )
+                GROUP BY key
+                """,
+                params,
+            )
+        }
+
+        summaries = [
+            UsageSummary(
+                key=key,
+                requests=requests,
+                errors=errors,
+                input_tokens=int(input_tokens),
+                output_tokens=int(output_tokens),
+                cache_read_tokens=int(cache_read_tokens),
+                cache_write_tokens=int(cache_write_tokens),
+                cost=cost,
+                time_to_first_token=time_to_first_token,
+                peak_requests_per_minute=peaks[key][0],
+                peak_tokens_per_minute=int(peaks[key][1]),
+            )
+            for (
+                key,
+                requests,
+                errors,
+                input_tokens,
+                output_tokens,
+                cache_read_tokens,
+                cache_write_tokens,
+                cost,
+                time_to_first_token,
+            ) in rows
+        ]
+        if by == "day":
+            summaries.sort(key=lambda summary: summary.key, reverse=True)
+        else:
+            summaries.sort(key=lambda summary: (summary.cost, summary.requests), reverse=True)
+        return summaries
+
+    def close(self) -> None:
+        """Close the database connection."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+_ledger: UsageLedger | None = None
+
+
+def get_usage_ledger() -> UsageLedger:
+    """Get the ledger shared by all services in this process."""
+    global _ledger
+    if _ledger is None:
+        _ledger = UsageLedger()
+    return _ledger
@@ -1,30 +1,58 @@
 """Chat interface UI for CLI AI Chat."""
 
 import asyncio
-import json
+import sqlite3
+import sys
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, List, Dict, Any, Generator, AsyncGenerator, Union
+from typing import Optional, List, Dict, Any, Generator, AsyncGenerator, TextIO, Union
 import os
 
 from rich.console import Console
 from rich.live import Live
 from rich.panel import Panel
 from rich.markdown import Markdown
+from rich.rule import Rule
 from rich.text import Text
 from rich.spinner import Spinner
+from rich.table import Table
 from rich.console import RenderableType
 
-from ..config import ModelConfig, get_history_file
-from ..services import AIService, Message, Role
+from ..config import ModelConfig
+from ..history import Conversation, ConversationRef, ConversationStore, HistoryWriter
+from ..services import AIService, Message, Role, TokenCounter, fit_to_context
+from ..services.compaction import (
+    Summary,
+    apply_summary,
+    compaction_threshold,
+    plan_compaction,
+    summarize,
+)
+from ..services.metrics import InstrumentedService, RequestTiming, current_timing
+from ..services.usage import current_session
+from .streaming import ChunkCoalescer, StreamingMarkdown, REFRESH_PER_SECOND
 from .style import STYLES
 
 
+# Seconds after which a prefetch that hasn't finished is abandoned
+PREFETCH_TIMEOUT = 30.0
+
+
 class ChatInterface:
     """Interface for chatting with AI models."""
 
     def __init__(
-        self, model_config: ModelConfig, service: AIService, new_conversation: bool = False
+        self,
+        model_config: ModelConfig,
+        service: AIService,
+        new_conversation: bool = False,
+        show_stats: bool = False,
+        prefetch: bool = True,
+        summarizer: AIService | None = None,
+        session: str | None = None,
+        conversation_id: int | None = None,
+        scroll: bool = False,
+        tee: Path | None = None,
     ):
         """Initialize the chat interface.
 
@@ -32,14 +60,41 @@ class ChatInterface:
             model_config: Configuration for the model
             service: Service for communicating with the AI model
             new_conversation: Whether to start a new conversation regardless of history
+            show_stats: Whether to show latency and token statistics after each response
+            prefetch: Whether to warm up the service while the user is typing
+            summarizer: Service that summarizes old turns once the conversation
+                gets long; without one, old turns are only dropped when they no
+                longer fit the context window
+            session: Name of the session to resume, or to start if there is
+                none with this model yet
+            conversation_id: ID of a stored conversation to resume
+            scroll: Whether to print the finished parts of a streaming reply
+                once and only keep redrawing the part still being written,
+                instead of showing the reply in a box
+            tee: File to append the raw text of every reply to as it streams
         """
         self.model_config = model_config
         self.service = service
         self.console = Console()
         self.messages: list[Message] = []
-        self.history_file = get_history_file()
+        self.token_counter = TokenCounter(model_config)
+        self.store = ConversationStore()
+        # Saves are written in the background through a separate connection
+        self.writer = HistoryWriter(self.store.path, on_error=self._on_save_error)
+        self.conversation = ConversationRef(model_config, name=session)
         self.new_conversation = new_conversation
         self.show_user_messages = False  # Don't show user message panels for new messages
+        self.show_stats = show_stats
+        self.prefetch = prefetch
+        self._prefetch_task: asyncio.Task[None] | None = None
+        self._prefetched: list[Message] | None = None
+        self.summarizer = summarizer
+        self.summary: Summary | None = None
+        self.compact_threshold = compaction_threshold(model_config)
+        self._compaction_task: asyncio.Task[None] | None = None
+        self.scroll = scroll
+        self.tee = tee
+        self._tee_file: TextIO | None = None
 
         # Add default system message
         self.messages.append(
@@ -50,94 +105,83 @@ class ChatInterface:
         )
 
         # Load conversation history if it exists and not starting a new conversation
-        if not new_conversation:
+        if conversation_id is not None:
+            self._load_history(conversation_id=conversation_id)
+        elif session is not None:
+            self._load_history(session)
+        elif not new_conversation:
             self._load_history()
 
-    def _load_history(self) -> None:
-        """Load conversation history from file if it exists."""
+    def _load_history(self, session: str | None = None, conversation_id: int | None = None) -> None:
+        """Load a conversation with this model if there is one.
+
+        Args:
+            session: Name of the session to load
+            conversation_id: ID of the conversation to load; the latest
+                conversation is loaded if neither is given
+        """
         try:
-            if self.history_file.exists():
-                with open(self.history_file, "r") as f:
-                    history = json.load(f)
-
-                # Look for a conversation with this model
-                for conversation in history:
-                    if conversation.get("model_id") == self.model_config.id:
-                        # Found a conversation with this model
-                        for msg_data in conversation.get("messages", []):
-                            role_str = msg_data.get("role")
-                            content = msg_data.get("content", "")
-
-                            try:
-                                role = Role(role_str)
-                                # Don't duplicate system messages
-                                if role == Role.SYSTEM and any(
-                                    m.role == Role.SYSTEM for m in self.messages
-                                ):
-                                    continue
-
-                                self.messages.append(Message(role=role, content=content))
-                            except (ValueError, TypeError):
-                                # Skip invalid messages
-                                continue
-
-                        # Only load one conversation
-                        break
-        except (json.JSONDecodeError, IOError):
+            if conversation_id is not None:
+                conversation = self.store.get_conversation(conversation_id)
+            elif session is not None:
+                conversation = self.store.find_session(self.model_config.id, session)
+            else:
+                conversation = self.store.latest_conversation(self.model_config.id)
+            if conversation is None:
+                return
+            self._load_conversation(conversation)
+        except sqlite3.Error:
             # If there's an error loading history, just start fresh
             pass
 
+    def _load_conversation(self, conversation: Conversation) -> None:
+        """Replace the current conversation with a stored one.
+
+        The current system prompt is kept.
+        """
+        self.messages = [m for m in self.messages if m.role == Role.SYSTEM]
+        self.summary = None
+        if conversation.summary:
+            self.summary = Summary(conversation.summary, conversation.summary_covers)
+        for message in self.store.load_messages(conversation.id):
+            # Don't duplicate system messages
+            if message.role == Role.SYSTEM and any(m.role == Role.SYSTEM for m in self.messages):
+                continue
+            self.messages.append(message)
+
+        self.conversation = ConversationRef(
+            self.model_config,
+            name=conversation.name,
+            id=conversation.id,
+            persisted=list(self.messages),
+        )
+
     def _save_history(self) -> None:
-        """Save conversation history to file."""
-        try:
-            history: list[dict[str, Any]] = []
-
-            # Load existing history if it exists
-            if self.history_file.exists():
-                with open(self.history_file, "r") as f:
-                    try:
-                        history = json.load(f)
-                    except json.JSONDecodeError:
-                        history = []
-
-            # Convert messages to serializable format
-            messages_data = [
-                {"role": msg.role.value, "content": msg.content} for msg in self.messages
-            ]
-
-            # Check if we already have a conversation for this model
-            found = False
-            for conversation in history:
-                if conversation.get("model_id") == self.model_config.id:
-                    # Update existing conversation
-                    conversation["messages"] = messages_data
-                    conversation["last_updated"] = datetime.now().isoformat()
-                    found = True
-                    break
-
-            if not found:
-                # Create a new conversation
-                history.append(
-                    {
-                        "model_id": self.model_config.id,
-                        "model_name": self.model_config.name,
-                        "provider": self.model_config.provider.value,
-                        "messages": messages_data,
-                        "created": datetime.now().isoformat(),
-                        "last_updated": datetime.now().isoformat(),
-                    }
-                )
-
-            # Save history
-            self.history_file.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.history_file, "w") as f:
-                json.dump(history, f, indent=2)
-
-        except IOError:
-            # If we can't save history, just continue
+        """Save the conversation to the history store in the background."""
+        self.writer.save(self.conversation, self.messages)
+
+    def _on_save_error(self, error: Exception) -> None:
+        """Report a failed background save; the chat just continues."""
+        self.console.print("Warning: Could not save conversation history", style=STYLES["warning"])
+
+    def _context_messages(self) -> tuple[list[Message], int]:
+        """Get the messages to send and how many old ones had to be left out.
+
+        Summarized turns are replaced by their summary, and old turns that
+        still don't fit the context window are dropped.
+        """
+        messages = apply_summary(self.messages, self.summary)
+        return fit_to_context(messages, self.model_config, self.token_counter)
+
+    def _messages_for_request(self) -> list[Message]:
+        """Get the messages to send, leaving out old turns that don't fit the context window."""
+        messages, dropped = self._context_messages()
+        if dropped:
             self.console.print(
-                "Warning: Could not save conversation history", style=STYLES["warning"]
+                f"{dropped} older messages were left out to fit the context window.",
+                style=STYLES["info"],
             )
+        return messages
 
     def _display_messages(self) -> None:
         """Display all messages in the conversation."""
@@ -174,11 +218,11 @@ class ChatInterface:
 
         self.console.print(Panel(content, title=title, title_align="left", border_style=style))
 
-    async def run(self) -> AsyncGenerator[Panel, None]:
+    async def run(self) -> AsyncGenerator[RenderableType, None]:
         """Run the chat interface.
 
         Yields:
-            Panels showing the progress of assistant responses
+            Renderables showing the progress of assistant responses
         """
         # Display welcome message
         self.console.print(
@@ -189,9 +233,21 @@ class ChatInterface:
         )
 
         # Inform if continuing a previous conversation
-        if not self.new_conversation:
+        if self.conversation.name is not None:
+            state = "Continuing" if self.conversation.id is not None else "Starting"
+            self.console.print(
+                f"{state} session '{self.conversation.name}'.", style=STYLES["info"]
+            )
+        elif not self.new_conversation:
             self.console.print("Continuing previous conversation.", style=STYLES["info"])
 
+        if self.store.recovered_from is not None:
+            self.console.print(
+                "The conversation history was damaged and has been moved to "
+                f"{self.store.recovered_from}; starting a new one.",
+                style=STYLES["warning"],
+            )
+
         self.console.print("Type '/help' for commands, or '/exit' to quit.", style=STYLES["info"])
         self.console.print()
 
@@ -201,11 +257,15 @@ class ChatInterface:
 
         # Main chat loop
         try:
+            if self.tee is not None:
+                self._tee_file = open(self.tee, "a", encoding="utf-8")
+
             while True:
                 # Get user input - use console.input() which shows the prompt but not the entered text
                 # then show it formatted in the panel
                 self.console.print("[bold purple]>[/bold purple] ", end="")
-                user_input = input()
+                self._start_prefetch()
+                user_input = await self._read_input()
 
                 # Skip empty inputs
                 if not user_input.strip():
@@ -237,9 +297,22 @@ class ChatInterface:
                         # Clear the conversation (but keep the system message)
                         system_messages = [m for m in self.messages if m.role == Role.SYSTEM]
                         self.messages = system_messages
+                        if self.summary is not None:
+                            self.summary = None
+                            self._save_summary()
                         self.console.print("Conversation cleared.", style=STYLES["info"])
                         continue
 
+                    elif command == "/sessions":
+                        # List the conversations as of the last turn
+                        await self.writer.flush()
+                        self._show_sessions()
+                        continue
+
+                    elif command == "/switch" or command.startswith("/switch "):
+                        await self._switch_session(user_input.strip()[len("/switch") :].strip())
+                        continue
+
                     elif command == "/system":
                         # Edit the system prompt
                         self.console.print("Enter new system prompt: ", end="")
@@ -270,6 +343,7 @@ class ChatInterface:
 
                     # Placeholder for the assistant's message
                     assistant_message = Message(role=Role.ASSISTANT, content="")
+                    chunks: list[str] = []
 
                     first_chunk_received = False
                     panel = Panel(
@@ -279,18 +353,34 @@ class ChatInterface:
                         border_style=STYLES["assistant_name"],
                     )
 
+                    # Record the usage under the session, which /switch may have changed
+                    current_session.set(self.conversation.name or "chat")
+
                     # Stream the response
-                    with Live(spinner, refresh_per_second=10) as live:
-                        response = await self.service.generate_response(self.messages, stream=True)
+                    with Live(
+                        spinner, console=self.console, refresh_per_second=REFRESH_PER_SECOND
+                    ) as live:
+                        # Tells which model answers, which the router picks per request
+                        timing = RequestTiming()
+                        token = current_timing.set(timing)
+                        try:
+                            response = await self.service.generate_response(
+                                self._messages_for_request(), stream=True
+                            )
+                        finally:
+                            current_timing.reset(token)
+                        title = self._response_title(timing.model)
 
                         # Check if we got a streaming response or a complete one
                         if isinstance(response, str):
                             # We got a complete response
                             content_text = response
                             assistant_message.content = content_text
+                            if self._tee_file is not None:
+                                self._tee_file.write(content_text)
+                            self._end_tee(content_text)
                             # Replace spinner with the model's response
                             style = STYLES["assistant_name"]
-                            title = f"{self.model_config.name}"
                             panel = Panel(
                                 Markdown(content_text),
                                 title=title,
@@ -300,41 +390,287 @@ class ChatInterface:
                             live.update(panel)
                             yield panel
                         else:
-                            # We got a streaming response
-                            content_text = ""
-                            async for chunk in response:
-                                content_text += chunk
-                                assistant_message.content = content_text
+                            # We got a streaming response. The renderer only re-parses
+                            # the last open Markdown block and follows the end of the
+                            # reply, and the display is updated at most once per
+                            # refresh interval.
+                            renderer = StreamingMarkdown(
+                                max_lines=max(1, self.console.size.height - 4)
+                            )
+                            coalescer = ChunkCoalescer(REFRESH_PER_SECOND)
+                            panel = Panel(
+                                renderer,
+                                title=title,
+                                title_align="left",
+                                border_style=STYLES["assistant_name"],
+                            )
+                            # Scrolling replies aren't boxed, so that finished blocks
+                            # can be printed above the live display and dropped
+                            view: RenderableType = renderer if self.scroll else panel
 
-                                # Update the live display with the current content
-                                style = STYLES["assistant_name"]
-                                title = f"{self.model_config.name}"
+                            async for chunk in response:
+                                chunks.append(chunk)
+                                renderer.append(chunk)
+                                if self._tee_file is not None:
+                                    self._tee_file.write(chunk)
 
                                 # Once we start receiving content, replace the spinner
-                                if not first_chunk_received and content_text.strip():
+                                if not first_chunk_received and chunk.strip():
                                     first_chunk_received = True
-
-                                panel = Panel(
-                                    Markdown(content_text),
-                                    title=title,
-                                    title_align="left",
-                                    border_style=style,
-                                )
-                                live.update(panel)
-                                yield panel
+                                    if self.scroll:
+                                        live.console.print(self._response_rule(title))
+                                    live.update(view)
+
+                                if first_chunk_received and coalescer.ready():
+                                    if self.scroll:
+                                        self._scroll_out(live.console, renderer)
+                                    if self._tee_file is not None:
+                                        self._tee_file.flush()
+                                    yield view
+
+                            assistant_message.content = "".join(chunks)
+                            self._end_tee(assistant_message.content)
+                            if first_chunk_received:
+                                # Show the whole reply once streaming has finished,
+                                # or with scrolling, the rest of it
+                                if self.scroll:
+                                    self._scroll_out(live.console, renderer)
+                                renderer.max_lines = None
+                                live.update(view, refresh=True)
+                                yield view
 
                     # Add the complete assistant message to conversation
                     self.messages.append(assistant_message)
+                    self._show_stats()
 
                     # Save conversation history
                     self._save_history()
+                    self._start_compaction()
 
                 except Exception as e:
                     self.console.print(f"Error: {e}", style=STYLES["error"])
 
+                    # Keep the part of the answer that was already shown
+                    if chunks and not assistant_message.content:
+                        assistant_message.content = "".join(chunks)
+                        self._end_tee(assistant_message.content)
+                        self.messages.append(assistant_message)
+                        self._save_history()
+
         finally:
             # Clean up
+            for task in (self._prefetch_task, self._compaction_task):
+                if task is not None:
+                    task.cancel()
             await self.service.close()
+            if self.summarizer is not None:
+                await self.summarizer.close()
+            await self.writer.close()
+            self.store.close()
+            if self._tee_file is not None:
+                self._tee_file.close()
+
+    def _show_sessions(self) -> None:
+        """List the most recent conversations with this model."""
+        try:
+            conversations = self.store.list_conversations(self.model_config.id)
+        except sqlite3.Error:
+            self.console.print("Could not read the conversation history", style=STYLES["error"])
+            return
+        if not conversations:
+            self.console.print("No saved conversations yet.", style=STYLES["info"])
+            return
+
+        table = Table(title=f"Conversations with {self.model_config.name}")
+        table.add_column("ID", justify="right", style="bold")
+        table.add_column("Session")
+        table.add_column("Messages", justify="right")
+        table.add_column("Last updated")
+        for conversation in conversations:
+            current = " (current)" if conversation.id == self.conversation.id else ""
+            table.add_row(
+                str(conversation.id),
+                ((conversation.name or "") + current).strip(),
+                str(conversation.message_count),
+                conversation.last_updated[:16].replace("T", " "),
+            )
+        self.console.print(table)
+        self.console.print("Use '/switch NAME' or '/switch ID' to change.", style=STYLES["info"])
+
+    async def _switch_session(self, target: str) -> None:
+        """Switch to a stored conversation, or start a new session.
+
+        Args:
+            target: ID of a conversation with this model, or a session name;
+                a name that isn't used yet starts a new session
+        """
+        if not target:
+            self.console.print("Usage: /switch NAME or /switch ID", style=STYLES["error"])
+            return
+
+        # Wait for pending saves, so that new sessions can be found by name
+        await self.writer.flush()
+        try:
+            if target.isdigit():
+                conversation = self.store.get_conversation(int(target))
+                if conversation is None or conversation.model_id != self.model_config.id:
+                    self.console.print(
+                        f"No conversation {target} with {self.model_config.name}",
+                        style=STYLES["error"],
+                    )
+                    return
+            else:
+                conversation = self.store.find_session(self.model_config.id, target)
+        except sqlite3.Error:
+            self.console.print("Could not read the conversation history", style=STYLES["error"])
+            return
+
+        if self._compaction_task is not None:
+            self._compaction_task.cancel()
+            self._compaction_task = None
+        self._prefetched = None
+
+        # Store unsaved changes, like a cleared conversation, before leaving it
+        if self.conversation.id is not None and self.messages != self.conversation.persisted:
+            self._save_history()
+
+        if conversation is None:
+            self.messages = [m for m in self.messages if m.role == Role.SYSTEM]
+            self.conversation = ConversationRef(self.model_config, name=target)
+            self.summary = None
+            self.console.print(f"Starting session '{target}'.", style=STYLES["info"])
+            return
+
+        try:
+            self._load_conversation(conversation)
+        except sqlite3.Error:
+            self.console.print("Could not read the conversation history", style=STYLES["error"])
+            return
+        label = f"session '{conversation.name}'" if conversation.name else f"conversation {target}"
+        self.console.print(f"Switched to {label}.", style=STYLES["info"])
+        self.console.print()
+        self._display_messages()
+
+    def _start_compaction(self) -> None:
+        """Summarize old turns in the background once the conversation gets long.
+
+        The user doesn't wait for the summary: until it is ready, requests
+        include the turns it will replace. The summary is stored with the
+        conversation, and the original messages are kept.
+        """
+        if self.summarizer is None:
+            return
+        if self._compaction_task is not None and not self._compaction_task.done():
+            return
+        covers = plan_compaction(
+            self.messages, self.summary, self.token_counter, self.compact_threshold
+        )
+        if covers is not None:
+            self._compaction_task = asyncio.create_task(self._compact(covers))
+
+    async def _compact(self, covers: int) -> None:
+        """Replace the first ``covers`` turns with an updated summary."""
+        assert self.summarizer is not None
+        messages = list(self.messages)
+        try:
+            summary = await summarize(self.summarizer, messages, self.summary, covers)
+        except Exception:
+            # Tried again after the next turn
+            return
+
+        # Only use the summary if the turns it covers weren't cleared meanwhile
+        summarized = [m for m in messages if m.role != Role.SYSTEM][:covers]
+        current = [m for m in self.messages if m.role != Role.SYSTEM][:covers]
+        if len(current) == covers and all(old is new for old, new in zip(summarized, current)):
+            self.summary = summary
+            self._save_summary()
+
+    def _save_summary(self) -> None:
+        """Store the current summary with the conversation in the background."""
+        text, covers = (self.summary.text, self.summary.covers) if self.summary else (None, 0)
+        self.writer.save_summary(self.conversation, text, covers)
+
+    def _start_prefetch(self) -> None:
+        """Warm up the service for the next request while the user types.
+
+        The service opens its connection and may prime the provider's prompt
+        cache with the conversation so far, so less of the wait happens after
+        Enter. Failures are ignored; the request itself will report them.
+        """
+        if not self.prefetch or (self._prefetch_task and not self._prefetch_task.done()):
+            return
+
+        async def prefetch(messages: list[Message]) -> None:
+            try:
+                await asyncio.wait_for(self.service.warmup(messages), PREFETCH_TIMEOUT)
+            except Exception:
+                pass
+
+        messages, _ = self._context_messages()
+        if messages == self._prefetched:
+            # Nothing changed since the last prompt, e.g. after an empty line
+            return
+        self._prefetched = messages
+        self._prefetch_task = asyncio.create_task(prefetch(messages))
+
+    async def _read_input(self) -> str:
+        """Read a line from stdin while letting background tasks, like the prefetch, run.
+
+        A terminal only becomes readable once Enter is pressed, so the event
+        loop waits for that and then reads the line without blocking. Where
+        stdin can't be watched, input() blocks as before.
+        """
+        if not sys.stdin.isatty():
+            return input()
+
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = sys.stdin.fileno()
+
+        def on_readable() -> None:
+            if not ready.done():
+                ready.set_result(None)
+
+        try:
+            loop.add_reader(fd, on_readable)
+        except NotImplementedError:
+            # The Windows event loop can't watch console handles
+            return input()
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fd)
+        return input()
+
+    def _response_title(self, model: ModelConfig | None) -> str:
+        """Name the model that answered, which the router picks for each request."""
+        if model is None or model is self.model_config:
+            return self.model_config.name
+        return f"{self.model_config.name}: {model.name}"
+
+    def _response_rule(self, title: str) -> Rule:
+        """Make the line that heads a reply shown without a box."""
+        return Rule(title, align="left", style=STYLES["assistant_name"])
+
+    def _scroll_out(self, console: Console, renderer: StreamingMarkdown) -> None:
+        """Print the finished blocks of a streaming reply above the live display."""
+        finished = renderer.take_frozen()
+        if finished is not None:
+            console.print(finished)
+
+    def _end_tee(self, reply: str) -> None:
+        """End a reply in the tee file, so that the next one starts on a new line."""
+        if self._tee_file is not None:
+            if not reply.endswith("\n"):
+                self._tee_file.write("\n")
+            self._tee_file.flush()
+
+    def _show_stats(self) -> None:
+        """Show the latency and token statistics of the last response."""
+        if self.show_stats and isinstance(self.service, InstrumentedService):
+            metrics = self.service.last_metrics
+            if metrics is not None:
+                self.console.print(metrics.status_line(), style=STYLES["system_message"])
 
     def _show_help(self) -> None:
         """Display help information."""
@@ -343,12 +679,15 @@ class ChatInterface:
         
         - `/exit` or `/quit` - Exit the chat (saves conversation to markdown)
         - `/clear` - Clear the conversation history
+        - `/sessions` - List the saved conversations with this model
+        - `/switch NAME` or `/switch ID` - Switch to another conversation, or start a new named session
         - `/system` - Update the system prompt
         - `/help` - Show this help message
         
         # Tips
         
         - Use `cliai chat --continue` or `cliai chat -c` to continue the previous conversation
+        - Use `cliai chat --session NAME` to continue or start a named session
         - Conversations are automatically saved as markdown files when you exit
         """
 
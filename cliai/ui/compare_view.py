@@ -0,0 +1,182 @@
+"""Side-by-side display of several models answering the same prompt."""
+
+import asyncio
+import time
+from typing import AsyncGenerator
+
+from rich.console import Console, Group
+from rich.live import Live
+from rich.markdown import Markdown
+from rich.panel import Panel
+from rich.spinner import Spinner
+from rich.table import Table
+
+from ..config import ModelConfig
+from ..services import AIService, Message
+from ..services.fanout import race_complete, race_first_chunk
+from .streaming import REFRESH_PER_SECOND, StreamingMarkdown
+from .style import STYLES
+
+
+class _Column:
+    """The streamed answer and status of one model."""
+
+    def __init__(self, model_config: ModelConfig, max_lines: int):
+        self.model_config = model_config
+        self.renderer = StreamingMarkdown(max_lines=max_lines)
+        self.chunks: list[str] = []
+        self.status = "waiting"
+        self.error: str | None = None
+
+    def panel(self) -> Panel:
+        body = self.renderer if self.error is None else Group(self.renderer, f"Error: {self.error}")
+        style = STYLES["error" if self.error else self.model_config.provider.value.lower()]
+        return Panel(
+            body,
+            title=self.model_config.name,
+            title_align="left",
+            subtitle=self.status,
+            subtitle_align="right",
+            border_style=style,
+        )
+
+
+class CompareView:
+    """Stream the answers of several models next to each other."""
+
+    def __init__(self, console: Console, services: list[AIService]):
+        """Initialize the view.
+
+        Args:
+            console: The console to draw on
+            services: One service per column, in display order
+        """
+        self.console = console
+        self.services = services
+        # Leave room for the panel borders and the status line
+        max_lines = max(1, console.size.height - 4)
+        self.columns = [_Column(service.model_config, max_lines) for service in services]
+
+    def __rich__(self) -> Table:
+        grid = Table.grid(expand=True, padding=(0, 1))
+        for _ in self.columns:
+            grid.add_column(ratio=1)
+        grid.add_row(*(column.panel() for column in self.columns))
+        return grid
+
+    async def run(self, messages: list[Message]) -> list[str | None]:
+        """Send the messages to every service and stream the answers.
+
+        A failing model shows its error in its own column and does not stop
+        the others.
+
+        Args:
+            messages: The conversation to send
+
+        Returns:
+            The complete answer of each model, or None where the request failed
+        """
+        with Live(self, console=self.console, refresh_per_second=REFRESH_PER_SECOND) as live:
+            results = await asyncio.gather(
+                *(
+                    self._stream(service, column, messages)
+                    for service, column in zip(self.services, self.columns)
+                )
+            )
+            # Show the whole answers once every stream has finished
+            for column in self.columns:
+                column.renderer.max_lines = None
+            live.refresh()
+        return results
+
+    async def _stream(
+        self, service: AIService, column: _Column, messages: list[Message]
+    ) -> str | None:
+        """Stream one model's answer into its column."""
+        started = time.monotonic()
+        column.status = "thinking..."
+        try:
+            response = await service.generate_response(messages, stream=True)
+            if isinstance(response, str):
+                column.chunks.append(response)
+                column.renderer.append(response)
+            else:
+                column.status = "streaming..."
+                async for chunk in response:
+                    column.chunks.append(chunk)
+                    column.renderer.append(chunk)
+        except Exception as e:
+            column.error = str(e)
+            column.status = f"failed after {time.monotonic() - started:.1f}s"
+            return None
+
+        column.status = f"{time.monotonic() - started:.1f}s"
+        return "".join(column.chunks)
+
+
+async def show_race(
+    console: Console,
+    services: list[AIService],
+    messages: list[Message],
+    first_chunk: bool = False,
+) -> tuple[AIService, str]:
+    """Race the services and show the winning answer.
+
+    Args:
+        console: The console to draw on
+        services: The services to race; the losers are closed
+        messages: The conversation to send
+        first_chunk: Pick the model that starts answering first, instead of
+            the one that finishes first
+
+    Returns:
+        The winning service and its complete answer
+    """
+    names = ", ".join(service.model_config.name for service in services)
+    started = time.monotonic()
+
+    with Live(
+        Spinner("dots", text=f"Racing {names}..."),
+        console=console,
+        refresh_per_second=REFRESH_PER_SECOND,
+    ) as live:
+        if not first_chunk:
+            winner, text = await race_complete(services, messages)
+            renderer: Markdown | StreamingMarkdown = Markdown(text)
+        else:
+            winner, stream = await race_first_chunk(services, messages)
+            renderer = StreamingMarkdown(max_lines=max(1, console.size.height - 4))
+            text = await _follow(live, _race_panel(winner, renderer, None), renderer, stream)
+            renderer.max_lines = None
+
+        elapsed = time.monotonic() - started
+        live.update(_race_panel(winner, renderer, elapsed), refresh=True)
+
+    return winner, text
+
+
+def _race_panel(
+    winner: AIService, body: Markdown | StreamingMarkdown, elapsed: float | None
+) -> Panel:
+    """Build the panel that shows the winning answer."""
+    status = "winner" if elapsed is None else f"winner in {elapsed:.1f}s"
+    return Panel(
+        body,
+        title=winner.model_config.name,
+        title_align="left",
+        subtitle=status,
+        subtitle_align="right",
+        border_style=STYLES[winner.model_config.provider.value.lower()],
+    )
+
+
+async def _follow(
+    live: Live, panel: Panel, renderer: StreamingMarkdown, stream: AsyncGenerator[str, None]
+) -> str:
+    """Stream the winner's answer into the live display."""
+    live.update(panel)
+    chunks = []
+    async for chunk in stream:
+        chunks.append(chunk)
+        renderer.append(chunk)
+    return "".join(chunks)
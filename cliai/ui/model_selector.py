@@ -9,7 +9,7 @@ from rich.table import Table
 from ..config import (
     ModelConfig,
     Provider,
-    AVAILABLE_MODELS,
+    get_available_models,
     get_default_model,
     get_model_by_id,
     get_models_by_provider,
@@ -26,7 +26,7 @@ def _create_model_table() -> Table:
     table.add_column("Provider")
     table.add_column("Description")
 
-    for i, model in enumerate(AVAILABLE_MODELS, 1):
+    for i, model in enumerate(get_available_models(), 1):
         provider_style = model.provider.value.lower()
 
         table.add_row(
@@ -71,28 +71,29 @@ def select_model(model_id: Optional[str] = None) -> ModelConfig:
     console.print()
 
     # Get user selection
+    models = get_available_models()
     default_model = get_default_model()
-    default_index = AVAILABLE_MODELS.index(default_model) + 1
+    default_index = models.index(default_model) + 1
 
     while True:
         try:
             choice = console.input(
-                f"Enter model number [1-{len(AVAILABLE_MODELS)}] (default: {default_index}): "
+                f"Enter model number [1-{len(models)}] (default: {default_index}): "
             )
 
             if not choice:
                 return default_model
 
             index = int(choice) - 1
-            if 0 <= index < len(AVAILABLE_MODELS):
-                selected_model = AVAILABLE_MODELS[index]
+            if 0 <= index < len(models):
+                selected_model = models[index]
                 console.print(
                     f"Selected: [bold]{selected_model.name}[/bold]", style=STYLES["success"]
                 )
                 return selected_model
             else:
                 console.print(
-                    f"Please enter a number between 1 and {len(AVAILABLE_MODELS)}",
+                    f"Please enter a number between 1 and {len(models)}",
                     style=STYLES["error"],
                 )
         except ValueError:
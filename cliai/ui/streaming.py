@@ -0,0 +1,219 @@
+"""Incremental Markdown rendering for streamed responses."""
+
+import time
+
+from rich.console import Console, ConsoleOptions, Group, RenderableType, RenderResult
+from rich.markdown import Markdown
+from rich.padding import Padding
+from rich.segment import Segment
+
+
+# How often the live display is refreshed while a response is streaming
+REFRESH_PER_SECOND = 10
+
+
+def _render_block(
+    markdown: Markdown, console: Console, options: ConsoleOptions
+) -> list[list[Segment]]:
+    """Render a single Markdown block without its surrounding blank lines."""
+    lines = console.render_lines(markdown, options.update(height=None), pad=False)
+    while lines and not any(segment.text for segment in lines[0]):
+        lines.pop(0)
+    while lines and not any(segment.text for segment in lines[-1]):
+        lines.pop()
+    return lines
+
+
+class _FrozenBlock:
+    """A finished Markdown block whose rendered lines are cached per width."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self._width: int | None = None
+        self._lines: list[list[Segment]] = []
+
+    def render_lines(self, console: Console, options: ConsoleOptions) -> list[list[Segment]]:
+        if self._width != options.max_width:
+            self._lines = _render_block(Markdown(self.source), console, options)
+            self._width = options.max_width
+        return self._lines
+
+    def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
+        new_line = Segment.line()
+        for line in self.render_lines(console, options):
+            yield from line
+            yield new_line
+
+
+class StreamingMarkdown:
+    """A Markdown renderable that can be appended to while it is displayed.
+
+    Text is split into top-level Markdown blocks as it arrives. Blocks that can
+    no longer change are rendered once and frozen; only the last, still open
+    block is re-parsed, and only when the display is actually refreshed.
+
+    While ``max_lines`` is set, only the last ``max_lines`` lines are rendered,
+    so the cost of a refresh depends on the screen size, not the reply length.
+    A display that prints finished blocks elsewhere can remove them with
+    :meth:`take_frozen`, so that they aren't kept either.
+    """
+
+    def __init__(self, max_lines: int | None = None) -> None:
+        self._max_lines = max_lines
+        self._frozen: list[_FrozenBlock] = []
+        # The open block is kept as its complete lines, each ending in a
+        # newline, and the chunks of the line after them, so that appending
+        # costs the same however long the block gets
+        self._lines: list[str] = []
+        self._partial: list[str] = []
+        self._tail_markdown: Markdown | None = None
+        # Scanner state for the complete lines of the open block
+        self._in_fence = False
+        self._after_blank = False
+        # Index of the line opening the current fenced code block
+        self._fence_start = 0
+
+    @property
+    def max_lines(self) -> int | None:
+        """The number of lines to render from the end, or None for all."""
+        return self._max_lines
+
+    @max_lines.setter
+    def max_lines(self, max_lines: int | None) -> None:
+        self._max_lines = max_lines
+        # The open block may have been cut to the previous limit
+        self._tail_markdown = None
+
+    def append(self, chunk: str) -> None:
+        """Append a chunk of streamed text.
+
+        Args:
+            chunk: The text to append
+        """
+        if not chunk:
+            return
+        self._tail_markdown = None
+        first, *rest = chunk.split("\n")
+        self._partial.append(first)
+        for part in rest:
+            self._scan_line("".join(self._partial) + "\n")
+            self._partial = [part]
+
+        # A non-indented line after a blank line starts a new block as soon
+        # as its first character arrives
+        start = next((part for part in self._partial if part), "")
+        if not self._in_fence and self._after_blank and start and not start[0].isspace():
+            self._freeze()
+            self._after_blank = False
+
+    def _scan_line(self, line: str) -> None:
+        """Add a complete line to the open block, freezing the block it finishes."""
+        stripped = line.strip()
+        is_fence = stripped.startswith(("```", "~~~"))
+
+        if self._in_fence:
+            if is_fence:
+                self._in_fence = False
+        elif self._after_blank and not line[0].isspace():
+            # A non-indented line after a blank line starts a new block
+            self._freeze()
+            self._after_blank = False
+            if is_fence:
+                self._in_fence = True
+                self._fence_start = 0
+        elif is_fence:
+            self._in_fence = True
+            self._fence_start = len(self._lines)
+        elif not stripped:
+            self._after_blank = True
+        else:
+            self._after_blank = False
+        self._lines.append(line)
+
+    def _freeze(self) -> None:
+        """Freeze the complete lines of the open block as a finished block."""
+        source = "".join(self._lines).strip("\n")
+        if source:
+            self._frozen.append(_FrozenBlock(source))
+        self._lines = []
+
+    def take_frozen(self) -> RenderableType | None:
+        """Remove the finished blocks, to be printed outside the live display.
+
+        Returns:
+            The blocks finished since the last call, each followed by a blank
+            line, or None if no block was finished
+        """
+        if not self._frozen:
+            return None
+        blocks, self._frozen = self._frozen, []
+        return Group(*(Padding(block, (0, 0, 1, 0)) for block in blocks))
+
+    def _open_source(self) -> str:
+        """Get the Markdown source of the open block to render.
+
+        Within a fenced code block longer than ``max_lines``, only the line
+        opening the fence and the last ``max_lines`` lines are rendered, so
+        that following a huge code block doesn't re-parse or even join all
+        of it.
+        """
+        partial = "".join(self._partial)
+        if self.max_lines is not None and self._in_fence:
+            content_start = self._fence_start + 1
+            if len(self._lines) - content_start >= self.max_lines:
+                last_lines = self._lines[len(self._lines) - (self.max_lines - 1) :]
+                return self._lines[self._fence_start] + "".join(last_lines) + partial
+        return "".join(self._lines) + partial
+
+    def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
+        new_line = Segment.line()
+        blocks: list[list[list[Segment]]] = []
+
+        if self._tail_markdown is None:
+            source = self._open_source()
+            self._tail_markdown = Markdown(source) if source.strip() else None
+        if self._tail_markdown is not None:
+            blocks.append(_render_block(self._tail_markdown, console, options))
+
+        # Collect blocks from the end so that a bounded view only touches the
+        # blocks that are actually visible.
+        budget = self.max_lines
+        collected = sum(len(lines) for lines in blocks)
+        for block in reversed(self._frozen):
+            if budget is not None and collected >= budget:
+                break
+            blocks.append(block.render_lines(console, options))
+            collected += len(blocks[-1]) + 1
+        blocks.reverse()
+
+        output: list[list[Segment]] = []
+        for index, lines in enumerate(blocks):
+            if index:
+                output.append([])
+            output.extend(lines)
+        if budget is not None:
+            output = output[-budget:]
+
+        for line in output:
+            yield from line
+            yield new_line
+
+
+class ChunkCoalescer:
+    """Decide when buffered chunks should be pushed to the display.
+
+    Streams can deliver far more chunks per second than the terminal is
+    refreshed, so updates are only released at the live refresh rate.
+    """
+
+    def __init__(self, refresh_per_second: float = REFRESH_PER_SECOND):
+        self.interval = 1.0 / refresh_per_second
+        self._last_flush = 0.0
+
+    def ready(self) -> bool:
+        """Return True if enough time has passed since the last flush."""
+        now = time.monotonic()
+        if now - self._last_flush >= self.interval:
+            self._last_flush = now
+            return True
+        return False
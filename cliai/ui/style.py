@@ -9,6 +9,8 @@ COLORS = {
     "openai": "#00A67D",  # OpenAI green
     "anthropic": "#D0A215",  # Anthropic gold
     "google": "#4285F4",  # Google blue
+    "local": "#20B2AA",  # Light sea green for self-hosted models
+    "auto": "#DA70D6",  # Orchid for the router
     "user": "#9370DB",  # Purple for user
     "system": "#808080",  # Gray for system
     "assistant": "#4169E1",  # Royal blue for assistant
@@ -32,6 +34,8 @@ STYLES = {
     "openai": Style(color=COLORS["openai"], bold=True),
     "anthropic": Style(color=COLORS["anthropic"], bold=True),
     "google": Style(color=COLORS["google"], bold=True),
+    "local": Style(color=COLORS["local"], bold=True),
+    "auto": Style(color=COLORS["auto"], bold=True),
     # Message styles
     "user_name": Style(color=COLORS["user"], bold=True),
     "user_message": Style(color="white"),
@@ -65,6 +69,8 @@ THEME = Theme(
         "openai": COLORS["openai"],
         "anthropic": COLORS["anthropic"],
         "google": COLORS["google"],
+        "local": COLORS["local"],
+        "auto": COLORS["auto"],
         "highlight": COLORS["highlight"],
     }
 )
@@ -0,0 +1,67 @@
+"""Shared fixtures: services run against the mock provider server from the benchmarks."""
+
+from typing import AsyncIterator, Awaitable, Callable
+
+import pytest
+from openai import AsyncOpenAI
+
+from benchmarks.mock_server import MockProviderServer, MockSettings
+from cliai.config import ModelConfig, Provider
+from cliai.services.transport import aclose_http_clients
+
+StartMock = Callable[[MockSettings], Awaitable[MockProviderServer]]
+MockClient = Callable[[MockProviderServer], AsyncOpenAI]
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+async def start_mock() -> AsyncIterator[StartMock]:
+    """Start mock provider servers in the test's event loop; they are stopped afterwards."""
+    servers: list[MockProviderServer] = []
+
+    async def start(settings: MockSettings) -> MockProviderServer:
+        server = MockProviderServer(settings)
+        await server.start()
+        servers.append(server)
+        return server
+
+    yield start
+
+    # The shared connection pools are bound to this event loop
+    await aclose_http_clients()
+    for server in servers:
+        await server.stop()
+
+
+@pytest.fixture
+async def mock_client() -> AsyncIterator[MockClient]:
+    """Create OpenAI clients for mock servers; they are closed afterwards."""
+    clients: list[AsyncOpenAI] = []
+
+    def create(server: MockProviderServer) -> AsyncOpenAI:
+        client = AsyncOpenAI(
+            base_url=server.environment["OPENAI_BASE_URL"], api_key="mock", max_retries=0
+        )
+        clients.append(client)
+        return client
+
+    yield create
+
+    for client in clients:
+        await client.close()
+
+
+def mock_model(server: MockProviderServer) -> ModelConfig:
+    """Configure a self-hosted model served by the mock's OpenAI-compatible API."""
+    return ModelConfig(
+        id="mock-model",
+        name="Mock",
+        provider=Provider.LOCAL,
+        max_tokens=100,
+        description="Mock provider server",
+        base_url=server.environment["OPENAI_BASE_URL"],
+    )
@@ -0,0 +1,107 @@
+"""Reading batch input files and resuming into an interrupted output file."""
+
+from pathlib import Path
+
+import pytest
+
+from cliai import batch
+from cliai.batch import drop_partial_line, read_completed_ids, read_requests
+from cliai.services import Role
+
+
+def test_requests_are_read(tmp_path: Path) -> None:
+    input_file = tmp_path / "input.jsonl"
+    input_file.write_text(
+        '{"prompt": "Hi"}\n'
+        "\n"
+        '{"id": "b", "model": "gpt", "system": "Be brief",'
+        ' "messages": [{"role": "user", "content": "Hello"}]}\n'
+    )
+
+    first, second = read_requests(input_file, "claude")
+
+    assert (first.id, first.model_id) == ("1", "claude")
+    assert [(m.role, m.content) for m in first.messages] == [(Role.USER, "Hi")]
+    assert (second.id, second.model_id) == ("b", "gpt")
+    assert [m.role for m in second.messages] == [Role.SYSTEM, Role.USER]
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "[1]",
+        '"x"',
+        "null",
+        "{not json",
+        '{"messages": "x"}',
+        '{"messages": [1]}',
+        '{"messages": [{"role": "user"}]}',
+        '{"messages": [{"role": "robot", "content": "Beep"}]}',
+        '{"messages": [{"role": "user", "content": ["Hi"]}]}',
+        '{"prompt": 1}',
+        '{"prompt": "Hi", "system": {"text": "Be brief"}}',
+        '{"text": "Hi"}',
+    ],
+)
+def test_invalid_lines_are_rejected(tmp_path: Path, line: str) -> None:
+    input_file = tmp_path / "input.jsonl"
+    input_file.write_text('{"prompt": "Hi"}\n' + line + "\n")
+
+    with pytest.raises(ValueError, match="^line 2: "):
+        read_requests(input_file, "claude")
+
+
+def test_resuming_drops_a_partial_last_line(tmp_path: Path) -> None:
+    output_file = tmp_path / "output.jsonl"
+    output_file.write_text(
+        '{"id": "1", "response": "Hi"}\n{"id": "2", "error": "Busy"}\n{"id": "3", "resp'
+    )
+
+    drop_partial_line(output_file)
+    with open(output_file, "a") as f:
+        f.write('{"id": "3", "response": "Hello"}\n')
+
+    assert read_completed_ids(output_file) == {"1", "3"}
+    assert output_file.read_text().splitlines()[-1] == '{"id": "3", "response": "Hello"}'
+
+
+def test_complete_output_is_left_alone(tmp_path: Path) -> None:
+    content = '{"id": "1", "response": "Hi"}\n'
+    output_file = tmp_path / "output.jsonl"
+    output_file.write_text(content)
+
+    drop_partial_line(output_file)
+    drop_partial_line(tmp_path / "missing.jsonl")
+
+    assert output_file.read_text() == content
+    assert not (tmp_path / "missing.jsonl").exists()
+
+
+def test_results_without_an_id_are_ignored(tmp_path: Path) -> None:
+    output_file = tmp_path / "output.jsonl"
+    output_file.write_text('{"response": "Hi"}\n{"id": 2, "response": "Hello"}\n')
+
+    assert read_completed_ids(output_file) == {"2"}
+
+
+@pytest.mark.parametrize("partial", ["", '{"id": "9", "resp', "x" * 25])
+def test_the_partial_line_is_found_across_blocks(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, partial: str
+) -> None:
+    monkeypatch.setattr(batch, "_BLOCK_SIZE", 8)
+    complete = "".join(f'{{"id": "{n}", "response": "Hi"}}\n' for n in range(3))
+    output_file = tmp_path / "output.jsonl"
+    output_file.write_text(complete + partial)
+
+    drop_partial_line(output_file)
+
+    assert output_file.read_text() == complete
+
+
+def test_a_single_partial_line_is_dropped(tmp_path: Path) -> None:
+    output_file = tmp_path / "output.jsonl"
+    output_file.write_text('{"id": "1", "resp')
+
+    drop_partial_line(output_file)
+
+    assert output_file.read_text() == ""
@@ -0,0 +1,49 @@
+"""The response cache against the mock provider server."""
+
+from pathlib import Path
+from typing import AsyncGenerator, Awaitable
+
+import pytest
+
+from benchmarks.mock_server import MockSettings
+from cliai.services.base import Message, Role
+from cliai.services.cache import CachedService, ResponseCache
+from cliai.services.metrics import InstrumentedService, RequestMetrics
+from cliai.services.openai_compat_service import OpenAICompatService
+from cliai.services.scheduler import RequestScheduler
+from tests.conftest import StartMock, mock_model
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_hits_are_recorded_without_tokens_alongside_misses(
+    start_mock: StartMock, tmp_path: Path
+) -> None:
+    server = await start_mock(MockSettings(ttft=0.01, tokens_per_second=2000, tokens=20))
+    provider = OpenAICompatService(mock_model(server))
+    provider.scheduler = RequestScheduler()
+    recorded: list[RequestMetrics] = []
+    service = InstrumentedService(
+        CachedService(provider, ResponseCache(tmp_path / "responses.sqlite3")), [recorded.append]
+    )
+
+    def ask(prompt: str) -> Awaitable[AsyncGenerator[str, None] | str]:
+        return service.generate_response([Message(role=Role.USER, content=prompt)])
+
+    await read_all(await ask("Cached"))
+
+    # A miss runs while the replay of a hit is in progress
+    hit = await ask("Cached")
+    await read_all(await ask("New"))
+    await read_all(hit)
+
+    first, new, replay = [(metrics.input_tokens, metrics.output_tokens) for metrics in recorded]
+    assert server.requests == 2
+    assert first == new == (9, 20)
+    assert replay == (0, 0)
+
+
+async def read_all(response: AsyncGenerator[str, None] | str) -> str:
+    if isinstance(response, str):
+        return response
+    return "".join([chunk async for chunk in response])
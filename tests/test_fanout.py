@@ -0,0 +1,46 @@
+"""Racing several services for the first response."""
+
+import asyncio
+from typing import AsyncGenerator
+
+import pytest
+
+from cliai.services.base import AIService, Message, Role
+from cliai.services.fanout import race_first_chunk
+
+pytestmark = pytest.mark.anyio
+
+
+class CountingService(AIService):
+    """A service that streams numbers after a delay and records when its stream ends."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.finished = False
+
+    async def generate_response(
+        self, messages: list[Message], stream: bool = True
+    ) -> AsyncGenerator[str, None] | str:
+        return self._count()
+
+    async def _count(self) -> AsyncGenerator[str, None]:
+        try:
+            await asyncio.sleep(self.delay)
+            for n in range(100):
+                yield str(n)
+        finally:
+            self.finished = True
+
+    async def close(self) -> None:
+        pass
+
+
+async def test_stopping_early_closes_the_winning_stream() -> None:
+    fast, slow = CountingService(0.01), CountingService(5.0)
+
+    winner, stream = await race_first_chunk([fast, slow], [Message(role=Role.USER, content="Hi")])
+    assert [await stream.__anext__() for _ in range(3)] == ["0", "1", "2"]
+    await stream.aclose()
+
+    assert winner is fast
+    assert fast.finished and slow.finished
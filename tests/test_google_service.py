@@ -0,0 +1,91 @@
+"""Gemini chat sessions against the mock provider server."""
+
+import asyncio
+import warnings
+
+import pytest
+
+from benchmarks.mock_server import MockSettings
+from cliai.config import ModelConfig, Provider
+from cliai.services.base import Message, Role
+from tests.conftest import StartMock
+
+with warnings.catch_warnings():
+    # The deprecated SDK warns on import
+    warnings.simplefilter("ignore", FutureWarning)
+    from cliai.services.google_service import GoogleService
+
+pytestmark = pytest.mark.anyio
+
+MODEL = ModelConfig(
+    id="gemini-mock", name="Gemini", provider=Provider.GOOGLE, max_tokens=100, description="Mock"
+)
+
+
+@pytest.fixture
+async def service(start_mock: StartMock, monkeypatch: pytest.MonkeyPatch) -> GoogleService:
+    server = await start_mock(MockSettings(ttft=0.05, tokens_per_second=2000, tokens=20))
+    monkeypatch.setenv("GOOGLE_API_ENDPOINT", server.environment["GOOGLE_API_ENDPOINT"])
+    monkeypatch.setenv("GOOGLE_API_KEY", "mock")
+    return GoogleService(MODEL)
+
+
+def user(content: str) -> Message:
+    return Message(role=Role.USER, content=content)
+
+
+async def ask(service: GoogleService, messages: list[Message]) -> str:
+    response = await service.generate_response(messages, stream=True)
+    assert not isinstance(response, str)
+    return "".join([chunk async for chunk in response])
+
+
+async def test_the_session_is_reused_for_the_next_turn(service: GoogleService) -> None:
+    conversation = [user("Hi")]
+    conversation.append(Message(role=Role.ASSISTANT, content=await ask(service, conversation)))
+    session = service._session
+    conversation.append(user("More"))
+
+    await ask(service, conversation)
+
+    assert service._session is session
+    assert session is not None and len(session.chat.history) == 4
+
+
+async def test_concurrent_conversations_get_their_own_sessions(service: GoogleService) -> None:
+    first = [user("First")]
+    second = [user("Second"), Message(role=Role.ASSISTANT, content="Yes"), user("Again")]
+
+    await asyncio.gather(ask(service, first), ask(service, second))
+
+    session = service._session
+    assert session is not None
+    history = [
+        (Role.USER if content.role == "user" else Role.ASSISTANT, content.parts[0].text)
+        for content in session.chat.history
+    ]
+    assert history == session.messages
+    assert history[0][1] in ("First", "Second")
+    assert len(history) == len(first if history[0][1] == "First" else second) + 1
+
+
+async def test_a_changed_conversation_gets_a_new_session(service: GoogleService) -> None:
+    reply = await ask(service, [user("Hi")])
+    session = service._session
+
+    # Same length and ends as the session, but a different message in the middle
+    await ask(service, [user("Hi"), Message(role=Role.ASSISTANT, content=reply), user("Go")])
+    await ask(
+        service,
+        [
+            user("Hi"),
+            Message(role=Role.ASSISTANT, content="Edited"),
+            user("Go"),
+            Message(role=Role.ASSISTANT, content=reply),
+            user("Again"),
+        ],
+    )
+
+    assert service._session is not session
+    assert service._session is not None
+    assert (Role.ASSISTANT, "Edited") in service._session.messages
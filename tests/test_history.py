@@ -0,0 +1,53 @@
+"""Importing the old single-file JSON history into the conversation store."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from cliai.history.store import ConversationStore
+from cliai.services import Role
+
+
+def import_legacy(tmp_path: Path, content: str) -> ConversationStore:
+    store = ConversationStore(tmp_path / "history.sqlite3")
+    legacy_file = tmp_path / "history.json"
+    legacy_file.write_text(content)
+    store._import_legacy_history(legacy_file)
+    return store
+
+
+@pytest.mark.parametrize("content", ["{not json", "[1", '{"a": 1}', '"x"', "1"])
+def test_malformed_history_is_moved_aside(tmp_path: Path, content: str) -> None:
+    store = import_legacy(tmp_path, content)
+
+    assert not (tmp_path / "history.json").exists()
+    assert [p.read_text() for p in tmp_path.glob("history.json.corrupt-*")] == [content]
+    assert store._connection.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == 0
+
+
+def test_malformed_entries_are_skipped(tmp_path: Path) -> None:
+    history = [
+        1,
+        "x",
+        {"messages": "x", "model_id": "gpt"},
+        {
+            "model_id": "gpt",
+            "model_name": ["GPT"],
+            "messages": [
+                1,
+                {"role": "user", "content": 5},
+                {"role": "robot", "content": "Beep"},
+                {"role": "user", "content": "Hi"},
+            ],
+        },
+    ]
+    store = import_legacy(tmp_path, json.dumps(history))
+
+    conversations = store.list_conversations("gpt")
+    assert len(conversations) == 2
+    assert [c.model_name for c in conversations] == ["", ""]
+    assert [
+        (m.role, m.content) for c in conversations for m in store.load_messages(c.id)
+    ] == [(Role.USER, "Hi")]
+    assert (tmp_path / "history.json.migrated").exists()
@@ -0,0 +1,44 @@
+"""Reading additional models from the models file."""
+
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+from cliai.config import models
+from cliai.main import app
+
+
+@pytest.fixture
+def models_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Point the CLI at a models file that is read afresh."""
+    path = tmp_path / "models.toml"
+    monkeypatch.setenv("CLIAI_MODELS_FILE", str(path))
+    monkeypatch.setattr(models, "AVAILABLE_MODELS", list(models.AVAILABLE_MODELS))
+    monkeypatch.setattr(models, "DEFAULT_MODEL_ID", models.DEFAULT_MODEL_ID)
+    monkeypatch.setattr(models, "_configured_models_added", False)
+    return path
+
+
+def test_models_are_added(models_file: Path) -> None:
+    models_file.write_text(
+        'default_model = "llama"\n[[models]]\nid = "llama"\nbase_url = "http://localhost:8000/v1"\n'
+    )
+
+    llama = models.get_model_by_id("llama")
+
+    assert llama is not None and llama.provider == models.Provider.LOCAL
+    assert models.get_default_model() is llama
+    assert models.get_model_by_id(models.AVAILABLE_MODELS[0].id) is not None
+
+
+def test_an_invalid_file_is_reported_without_a_traceback(models_file: Path) -> None:
+    models_file.write_text('[[models]]\nname = "No ID"\n')
+    runner = CliRunner()
+
+    result = runner.invoke(app, ["models"])
+
+    output = " ".join(result.output.split())
+    assert result.exit_code == 1
+    assert output.startswith(f"Error: Invalid model 1 in {models_file}: id is required")
+    assert runner.invoke(app, ["--help"]).exit_code == 0
@@ -0,0 +1,151 @@
+"""Timeouts and retries of ResilientService against the mock provider server."""
+
+import asyncio
+import time
+from typing import AsyncGenerator, AsyncIterable
+
+import pytest
+from openai import BadRequestError, RateLimitError
+
+from benchmarks.mock_server import MockProviderServer, MockSettings
+from cliai.services.base import AIService, Message, Role
+from cliai.services.openai_compat_service import OpenAICompatService
+from cliai.services.resilience import ResilientService, RetryPolicy
+from cliai.services.scheduler import RequestScheduler
+from tests.conftest import StartMock, mock_model
+from tests.test_scheduler import FakeClock
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [Message(role=Role.USER, content="Hi")]
+
+
+def create_service(server: MockProviderServer, **policy: float) -> ResilientService:
+    """Wrap a service for the mock with a quick retry policy and its own scheduler."""
+    service = OpenAICompatService(mock_model(server))
+    service.scheduler = RequestScheduler()
+    return ResilientService(service, RetryPolicy(base_delay=0.01, max_delay=0.01, **policy))
+
+
+def in_flight(service: ResilientService) -> int:
+    inner = service.inner
+    assert isinstance(inner, OpenAICompatService)
+    return inner.scheduler.concurrency("Local").in_flight
+
+
+class UnresponsiveService(AIService):
+    """A service whose provider never accepts the request."""
+
+    def __init__(self, server: MockProviderServer):
+        self.model_config = mock_model(server)
+        self.scheduler = RequestScheduler()
+        self.attempts = 0
+
+    async def generate_response(
+        self, messages: list[Message], stream: bool = True
+    ) -> AsyncGenerator[str, None] | str:
+        return self.scheduler.stream("Local", "mock", self._open)
+
+    async def _open(self) -> AsyncIterable[str]:
+        self.attempts += 1
+        await asyncio.Event().wait()
+        raise AssertionError("unreachable")
+
+    async def close(self) -> None:
+        pass
+
+
+async def read_all(service: AIService, stream: bool = True) -> str:
+    response = await service.generate_response(MESSAGES, stream=stream)
+    if isinstance(response, str):
+        return response
+    return "".join([chunk async for chunk in response])
+
+
+async def test_server_errors_are_retried(start_mock: StartMock) -> None:
+    server = await start_mock(
+        MockSettings(ttft=0.01, tokens_per_second=2000, tokens=20, error_rate=0.5, seed=1)
+    )
+    service = create_service(server, max_retries=10)
+
+    replies = [await read_all(service) for _ in range(4)]
+    replies.append(await read_all(service, stream=False))
+
+    assert all(reply == "".join(server.reply) for reply in replies)
+    assert server.requests > 5
+
+
+async def test_client_errors_are_not_retried(start_mock: StartMock) -> None:
+    server = await start_mock(MockSettings(ttft=0.01, error_rate=1.0, error_status=400))
+    service = create_service(server)
+
+    with pytest.raises(BadRequestError):
+        await read_all(service)
+
+    assert server.requests == 1
+
+
+async def test_first_token_timeout_retries_and_frees_the_slot(start_mock: StartMock) -> None:
+    server = await start_mock(MockSettings(ttft=5.0, tokens=20))
+    service = create_service(server, first_token_timeout=0.05, max_retries=5)
+
+    with pytest.raises(TimeoutError):
+        await read_all(service)
+
+    assert server.requests == 6
+    assert in_flight(service) == 0
+
+
+async def test_connect_timeout_applies_to_opening_the_stream(start_mock: StartMock) -> None:
+    inner = UnresponsiveService(await start_mock(MockSettings()))
+    service = ResilientService(
+        inner,
+        RetryPolicy(connect_timeout=0.05, first_token_timeout=10, max_retries=2, base_delay=0.01),
+    )
+    start = time.monotonic()
+
+    with pytest.raises(TimeoutError):
+        await read_all(service)
+
+    assert time.monotonic() - start < 1
+    assert inner.attempts == 3
+    assert inner.scheduler.concurrency("Local").in_flight == 0
+
+
+async def test_a_slow_first_token_isnt_a_connect_timeout(start_mock: StartMock) -> None:
+    # The mock sends the response headers at once and the tokens later
+    server = await start_mock(MockSettings(ttft=0.3, tokens_per_second=2000, tokens=20))
+    service = create_service(server, connect_timeout=0.05, first_token_timeout=5)
+
+    assert await read_all(service) == "".join(server.reply)
+    assert server.requests == 1
+
+
+async def test_waiting_for_a_slot_isnt_a_first_token_timeout(start_mock: StartMock) -> None:
+    server = await start_mock(MockSettings(ttft=0.01, tokens_per_second=50, tokens=15))
+    service = create_service(server, first_token_timeout=0.1, max_retries=0)
+    inner = service.inner
+    assert isinstance(inner, OpenAICompatService)
+    concurrency = inner.scheduler.concurrency("Local")
+    concurrency.limit = concurrency.maximum = 1
+
+    replies = await asyncio.gather(read_all(service), read_all(service))
+
+    assert replies == ["".join(server.reply)] * 2
+    assert server.requests == 2
+
+
+async def test_rate_limits_are_only_retried_by_the_scheduler(start_mock: StartMock) -> None:
+    server = await start_mock(MockSettings(ttft=0.01, error_rate=1.0, error_status=429))
+    service = create_service(server)
+    clock = FakeClock()
+    inner = service.inner
+    assert isinstance(inner, OpenAICompatService)
+    inner.scheduler = RequestScheduler(max_retries=2, clock=clock, sleep=clock.sleep)
+
+    with pytest.raises(RateLimitError):
+        await read_all(service)
+    with pytest.raises(RateLimitError):
+        await read_all(service, stream=False)
+
+    assert server.requests == 6
@@ -0,0 +1,85 @@
+"""The router against mock provider servers."""
+
+import asyncio
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+
+from benchmarks.mock_server import MockSettings
+from cliai.config import ModelConfig, Provider
+from cliai.services import get_service_for_model, scheduler
+from cliai.services.base import Message, Role
+from cliai.services.metrics import RequestMetrics, RequestTiming, current_timing
+from cliai.services.router import RouterService, RoutingStats
+from tests.conftest import StartMock, mock_model
+
+pytestmark = pytest.mark.anyio
+
+AUTO = ModelConfig(id="auto", name="Auto", provider=Provider.AUTO, max_tokens=0, description="")
+
+
+@pytest.fixture
+async def router(
+    start_mock: StartMock, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> RouterService:
+    """Route between a cheap model with a small context window and a dear, large one."""
+    monkeypatch.setattr(scheduler, "_scheduler", None)
+    settings = MockSettings(ttft=0.05, tokens_per_second=2000, tokens=20)
+    small = await start_mock(settings)
+    large = await start_mock(replace(settings, tokens=30))
+    candidates = [
+        replace(mock_model(small), id="small", context_window=200, output_price=1.0),
+        replace(mock_model(large), id="large", context_window=10_000, output_price=100.0),
+    ]
+    return RouterService(
+        AUTO, get_service_for_model, RoutingStats(tmp_path / "routing.json"), candidates
+    )
+
+
+async def ask(router: RouterService, prompt: str) -> RequestTiming:
+    """Stream a reply through the router and get the timing of the request."""
+    timing = RequestTiming()
+    token = current_timing.set(timing)
+    try:
+        response = await router.generate_response([Message(role=Role.USER, content=prompt)])
+    finally:
+        current_timing.reset(token)
+    assert not isinstance(response, str)
+    async for _ in response:
+        await asyncio.sleep(0)
+    return timing
+
+
+async def test_concurrent_requests_report_their_own_model_and_usage(
+    router: RouterService,
+) -> None:
+    try:
+        short_prompt, long_prompt = "Hi", "Hello " * 200
+        alone = [await ask(router, short_prompt), await ask(router, long_prompt)]
+
+        together = await asyncio.gather(ask(router, short_prompt), ask(router, long_prompt))
+    finally:
+        await router.close()
+
+    for timing in alone + list(together):
+        assert timing.model is not None and timing.usage is not None
+        assert timing.connected is not None
+    assert [timing.model.id for timing in together] == ["small", "large"]
+    assert [timing.usage for timing in together] == [timing.usage for timing in alone]
+    assert together[0].usage.output_tokens == 20
+    assert together[1].usage.output_tokens == 30
+
+
+async def test_stats_are_saved_once_for_a_burst_of_requests(tmp_path: Path) -> None:
+    path = tmp_path / "routing.json"
+    stats = RoutingStats(path)
+
+    for n in range(5):
+        stats.record(
+            RequestMetrics("small", "Local", timestamp=n, stream=True, time_to_first_token=0.5)
+        )
+    assert not path.exists()
+    await stats.flush()
+
+    assert RoutingStats(path).get("small").samples == 5
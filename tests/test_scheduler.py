@@ -0,0 +1,169 @@
+"""The request scheduler against the mock provider server."""
+
+import asyncio
+from pathlib import Path
+from typing import Any
+
+import pytest
+from openai import AsyncOpenAI, RateLimitError
+
+from benchmarks.mock_server import MockSettings
+from cliai.config import models
+from cliai.services import scheduler as scheduler_module
+from cliai.services.scheduler import RateLimits, RequestScheduler, get_scheduler
+from tests.conftest import MockClient, StartMock
+
+pytestmark = pytest.mark.anyio
+
+FAST = MockSettings(ttft=0.01, tokens_per_second=2000, tokens=20)
+
+
+class FakeClock:
+    """A clock whose sleeps record the delay and move time on at once."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.delays: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        self.delays.append(delay)
+        self.now += delay
+        await asyncio.sleep(0)
+
+
+def open_stream(client: AsyncOpenAI) -> Any:
+    """Get a function that opens a streamed chat completion at the mock."""
+    return lambda: client.chat.completions.create(
+        model="mock", messages=[{"role": "user", "content": "Hi"}], stream=True
+    )
+
+
+async def read_all(scheduler: RequestScheduler, request: Any) -> int:
+    """Stream a reply through the scheduler and count its chunks."""
+    return len([chunk async for chunk in scheduler.stream("Local", "mock", request)])
+
+
+async def test_streams_are_limited_to_the_concurrency_limit(
+    start_mock: StartMock, mock_client: MockClient
+) -> None:
+    server = await start_mock(MockSettings(ttft=0.05, tokens_per_second=2000, tokens=20))
+    scheduler = RequestScheduler()
+    concurrency = scheduler.concurrency("Local")
+    concurrency.limit = concurrency.maximum = 2
+    request = open_stream(mock_client(server))
+    most_in_flight = 0
+
+    async def tracked_request() -> Any:
+        nonlocal most_in_flight
+        most_in_flight = max(most_in_flight, concurrency.in_flight)
+        return await request()
+
+    counts = await asyncio.gather(*(read_all(scheduler, tracked_request) for _ in range(8)))
+
+    assert all(count > 0 for count in counts)
+    assert server.requests == 8
+    assert most_in_flight == 2
+    assert concurrency.in_flight == 0
+
+
+async def test_rate_limited_requests_back_off_and_give_up(
+    start_mock: StartMock, mock_client: MockClient
+) -> None:
+    server = await start_mock(MockSettings(ttft=0.01, error_rate=1.0, error_status=429))
+    clock = FakeClock()
+    scheduler = RequestScheduler(max_retries=3, base_delay=1.0, clock=clock, sleep=clock.sleep)
+
+    with pytest.raises(RateLimitError):
+        await read_all(scheduler, open_stream(mock_client(server)))
+
+    assert server.requests == 4
+    # Jittered exponential backoff: 0.5-1, 1-2, 2-4 seconds
+    assert len(clock.delays) == 3
+    for attempt, delay in enumerate(clock.delays):
+        assert 2**attempt / 2 <= delay <= 2**attempt
+    assert scheduler.concurrency("Local").limit < 4
+    assert scheduler.concurrency("Local").in_flight == 0
+
+
+async def test_rate_limited_requests_are_retried(
+    start_mock: StartMock, mock_client: MockClient
+) -> None:
+    server = await start_mock(
+        MockSettings(ttft=0.01, tokens_per_second=2000, tokens=20, error_rate=0.5, error_status=429)
+    )
+    clock = FakeClock()
+    scheduler = RequestScheduler(clock=clock, sleep=clock.sleep)
+
+    counts = [await read_all(scheduler, open_stream(mock_client(server))) for _ in range(5)]
+
+    assert all(count > 0 for count in counts)
+    assert server.requests > 5
+
+
+async def test_cancelling_while_the_stream_opens_frees_the_slot(
+    start_mock: StartMock, mock_client: MockClient
+) -> None:
+    server = await start_mock(FAST)
+    scheduler = RequestScheduler()
+    concurrency = scheduler.concurrency("Local")
+
+    async def hanging_request() -> Any:
+        # A provider that never answers
+        await asyncio.Event().wait()
+
+    for _ in range(int(concurrency.limit) + 2):
+        with pytest.raises(TimeoutError):
+            await asyncio.wait_for(read_all(scheduler, hanging_request), 0.01)
+
+    assert concurrency.in_flight == 0
+    assert await asyncio.wait_for(read_all(scheduler, open_stream(mock_client(server))), 5) > 0
+
+
+async def test_closing_a_stream_early_frees_the_slot(
+    start_mock: StartMock, mock_client: MockClient
+) -> None:
+    server = await start_mock(MockSettings(ttft=0.01, tokens_per_second=100, tokens=100))
+    scheduler = RequestScheduler()
+    concurrency = scheduler.concurrency("Local")
+
+    for _ in range(int(concurrency.limit) + 2):
+        stream = scheduler.stream("Local", "mock", open_stream(mock_client(server)))
+        await stream.__anext__()
+        await stream.aclose()
+
+    assert concurrency.in_flight == 0
+
+
+async def test_model_limits_from_the_models_file_throttle_requests(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    models_file = tmp_path / "models.toml"
+    models_file.write_text(
+        '[[models]]\nid = "limited"\nbase_url = "http://localhost:8000/v1"\n'
+        "requests_per_minute = 2\n"
+    )
+    monkeypatch.setenv("CLIAI_MODELS_FILE", str(models_file))
+    monkeypatch.delenv("CLIAI_LOCAL_RPM", raising=False)
+    monkeypatch.delenv("CLIAI_LOCAL_TPM", raising=False)
+    monkeypatch.setattr(models, "AVAILABLE_MODELS", list(models.AVAILABLE_MODELS))
+    monkeypatch.setattr(models, "_configured_models_added", False)
+    monkeypatch.setattr(scheduler_module, "_scheduler", None)
+
+    limits = get_scheduler().limits
+    clock = FakeClock()
+    scheduler = RequestScheduler(limits, clock=clock, sleep=clock.sleep)
+
+    async def request() -> str:
+        return "ok"
+
+    for _ in range(3):
+        await scheduler.call("Local", "other", request)
+    assert clock.delays == []
+
+    for _ in range(3):
+        await scheduler.call("Local", "limited", request)
+    assert limits["limited"] == RateLimits(2, None)
+    assert clock.delays == [pytest.approx(30)]
@@ -0,0 +1,57 @@
+"""Incremental Markdown rendering of streamed replies."""
+
+import io
+import time
+
+import pytest
+from rich.console import Console
+
+from cliai.ui.streaming import StreamingMarkdown
+
+REPLY = (
+    "# Title\n\nSome text\ncontinued.\n\n- item\n  more\n\n"
+    "```python\nx = 1\n\ny = 2\n```\n\n~~~\nraw\n~~~\nAfter the fence\n"
+)
+
+
+def render(markdown: StreamingMarkdown) -> str:
+    console = Console(file=io.StringIO(), width=60, color_system=None)
+    console.print(markdown)
+    return console.file.getvalue()  # type: ignore[attr-defined]
+
+
+def stream(text: str, size: int, max_lines: int | None = None) -> StreamingMarkdown:
+    markdown = StreamingMarkdown(max_lines)
+    for start in range(0, len(text), size):
+        markdown.append(text[start : start + size])
+    return markdown
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_chunking_doesnt_change_the_blocks(size: int) -> None:
+    markdown = stream(REPLY, size)
+
+    assert [block.source for block in markdown._frozen] == [
+        "# Title",
+        "Some text\ncontinued.",
+        "- item\n  more",
+        "```python\nx = 1\n\ny = 2\n```",
+    ]
+    assert render(markdown) == render(stream(REPLY, len(REPLY)))
+
+
+def test_a_long_code_block_is_cut_to_the_last_lines() -> None:
+    markdown = stream("Intro\n```\n" + "".join(f"line {n}\n" for n in range(100)) + "end", 5, 4)
+
+    assert markdown._open_source() == "```\nline 97\nline 98\nline 99\nend"
+
+
+def test_appending_to_a_huge_open_block_takes_linear_time() -> None:
+    code = "".join(f"value_{n} = compute({n}, {n * 2})\n" for n in range(80_000))
+    start = time.monotonic()
+
+    markdown = stream("```\n" + code, 35, 40)
+    render(markdown)
+
+    assert time.monotonic() - start < 2
+    assert render(markdown).count("\n") == 40
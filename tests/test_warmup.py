@@ -0,0 +1,72 @@
+"""Billed warmup requests against the mock provider server."""
+
+from pathlib import Path
+
+import pytest
+
+from benchmarks.mock_server import MockSettings
+from cliai.config import ModelConfig, Provider
+from cliai.services import scheduler
+from cliai.services.anthropic_service import AnthropicService
+from cliai.services.base import Message, Role
+from cliai.services.metrics import (
+    InstrumentedService,
+    RequestMetrics,
+    RequestTiming,
+    current_timing,
+)
+from cliai.services.router import RoutingStats
+from tests.conftest import StartMock
+
+pytestmark = pytest.mark.anyio
+
+CLAUDE = ModelConfig(
+    id="claude-mock", name="Claude", provider=Provider.ANTHROPIC, max_tokens=100, description=""
+)
+
+
+async def warm_up(
+    start_mock: StartMock, monkeypatch: pytest.MonkeyPatch, tmp_path: Path, content: str
+) -> tuple[list[RequestMetrics], InstrumentedService, RoutingStats, RequestTiming]:
+    """Warm up Claude through an instrumented service that records the metrics."""
+    server = await start_mock(MockSettings(ttft=0.01, tokens=1))
+    monkeypatch.setattr(scheduler, "_scheduler", None)
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", server.environment["ANTHROPIC_BASE_URL"])
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "mock")
+    recorded: list[RequestMetrics] = []
+    stats = RoutingStats(tmp_path / "routing.json")
+    service = InstrumentedService(AnthropicService(CLAUDE), [recorded.append, stats.record])
+
+    timing = RequestTiming()
+    token = current_timing.set(timing)
+    try:
+        await service.warmup([Message(role=Role.USER, content=content)])
+    finally:
+        current_timing.reset(token)
+    return recorded, service, stats, timing
+
+
+async def test_priming_the_prompt_cache_is_recorded(
+    start_mock: StartMock, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    recorded, service, stats, timing = await warm_up(
+        start_mock, monkeypatch, tmp_path, "Long conversation " * 500
+    )
+
+    assert len(recorded) == 1
+    metrics = recorded[0]
+    assert metrics.warmup and metrics.error is None
+    assert metrics.input_tokens and metrics.output_tokens == 1
+    assert timing.usage is not None and timing.usage.output_tokens == 1
+    # It isn't the answer to show stats for, nor a request to route by
+    assert service.last_metrics is None
+    assert stats.models == {}
+
+
+async def test_a_connection_warmup_is_not_recorded(
+    start_mock: StartMock, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    recorded, _, _, timing = await warm_up(start_mock, monkeypatch, tmp_path, "Hi")
+
+    assert recorded == []
+    assert timing.usage is None